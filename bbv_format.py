@@ -0,0 +1,172 @@
+import argparse
+import os
+import struct
+import sys
+from array import array
+
+# Binary basic block vectors, one sparse vector per segment stored CSR style:
+#   header | ids of every segment | counts of every segment | segment offsets
+# offsets[i]:offsets[i + 1] are the entries of segment i. Everything is little endian, each
+# section starts 8 byte aligned so it can be memory mapped with numpy, see load_bbv.
+# SimPoint reads text (T:id:count :id:count ...), convert with to_text right before clustering.
+
+bbv_magic = b"BBVCSR\0\0"
+bbv_version = 1
+
+# magic, version, id size in bytes, segments, entries, ids offset, counts offset, offsets offset
+header_format = "<8sIIQQQQQ"
+header_size = struct.calcsize(header_format)
+
+# entries buffered by BBVWriter before they are written out
+write_batch_entries = 1 << 20
+
+def aligned(offset):
+    return (offset + 7) & ~7
+
+class BBVWriter:
+    # Streams segments into a binary bbv file. Ids go straight to the file, counts to a side
+    # file that is appended on close, so only the segment offsets are held in memory
+    def __init__(self, path, wide_ids = False):
+        self.path = path
+        self.id_size = 8 if wide_ids else 4
+        self.offsets = array("Q", [0])
+        self.ids = array("Q" if wide_ids else "I")
+        self.counts = array("Q")
+        self.file = open(path, "wb")
+        self.counts_file = open(path + ".counts.tmp", "wb")
+        self.file.write(b"\0" * header_size)
+
+    def add_segment(self, ids, counts):
+        assert len(ids) == len(counts), "segment has {} ids and {} counts".format(len(ids), len(counts))
+        self.ids.extend(ids)
+        self.counts.extend(counts)
+        self.offsets.append(self.offsets[-1] + len(ids))
+
+        if len(self.ids) >= write_batch_entries:
+            self.flush()
+
+    def flush(self):
+        self.ids.tofile(self.file)
+        self.counts.tofile(self.counts_file)
+        del self.ids[:]
+        del self.counts[:]
+
+    def close(self):
+        self.flush()
+        self.counts_file.close()
+
+        entries = self.offsets[-1]
+        ids_offset = header_size
+        counts_offset = aligned(ids_offset + entries * self.id_size)
+        offsets_offset = counts_offset + entries * 8
+
+        self.file.write(b"\0" * (counts_offset - ids_offset - entries * self.id_size))
+        with open(self.path + ".counts.tmp", "rb") as counts:
+            while True:
+                chunk = counts.read(1 << 24)
+                if not chunk:
+                    break
+                self.file.write(chunk)
+        os.remove(self.path + ".counts.tmp")
+        self.offsets.tofile(self.file)
+
+        self.file.seek(0)
+        self.file.write(struct.pack(header_format, bbv_magic, bbv_version, self.id_size, len(self.offsets) - 1,
+                                    entries, ids_offset, counts_offset, offsets_offset))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type == None:
+            self.close()
+        else:
+            # a partial file is worse than none
+            self.file.close()
+            self.counts_file.close()
+            for path in [self.path, self.path + ".counts.tmp"]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+def read_header(f):
+    magic, version, id_size, segments, entries, ids_offset, counts_offset, offsets_offset = \
+        struct.unpack(header_format, f.read(header_size))
+    if magic != bbv_magic or version != bbv_version:
+        print("ERR: {} is not a version {} binary bbv file".format(f.name, bbv_version))
+        exit(1)
+    return id_size, segments, entries, ids_offset, counts_offset, offsets_offset
+
+def read_segments(path, batch_segments = 4096):
+    # (ids, counts) arrays of every segment in order, without numpy
+    with open(path, "rb") as f:
+        id_size, segments, entries, ids_offset, counts_offset, offsets_offset = read_header(f)
+
+        offsets = array("Q")
+        f.seek(offsets_offset)
+        offsets.fromfile(f, segments + 1)
+
+        for start in range(0, segments, batch_segments):
+            end = min(start + batch_segments, segments)
+            first, last = offsets[start], offsets[end]
+
+            ids = array("Q" if id_size == 8 else "I")
+            counts = array("Q")
+            f.seek(ids_offset + first * id_size)
+            ids.fromfile(f, last - first)
+            f.seek(counts_offset + first * 8)
+            counts.fromfile(f, last - first)
+
+            for segment in range(start, end):
+                begin, stop = offsets[segment] - first, offsets[segment + 1] - first
+                yield ids[begin:stop], counts[begin:stop]
+
+def load_bbv(path):
+    # (offsets, ids, counts) numpy arrays memory mapped from a binary bbv file, for analysis and plotting.
+    # Segment i is ids[offsets[i]:offsets[i + 1]], counts[offsets[i]:offsets[i + 1]]
+    import numpy as np
+
+    with open(path, "rb") as f:
+        id_size, segments, entries, ids_offset, counts_offset, offsets_offset = read_header(f)
+
+    offsets = np.memmap(path, dtype="<u8", mode="r", offset=offsets_offset, shape=(segments + 1,))
+    if entries == 0:
+        return offsets, np.zeros(0, dtype="<u{}".format(id_size)), np.zeros(0, dtype="<u8")
+
+    ids = np.memmap(path, dtype="<u{}".format(id_size), mode="r", offset=ids_offset, shape=(entries,))
+    counts = np.memmap(path, dtype="<u8", mode="r", offset=counts_offset, shape=(entries,))
+    return offsets, ids, counts
+
+def from_text(text_path, bin_path, wide_ids = False):
+    # SimPoint text fingerprints (T:id:count :id:count ... per line) to a binary bbv file
+    with open(text_path, "r") as text, BBVWriter(bin_path, wide_ids) as writer:
+        for line in text:
+            tokens = line[line.find(":"):].replace(":", " ").split()
+            writer.add_segment([int(token) for token in tokens[0::2]], [int(token) for token in tokens[1::2]])
+
+def to_text(bin_path, text_path):
+    # binary bbv file to the text fingerprints SimPoint reads with -loadFVFile
+    with open(text_path, "w", buffering=1 << 20) as text:
+        for ids, counts in read_segments(bin_path):
+            text.write("T" + " ".join([":{}:{}".format(bb_id, count) for bb_id, count in zip(ids, counts)]) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert basic block vectors between the SimPoint text format and the binary CSR format')
+    parser.add_argument('command', choices=['to_text', 'from_text', 'info'], help='to_text <bin> <text>, from_text <text> <bin> or info <bin>')
+    parser.add_argument('input', help='File to read')
+    parser.add_argument('output', nargs='?', help='File to write')
+    parser.add_argument('--wide_ids', action='store_true', help='from_text: store ids as 64 bits, for unconverted bb addresses')
+    args = parser.parse_args()
+
+    if args.command != 'info' and args.output == None:
+        print("ERR: {} needs an output file".format(args.command))
+        sys.exit(1)
+
+    if args.command == 'to_text':
+        to_text(args.input, args.output)
+    elif args.command == 'from_text':
+        from_text(args.input, args.output, args.wide_ids)
+    else:
+        with open(args.input, "rb") as f:
+            id_size, segments, entries, _, _, _ = read_header(f)
+        print("{}: {} segments, {} entries, {} byte ids".format(args.input, segments, entries, id_size))
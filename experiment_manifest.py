@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+# Status of every simulation job of an experiment, one per (workload, config, cluster), so a rerun only
+# launches the simpoints that are missing or failed instead of every simpoint of a config.
+#
+# <sim_root>/<experiment>.manifest.json holds for every job its inputs (params, architecture, segment),
+# status (missing, done or failed), exit code and the stat files it wrote. Exit codes come from the
+# status files job_scheduler.py writes for each config. A job whose inputs changed is rerun.
+
+# a simulation is complete once scarab wrote this stat file, as checked before per config
+completion_file = "memory.stat.0.csv"
+
+# status file of the simulations of a config, written by run_scarab_mode_4*.sh
+job_status_file = "simulations.status"
+
+def manifest_path(sim_root, experiment):
+    return os.path.join(sim_root, experiment + ".manifest.json")
+
+def is_allbench(application_name):
+    return application_name in ["allbench", "isca2024"]
+
+def simpoints_dir(application_name, workload):
+    if is_allbench(application_name):
+        return '/simpoint_traces/' + workload + '/simpoints/'
+    return str(os.getenv('HOME')) + '/simpoint_flow/' + application_name + '/simpoints/'
+
+def simulation_dir(application_name, workload, experiment, config_key, mode = '4'):
+    # directory run_scarab.sh / run_scarab_allbench.sh write the simulations of a config to
+    if mode == '5':
+        return str(os.getenv('HOME')) + '/nonsimpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
+    if is_allbench(application_name):
+        return str(os.getenv('HOME')) + '/simpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
+    return str(os.getenv('HOME')) + '/simpoint_flow/' + application_name + '/simulations/' + experiment + '/' + config_key
+
+def read_clusters(sp_dir):
+    # (cluster id, segment id) of every simpoint, as the run scripts read opt.p.lpt0.99
+    clusters = []
+    with open(sp_dir + "/opt.p.lpt0.99", "r") as f:
+        for line in f:
+            if line.strip():
+                seg_id, c_id = line.split()[:2]
+                clusters.append((int(c_id), int(seg_id)))
+    return clusters
+
+def read_job_status(status_file):
+    # job name -> (state, exit code) of a job_scheduler.py status file, empty if there is none
+    status = {}
+    if not os.path.exists(status_file):
+        return status
+    with open(status_file, "r") as f:
+        next(f, None)
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 3:
+                status[fields[0]] = (fields[1], int(fields[2]) if fields[2] not in ["", "None"] else None)
+    return status
+
+class Manifest:
+    def __init__(self, path, experiment):
+        self.path = path
+        self.data = {"experiment": experiment, "jobs": {}}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = json.load(f)
+
+    def key(self, workload, config_key, cluster):
+        return "/".join([workload, config_key, str(cluster)])
+
+    def job(self, workload, config_key, cluster):
+        return self.data["jobs"].get(self.key(workload, config_key, cluster))
+
+    def update(self, workload, config_key, cluster, directory, inputs, exit_code = None):
+        # refreshes the status of a job from its directory, and exit_code or the scheduler status if known
+        key = self.key(workload, config_key, cluster)
+        job = self.data["jobs"].get(key)
+        if job == None or job["inputs"] != inputs:
+            # new job, or its inputs changed: outputs written before now don't count
+            job = {"workload": workload, "config": config_key, "cluster": cluster, "directory": directory,
+                   "inputs": inputs, "since": 0 if job == None else time.time(),
+                   "status": "missing", "exit_code": None, "outputs": []}
+            self.data["jobs"][key] = job
+
+        if exit_code == None and cluster != "-":
+            state, exit_code = read_job_status(os.path.join(os.path.dirname(directory), job_status_file)).get("cluster_" + str(cluster), (None, None))
+            if state in [None, "queued", "running"]:
+                exit_code = job["exit_code"]
+        job["exit_code"] = exit_code
+
+        completion = os.path.join(directory, completion_file)
+        complete = os.path.exists(completion) and os.path.getmtime(completion) >= job["since"]
+        job["outputs"] = sorted(file for file in os.listdir(directory) if file.endswith(".stat.0.csv")) if os.path.isdir(directory) else []
+
+        if exit_code not in [None, 0]:
+            job["status"] = "failed"
+        elif complete:
+            job["status"] = "done"
+        else:
+            job["status"] = "missing"
+        return job
+
+    def save(self):
+        tmp = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def incomplete(self, workload, config_key):
+        # jobs of a config that are not done
+        return [job for job in self.data["jobs"].values()
+                if job["workload"] == workload and job["config"] == config_key and job["status"] != "done"]
@@ -2,6 +2,14 @@ import csv
 import os, sys
 import json
 import argparse
+import numpy as np
+import pandas as pd
+
+# columns of per_line_icache_line_info.csv that are aggregated, in output order
+line_stats = ["useful_cnt", "unuseful_cnt", "prefetch_cnt", "new_prefetch_cnt", "icache_hit", "icache_miss"]
+
+# rows written per chunk of the output csv
+write_chunk_rows = 1 << 16
 
 def read_descriptor_from_json(descriptor_filename):
     # Read the descriptor data from a JSON file
@@ -23,8 +31,9 @@ class Simpoint:
         self.sim_dir = sim_dir
         # some times the cluster ids by simpoint are not consecutive
         self.c_id = c_id
-        # paralell with stat groups
-        self.w_stat_vals = {}
+        # weighted stats of every cache line, see read_simpoint_lines
+        self.cl_addrs = None
+        self.w_stat_vals = None
 
 def read_simpoints(sp_dir, sim_root_dir, whole_sim = False):
     total_weight = 0
@@ -47,43 +56,127 @@ def read_simpoints(sp_dir, sim_root_dir, whole_sim = False):
 
     return simpoints
 
-def read_simpoint_csv_stats(simpoints):
-    for simp in simpoints:
-        with open(simp.sim_dir + "/per_line_icache_line_info.csv", 'r') as file:
-            csv_reader = csv.DictReader(file)
-            simp.w_stat_vals = {row.pop('cl_addr'): row for row in csv_reader}
-            for cl_addr in simp.w_stat_vals.keys():
-                for key in simp.w_stat_vals[cl_addr].keys():
-                    simp.w_stat_vals[cl_addr][key] = simp.weight * float(simp.w_stat_vals[cl_addr][key])
-
-def calculate_weighted_average(simpoints):
-    weighted_avg_stats = {}
+# value of every digit character, 255 for the others
+digit_values = np.full(256, 255, dtype=np.uint8)
+for i, c in enumerate("0123456789abcdef"):
+    digit_values[ord(c)] = i
+    digit_values[ord(c.upper())] = i
+
+# most digits a uint64 is computed with over the arrays, longer addresses go through int
+max_digits = {16: 16, 10: 19}
+
+def parse_addresses(cl_addrs, base = None):
+    # uint64 of every cl_addr string, a character position at a time over all of them. In base if given,
+    # otherwise each is read on its own: hex with a 0x prefix or hex letters, decimal otherwise
+    if len(cl_addrs) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    strings = np.array(cl_addrs.tolist(), dtype="S")
+    chars = strings.view(np.uint8).reshape(len(strings), strings.itemsize)
+    padding = chars == 0
+    digits = digit_values[chars]
+
+    # the 0x prefix reads as two zeros
+    prefixed = np.zeros(len(chars), dtype=bool)
+    if chars.shape[1] > 1:
+        prefixed = (chars[:, 0] == ord("0")) & (chars[:, 1] | 0x20 == ord("x"))
+        digits[prefixed, 1] = 0
+    digits[padding] = 0
+
+    if base == None:
+        hex_digits = prefixed | (digits >= 10).any(axis=1)
+    else:
+        hex_digits = np.full(len(chars), base == 16)
+    bad = (digits == 255).any(axis=1) | (~hex_digits & (digits >= 10).any(axis=1))
+    if bad.any():
+        raise ValueError("cl_addr is not a number: {}".format(cl_addrs[bad].iloc[0]))
+
+    # digits after the leading zeros
+    nonzero = digits != 0
+    lengths = np.where(nonzero.any(axis=1), (~padding).sum(axis=1) - nonzero.argmax(axis=1), 0)
+    wide = lengths > np.where(hex_digits, max_digits[16], max_digits[10])
+
+    radix = np.where(hex_digits, 16, 10).astype(np.uint64)
+    values = np.zeros(len(chars), dtype=np.uint64)
+    for i in range(chars.shape[1]):
+        # padding after the end of a string leaves it as it is
+        values = np.where(padding[:, i], values, values * radix + digits[:, i])
+    if wide.any():
+        values[wide] = [int(cl_addr, 16 if h else 10) for cl_addr, h in zip(cl_addrs[wide], hex_digits[wide])]
+    return values
+
+def read_simpoint_lines(simp, base = None):
+    # read one simpoint into sorted unique uint64 cl_addrs, (lines, stats) weighted values, the
+    # cl_addr string of each line as written and the rank of each line in the file.
+    # Later rows of a duplicated cl_addr win, as with a dict
+    df = pd.read_csv(simp.sim_dir + "/per_line_icache_line_info.csv", usecols=["cl_addr"] + line_stats,
+                     dtype={"cl_addr": str}, skipinitialspace=True)
+
+    cl_addrs = parse_addresses(df["cl_addr"], base)
+    values = df[line_stats].to_numpy(dtype=np.float64)
+
+    unique, first = np.unique(cl_addrs, return_index=True)
+    _, last_reversed = np.unique(cl_addrs[::-1], return_index=True)
+    last = len(cl_addrs) - 1 - last_reversed
+
+    simp.cl_addrs = unique
+    simp.w_stat_vals = simp.weight * values[last]
+    return df["cl_addr"].to_numpy(dtype=object)[first], first
+
+def calculate_weighted_average(simpoints, base = None):
+    # merge simpoints one at a time into sorted cl_addrs with summed weighted stats.
+    # order holds when each line was first seen, to write lines in the order the old dict merge did,
+    # and names the cl_addr string it was first seen as, written back unchanged.
+    # only one simpoint is held in memory besides the merged lines
+    cl_addrs = np.zeros(0, dtype=np.uint64)
+    sums = np.zeros((0, len(line_stats)))
+    order = np.zeros(0, dtype=np.int64)
+    names = np.zeros(0, dtype=object)
+    seen = 0
+
     for simp in simpoints:
-        for cl_addr in simp.w_stat_vals.keys():
-            if cl_addr in weighted_avg_stats.keys():
-                for key in simp.w_stat_vals[cl_addr].keys():
-                    weighted_avg_stats[cl_addr][key] += simp.w_stat_vals[cl_addr][key]
-            else:
-                weighted_avg_stats[cl_addr] = simp.w_stat_vals[cl_addr]
-    return weighted_avg_stats
+        simp_names, first = read_simpoint_lines(simp, base)
+
+        pos = np.searchsorted(cl_addrs, simp.cl_addrs)
+        found = pos < len(cl_addrs)
+        found[found] = cl_addrs[pos[found]] == simp.cl_addrs[found]
+        sums[pos[found]] += simp.w_stat_vals[found]
+
+        new = ~found
+        new_order = seen + np.argsort(np.argsort(first[new], kind="stable"), kind="stable")
+        seen += int(new.sum())
+
+        cl_addrs = np.concatenate([cl_addrs, simp.cl_addrs[new]])
+        sums = np.concatenate([sums, simp.w_stat_vals[new]])
+        order = np.concatenate([order, new_order])
+        names = np.concatenate([names, simp_names[new]])
+
+        merged = np.argsort(cl_addrs, kind="stable")
+        cl_addrs, sums, order, names = cl_addrs[merged], sums[merged], order[merged], names[merged]
+
+        # the simpoint's lines are merged, free them
+        simp.cl_addrs = None
+        simp.w_stat_vals = None
+
+    return cl_addrs, sums, order, names
 
 def report(weighted_avg_stats, sim_path):
-    unique_useful_lines = 0
-    unique_unuseful_lines = 0
+    cl_addrs, sums, order, names = weighted_avg_stats
+    by_first_seen = np.argsort(order, kind="stable")
+
     with open(sim_path + "/per_line_icache_line_info.csv", 'w') as outfile:
         writer = csv.writer(outfile)
-        writer.writerow(["cl_addr", "useful_cnt", "unuseful_cnt", "prefetch_cnt", "new_prefetch_cnt", "icache_hit", "icache_miss"])
-        for cl_addr in weighted_avg_stats.keys():
-            writer.writerow([cl_addr, weighted_avg_stats[cl_addr]["useful_cnt"], weighted_avg_stats[cl_addr]["unuseful_cnt"], weighted_avg_stats[cl_addr]["prefetch_cnt"], weighted_avg_stats[cl_addr]["new_prefetch_cnt"], weighted_avg_stats[cl_addr]["icache_hit"], weighted_avg_stats[cl_addr]["icache_miss"]])
-            if weighted_avg_stats[cl_addr]["useful_cnt"] != 0:
-                unique_useful_lines += 1
-            if weighted_avg_stats[cl_addr]["unuseful_cnt"] != 0:
-                unique_unuseful_lines += 1
+        writer.writerow(["cl_addr"] + line_stats)
+        for start in range(0, len(by_first_seen), write_chunk_rows):
+            chunk = by_first_seen[start:start + write_chunk_rows]
+            writer.writerows([cl_addr] + row for cl_addr, row in zip(names[chunk].tolist(), sums[chunk].tolist()))
+
+    unique_useful_lines = int(np.count_nonzero(sums[:, line_stats.index("useful_cnt")]))
+    unique_unuseful_lines = int(np.count_nonzero(sums[:, line_stats.index("unuseful_cnt")]))
 
     with open(sim_path + "/unique_learned_cache_lines.csv", 'w') as outfile:
         writer = csv.writer(outfile)
         writer.writerow(["unique_useful_lines", "unique_unuseful_lines", "unique_leanred_lines"])
-        writer.writerow([unique_useful_lines, unique_unuseful_lines, len(weighted_avg_stats.keys())])
+        writer.writerow([unique_useful_lines, unique_unuseful_lines, len(cl_addrs)])
 
 if __name__ == "__main__":
     # Create a parser for command-line arguments
@@ -91,6 +184,7 @@ if __name__ == "__main__":
     parser.add_argument('-d','--descriptor_name', required=True, help='Experiment descriptor name. Usage: -d exp2.json')
     parser.add_argument('-p','--sim_path', required=True, help='Path to the simulation directory. Usage: -p /soe/<USER>/allbench_home/simpoint_flow/simulations/')
     parser.add_argument('-t','--trace_path', required=True, help='Path to the trace directory for reading simpoints. Usage: -t /soe/hlitz/lab/traces/')
+    parser.add_argument('--cl_addr_base', type=int, choices=[10, 16], help='Base of every cl_addr. By default 0x prefixed addresses and addresses with hex letters are hex, the others decimal')
 
     args = parser.parse_args()
     descriptor_filename = args.descriptor_name
@@ -102,6 +196,5 @@ if __name__ == "__main__":
             simp_path = args.trace_path + '/' + benchmark + '/simpoints/'
             sim_path = args.sim_path + '/' + benchmark + '/' + descriptor_data["experiment"] + '/' + config_key
             simpoints = read_simpoints(simp_path, sim_path)
-            read_simpoint_csv_stats(simpoints)
-            weighted_avg_stats = calculate_weighted_average(simpoints)
+            weighted_avg_stats = calculate_weighted_average(simpoints, args.cl_addr_base)
             report(weighted_avg_stats, sim_path)
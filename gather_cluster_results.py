@@ -1,19 +1,44 @@
 import csv
+import copy
+import json
+import sqlite3
 import os, sys
+from functools import lru_cache
 
-# get the stats of interest
-def get_acc_stat_from_file(file_name, stat_name, stat_pos):
+# split every line of a stat file once, indexed by the stat name in its first column.
+# cached by path, size and mtime, so a file is only read again once it changes
+@lru_cache(maxsize=64)
+def index_stat_file(file_name, size, mtime_ns):
+    index = {}
     with open(file_name, "r") as infile:
-        # bug: might not be the only match
         for line in infile:
             splitLine = line.split()
-            if stat_name in splitLine:
-                if stat_pos == 2 or stat_pos == 4:
-                    val_string = splitLine[stat_pos][:-1]
-                    return float(val_string)
-                else:
-                    val_string = splitLine[stat_pos]
-                    return int(val_string)
+            # first line with the name wins
+            if splitLine and splitLine[0] not in index:
+                index[splitLine[0]] = splitLine
+    return index
+
+def read_stat_file(file_name):
+    st = os.stat(file_name)
+    return index_stat_file(file_name, st.st_size, st.st_mtime_ns)
+
+# get a stat from an indexed stat file, None if it is not there
+def get_acc_stat_from_index(index, stat_name, stat_pos):
+    # only exact stat names match
+    splitLine = index.get(stat_name)
+    if splitLine == None:
+        return None
+
+    if stat_pos == 2 or stat_pos == 4:
+        val_string = splitLine[stat_pos][:-1]
+        return float(val_string)
+    else:
+        val_string = splitLine[stat_pos]
+        return int(val_string)
+
+# get the stats of interest
+def get_acc_stat_from_file(file_name, stat_name, stat_pos):
+    return get_acc_stat_from_index(read_stat_file(file_name), stat_name, stat_pos)
 
 class StatGroup:
     def __init__(self, g_name, f_name, s_list):
@@ -30,6 +55,56 @@ class Stat:
         self.weighted_average = 0
         self.weighted_ratio = 0
 
+# ratio of the weighted totals of two single stat groups, written to its own csv by customized_report
+class DerivedRatio:
+    def __init__(self, file, name, numerator, denominator, zero_if_undefined = False):
+        self.file = file
+        self.name = name
+        self.numerator = numerator
+        self.denominator = denominator
+        # 0 instead of a division error when the denominator is 0
+        self.zero_if_undefined = zero_if_undefined
+
+# stat groups compiled into one lookup list per stat file, so each file is parsed once
+# no matter how many groups read from it
+class StatPlan:
+    def __init__(self, stat_groups):
+        self.stat_groups = stat_groups
+        self.groups = {g.g_name: g for g in stat_groups}
+        # file name -> [(group id, stat id, stat name, stat column)]
+        self.files = {}
+        for g_id, g in enumerate(stat_groups):
+            for s_id, s in enumerate(g.s_list):
+                self.files.setdefault(g.f_name, []).append((g_id, s_id, s.s_name, s.pos))
+
+    # values[group id][stat id] of every stat in sim_dir, suffix is added to every file name
+    def read(self, sim_dir, suffix = ""):
+        values = [[None] * len(g.s_list) for g in self.stat_groups]
+        for f_name, lookups in self.files.items():
+            index = read_stat_file(sim_dir + "/" + f_name + suffix)
+            for g_id, s_id, s_name, pos in lookups:
+                values[g_id][s_id] = get_acc_stat_from_index(index, s_name, pos)
+        return values
+
+# read stat groups and derived ratios from a json spec, see stat_groups.json. Raises ValueError on a bad spec
+def load_stat_groups(spec_path):
+    with open(spec_path, "r") as f:
+        spec = json.load(f)
+
+    groups = [StatGroup(g["name"], g["file"], [Stat(s_name, pos) for s_name, pos in g["stats"]]) for g in spec["groups"]]
+    ratios = [DerivedRatio(r["file"], r["name"], r["numerator"], r["denominator"], r.get("zero_if_undefined", False))
+              for r in spec.get("derived", [])]
+
+    names = [g.g_name for g in groups]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate stat group names in {}".format(spec_path))
+    for r in ratios:
+        for g_name in [r.numerator, r.denominator]:
+            if g_name not in names:
+                raise ValueError("derived ratio {} uses unknown stat group {} in {}".format(r.name, g_name, spec_path))
+
+    return groups, ratios
+
 class Simpoint:
     def __init__(self, seg_id, weight, sim_dir, c_id):
         self.seg_id = seg_id
@@ -42,9 +117,11 @@ class Simpoint:
         self.stat_vals = []
         self.w_stat_vals = []
 
-def read_simpoints(sp_dir, sim_root_dir, use_old_weights, whole_sim = False):
+# (seg_id, weight, c_id) of every simpoint, the same for all configs of a workload.
+# Raises ValueError if the old weights don't add up to 1
+def read_simpoint_weights(sp_dir, use_old_weights):
     total_weight = 0
-    simpoints = []
+    weights = []
 
     # luckily no matter what weights are used,
     # to calculate the weighted average, we always uses multiplication
@@ -60,29 +137,35 @@ def read_simpoints(sp_dir, sim_root_dir, use_old_weights, whole_sim = False):
             c_id = int(line1.split()[1])
             assert(int(line1.split()[1]) == int(line2.split()[1]))
             total_weight += weight
-            if whole_sim == False:
-                simpoints.append(Simpoint(seg_id, weight, sim_root_dir + "/" + str(seg_id), c_id))
-            else:
-                simpoints.append(Simpoint(seg_id, weight, sim_root_dir, c_id))
+            weights.append((seg_id, weight, c_id))
 
     if use_old_weights and abs(total_weight - 1) > 1e-5:
-        print("total weight of SimPoint does not add up to 1? {}".format(total_weight))
-        exit()
-    
+        raise ValueError("total weight of SimPoint does not add up to 1? {}".format(total_weight))
+
+    return weights
+
+# simpoint_weights can be passed in to skip reading them again, see read_simpoint_weights
+def read_simpoints(sp_dir, sim_root_dir, use_old_weights, whole_sim = False, simpoint_weights = None):
+    if simpoint_weights == None:
+        simpoint_weights = read_simpoint_weights(sp_dir, use_old_weights)
+
+    simpoints = []
+    for seg_id, weight, c_id in simpoint_weights:
+        if whole_sim == False:
+            simpoints.append(Simpoint(seg_id, weight, sim_root_dir + "/" + str(seg_id), c_id))
+        else:
+            simpoints.append(Simpoint(seg_id, weight, sim_root_dir, c_id))
+
     return simpoints
 
 def read_simpoint_stats(stat_groups, simpoints, whole_sim = False):
+    # each stat file is read once per simpoint, shared by all groups
+    plan = StatPlan(stat_groups)
     for simp in simpoints:
-        for g in stat_groups:
-            simp.stat_vals.append([])
-            for s in g.s_list:
-                if whole_sim == False:
-                    stat_val = get_acc_stat_from_file(simp.sim_dir + "/" + g.f_name,
-                                                    s.s_name, s.pos)
-                else:
-                    stat_val = get_acc_stat_from_file(simp.sim_dir + "/" + g.f_name + ".period.{}".format(simp.seg_id),
-                                                    s.s_name, s.pos)
-                simp.stat_vals[-1].append(stat_val)
+        if whole_sim == False:
+            simp.stat_vals += plan.read(simp.sim_dir)
+        else:
+            simp.stat_vals += plan.read(simp.sim_dir, ".period.{}".format(simp.seg_id))
 
 def calculate_weighted_average(stat_groups, simpoints):
     for simp in simpoints:
@@ -154,263 +237,119 @@ def report(stat_groups, simpoints, sim_root_dir, use_old_weights):
             # weighted total
             writer.writerow(["weighted_total", g.weighted_total])
 
-def customized_report(stat_groups, simpoints, sim_root_dir, use_old_weights):
+def customized_report(stat_groups, simpoints, sim_root_dir, use_old_weights, ratios = None):
     if use_old_weights:
         csv_old_suffix = ".old"
     else:
         csv_old_suffix = ""
 
-    i = 0
-    for g in stat_groups:
-        if g.g_name == "instructions":
-            # weighted_total is the weighted avg of the stat though
-            i = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
-    c = 0
-    for g in stat_groups:
-        if g.g_name == "cycles":
-            c = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
+    if ratios == None:
+        ratios = derived_ratios
+    groups = StatPlan(stat_groups).groups
+
+    def total(g_name):
+        if g_name not in groups:
+            return 0
+        g = groups[g_name]
+        # weighted_total is the weighted avg of the stat though
+        assert(g.weighted_total == g.s_list[0].weighted_average)
+        return g.weighted_total
+
+    # everything written, for the results store
+    derived = {}
+    for r in ratios:
+        numerator = total(r.numerator)
+        denominator = total(r.denominator)
+        if r.zero_if_undefined and float(denominator) == 0:
+            value = 0.0
+        else:
+            value = float(numerator)/float(denominator)
 
-    with open(sim_root_dir + "/ipc.csv" + csv_old_suffix, "w") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(["instructions", "cycles", "IPC"])
-        writer.writerow([i, c, float(i)/float(c)])
+        with open(sim_root_dir + "/" + r.file + csv_old_suffix, "w") as outfile:
+            writer = csv.writer(outfile)
+            writer.writerow([r.numerator, r.denominator, r.name])
+            writer.writerow([numerator, denominator, value])
 
-    blocks = 0
-    for g in stat_groups:
-        if g.g_name == "fdip_ftq_occupancy_blocks_accumulated":
-            blocks = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
+        derived[r.numerator] = numerator
+        derived[r.denominator] = denominator
+        derived[r.name] = value
 
-    with open(sim_root_dir + "/bpc.csv" + csv_old_suffix, "w") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(["fdip_ftq_occupancy_blocks_accumulated", "cycles", "BPC"])
-        writer.writerow([blocks, c, float(blocks)/float(c)])
+    return derived
 
-    sen_ftqs = 0
-    for g in stat_groups:
-        if g.g_name == "fdip_seniority_ftq_accumulated":
-            sen_ftqs = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
-
-    with open(sim_root_dir + "/sftq.csv" + csv_old_suffix, "w") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(["fdip_seniority_ftq_accumulated", "cycles", "SFTQ"])
-        writer.writerow([sen_ftqs, c, float(sen_ftqs)/float(c)])
-
- 
-    unuseful_cl_cyc = 0
-    for g in stat_groups:
-        if g.g_name == "icache_unuseful_cl_cyc":
-            unuseful_cl_cyc = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
+# rows of every results store table for one gathered simulation directory,
+# without the workload and config columns
+def collect_results(stat_groups, simpoints, derived):
+    results = {"simpoints": [], "stats": [], "weighted": [], "groups": [], "derived": []}
+
+    for simp in simpoints:
+        results["simpoints"].append((simp.seg_id, simp.c_id, simp.weight))
+        for g_id, g in enumerate(stat_groups):
+            for s_id, s in enumerate(g.s_list):
+                results["stats"].append((simp.seg_id, g.g_name, s.s_name, simp.stat_vals[g_id][s_id]))
 
-    unuseful_cls = 0
     for g in stat_groups:
-        if g.g_name == "icache_unuseful_cl":
-            unuseful_cls = g.weighted_total
-            assert(g.weighted_total == g.s_list[0].weighted_average)
-            break
-
-    with open(sim_root_dir + "/unuseful_cl.csv" + csv_old_suffix, "w") as outfile:
-        writer = csv.writer(outfile)
-        writer.writerow(["icache_unuseful_cl_cyc", "icache_unuseful_cl", "UUCL"])
-        if float(unuseful_cls) == 0:
-          writer.writerow([unuseful_cl_cyc, unuseful_cls, 0.0])
-        else:
-          writer.writerow([unuseful_cl_cyc, unuseful_cls, float(unuseful_cl_cyc)/float(unuseful_cls)])
-
-stat_groups = [
-    # use the "periodic" column when defining stats ("1" for most of the stats)
-    # make sure "instructions" is the first group
-    StatGroup("instructions", "core.stat.0.out",
-            [
-            Stat("NODE_INST_COUNT", 1)
-            ]),
-    StatGroup("dcache_access", "memory.stat.0.out",
-            [
-            Stat("DCACHE_MISS", 1),
-            Stat("DCACHE_ST_BUFFER_HIT", 1),
-            Stat("DCACHE_HIT", 1)
-            ]),
-    StatGroup("cycles", "core.stat.0.out",
-            [
-            Stat("NODE_CYCLE", 1)
-            ]),
-    StatGroup("icache_access", "memory.stat.0.out",
-            [
-            Stat("ICACHE_HIT", 1),
-            Stat("ICACHE_MISS", 1)
-            ]),
-    StatGroup("icache_miss_reason", "memory.stat.0.out",
-            [
-            Stat("ICACHE_MISS_NOT_PREFETCHED", 1),
-            Stat("ICACHE_MISS_PREFETCHED_AND_EVICTED_BY_IFETCH", 1),
-            Stat("ICACHE_MISS_PREFETCHED_AND_EVICTED_BY_FDIP", 1),
-            Stat("ICACHE_MISS_MSHR_HIT_PREFETCHED_OFFPATH", 1),
-            Stat("ICACHE_MISS_MSHR_HIT_PREFETCHED_ONPATH", 1)
-            ]),
-    StatGroup("icache_hit_by_fdip_on_off", "memory.stat.0.out",
-            [
-            Stat("ICACHE_HIT_BY_FDIP_ONPATH", 1),
-            Stat("ICACHE_HIT_BY_FDIP_OFFPATH", 1)
-            ]),
-    StatGroup("icache_miss_mshr_hit_by_fdip_on_off", "memory.stat.0.out",
-            [
-            Stat("ICACHE_MISS_MSHR_HIT_BY_FDIP_ONPATH", 1),
-            Stat("ICACHE_MISS_MSHR_HIT_BY_FDIP_OFFPATH", 1)
-            ]),
-    StatGroup("icache_hit_on_off_by_fdip", "memory.stat.0.out",
-            [
-            Stat("ICACHE_HIT_ONPATH_BY_FDIP", 1),
-            Stat("ICACHE_HIT_OFFPATH_BY_FDIP", 1)
-            ]),
-    StatGroup("icache_miss_mshr_hit_on_off_by_fdip", "memory.stat.0.out",
-            [
-            Stat("ICACHE_MISS_MSHR_HIT_ONPATH_BY_FDIP", 1),
-            Stat("ICACHE_MISS_MSHR_HIT_OFFPATH_BY_FDIP", 1)
-            ]),
-    StatGroup("icache_unuseful_cl_cyc", "memory.stat.0.out",
-            [
-            Stat("ICACHE_UNUSEFUL_CL_CYC", 1),
-            ]),
-    StatGroup("icache_unuseful_cl", "memory.stat.0.out",
-            [
-            Stat("ICACHE_UNUSEFUL_CL", 1),
-            ]),
-    StatGroup("icache_evict_miss_on_off_by_fdip", "memory.stat.0.out",
-            [
-            Stat("ICACHE_EVICT_MISS_ONPATH_BY_FDIP", 1),
-            Stat("ICACHE_EVICT_MISS_OFFPATH_BY_FDIP", 1)
-            ]),
-    StatGroup("icache_evict_miss_by_fdip", "memory.stat.0.out",
-            [
-            Stat("ICACHE_EVICT_MISS_BY_FDIP_ONPATH", 1),
-            Stat("ICACHE_EVICT_MISS_BY_FDIP_OFFPATH", 1)
-            ]),
-    StatGroup("icache_fill_correct_req_by_fdip_hit_by_demand_load", "memory.stat.0.out",
-            [
-            Stat("ICACHE_FILL_CORRECT_REQ_BY_ON_FDIP_HIT_BY_DEMAND_LOAD", 1),
-            Stat("ICACHE_FILL_CORRECT_REQ_BY_OFF_FDIP_HIT_BY_DEMAND_LOAD", 1),
-            ]),
-    StatGroup("icache_fill_correct_req_cycle_delta_by_fdip_hit_by_demand_load", "memory.stat.0.out",
-            [
-            Stat("ICACHE_FILL_CORRECT_REQ_CYCLE_DELTA_BY_ON_FDIP_HIT_BY_DEMAND_LOAD", 1),
-            Stat("ICACHE_FILL_CORRECT_REQ_CYCLE_DELTA_BY_OFF_FDIP_HIT_BY_DEMAND_LOAD", 1),
-            ]),
-
-    StatGroup("fdip_new_prefetches_on_off", "pref.stat.0.out",
-            [
-            Stat("FDIP_NEW_PREFETCHES_ONPATH", 1),
-            Stat("FDIP_NEW_PREFETCHES_OFFPATH", 1)
-            ]),
-    StatGroup("fdip_pref_icache_probe_hit_on_off", "pref.stat.0.out",
-            [
-            Stat("FDIP_PREF_ICACHE_PROBE_HIT_ONPATH", 1),
-            Stat("FDIP_PREF_ICACHE_PROBE_HIT_OFFPATH", 1)
-            ]),
-    StatGroup("fdip_pref_mshr_probe_hit_on_off", "pref.stat.0.out",
-            [
-            Stat("FDIP_PREF_MSHR_PROBE_HIT_ONPATH", 1),
-            Stat("FDIP_PREF_MSHR_PROBE_HIT_OFFPATH", 1)
-            ]),
-    StatGroup("fdip_attempted_pref_on_off", "pref.stat.0.out",
-            [
-            Stat("FDIP_ATTEMPTED_PREF_ONPATH", 1),
-            Stat("FDIP_ATTEMPTED_PREF_OFFPATH", 1)
-            ]),
-    StatGroup("fdip_avg_ftq_occupancy", "pref.stat.0.out",
-            [
-            Stat("FDIP_AVG_FTQ_OCCUPANCY", 1)
-            ]),
-    StatGroup("fdip_conf", "pref.stat.0.out",
-            [
-            Stat("FDIP_OFF_CONF_ON", 1),
-            Stat("FDIP_OFF_CONF_OFF", 1),
-            Stat("FDIP_ON_CONF_ON", 1),
-            Stat("FDIP_ON_CONF_OFF", 1)
-            ]),
-    StatGroup("fdip_conf_true_miss", "pref.stat.0.out",
-            [
-            Stat("FDIP_OFF_CONF_ON_EMIT_UNUSEFUL", 1),
-            Stat("FDIP_ON_CONF_OFF_MISS_USEFUL", 1)
-            ]),
-    StatGroup("fdip_mem_buf", "pref.stat.0.out",
-            [
-            Stat("FDIP_MEM_BUF_MISS", 1),
-            Stat("FDIP_MEM_BUF_FOUND", 1)
-            ]),
-
-    StatGroup("inst_lost_wait_for_icache_miss", "fetch.stat.0.out",
-            [
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS", 1)
-            ]),
-    StatGroup("inst_lost_wait_for_icache_miss_reason", "fetch.stat.0.out",
-            [
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS_NOT_PREFETCHED", 1),
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS_PREFETCHED_AND_EVICTED_BY_IFETCH", 1),
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS_PREFETCHED_AND_EVICTED_BY_FDIP", 1),
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS_MSHR_HIT_PREF_OFFPATH", 1),
-            Stat("INST_LOST_WAIT_FOR_ICACHE_MISS_MSHR_HIT_PREF_ONPATH", 1)
-            ]),
-    StatGroup("cf_ratio", "inst.stat.0.out",
-            [
-            Stat("ST_OP_CF", 2)
-            ]),
-
-
-    StatGroup("fdip_ftq_occupancy_ops_accumulated", "pref.stat.0.out",
-            [
-            Stat("FDIP_FTQ_OCCUPANCY_OPS_ACCUMULATED", 1)
-            ]),
-    StatGroup("fdip_ftq_occupancy_blocks_accumulated", "pref.stat.0.out",
-            [
-            Stat("FDIP_FTQ_OCCUPANCY_BLOCKS_ACCUMULATED", 1)
-            ]),
-    StatGroup("fdip_seniority_ftq_accumulated", "pref.stat.0.out",
-            [
-            Stat("FDIP_SENIORITY_FTQ_ACCUMULATED", 1)
-            ]),
-    StatGroup("icache_miss_after_warmup", "pref.stat.0.out",
-            [
-            Stat("ICACHE_FIRST_MISS_AFTER_WARMUP_SEEN_DURING_WARMUP", 1),
-            Stat("ICACHE_FIRST_MISS_AFTER_WARMUP_NOT_SEEN_DURING_WARMUP", 1)
-            ]),
-    StatGroup("icache_miss_after_warmup_seen_during_warmup", "pref.stat.0.out",
-            [
-            Stat("ICACHE_FIRST_MISS_AFTER_WARMUP_NO_PREF_DURING_WARMUP", 1),
-            Stat("ICACHE_FIRST_MISS_AFTER_WARMUP_TRAINED_UNUSEFUL_DURING_WARMUP", 1),
-            Stat("ICACHE_FIRST_MISS_AFTER_WARMUP_TRAINED_USEFUL_DURING_WARMUP", 1)
-            ]),
-    StatGroup("fdip_pref_hit", "pref.stat.0.out",
-            [
-            Stat("FDIP_PREFETCH_HIT_ICACHE", 1),
-            Stat("FDIP_PREFETCH_HIT_MLC", 1),
-            Stat("FDIP_PREFETCH_HIT_L1", 1),
-            Stat("FDIP_PREFETCH_HIT_DRAM", 1)
-            ]),
-    StatGroup("fdip_bloom_hit", "pref.stat.0.out",
-            [
-            Stat("FDIP_BLOOM_HIT", 1),
-            Stat("FDIP_BLOOM_MISS", 1)
-            ]),
-    StatGroup("cbr", "bp.stat.0.out",
-            [
-            Stat("CBR_CORRECT", 1),
-            Stat("CBR_CORRECT_BTB_MISS_NT_NT", 1),
-            Stat("CBR_RECOVER_MISPREDICT", 1),
-            Stat("CBR_RECOVER_MISFETCH", 1),
-            Stat("CBR_RECOVER_BTB_MISS_T_T", 1),
-            Stat("CBR_RECOVER_BTB_MISS_T_NT", 1),
-            Stat("CBR_RECOVER_BTB_MISS_NT_T", 1)
-            ])
-]
+        results["groups"].append((g.g_name, g.f_name, g.weighted_total))
+        for s in g.s_list:
+            ratio = None if s.weighted_ratio == "NA" else s.weighted_ratio
+            results["weighted"].append((g.g_name, s.s_name, s.pos, s.weighted_average, ratio))
+
+    results["derived"] = list(derived.items())
+    return results
+
+# one sqlite file per experiment holding the results of every workload and config,
+# next to the workload directories of the simulations
+def results_db_path(sim_root, experiment):
+    return os.path.join(sim_root, experiment + ".results.db")
+
+results_schema = """
+CREATE TABLE IF NOT EXISTS simpoints (workload TEXT, config TEXT, seg_id INTEGER, c_id INTEGER, weight REAL,
+                                      PRIMARY KEY (workload, config, seg_id));
+CREATE TABLE IF NOT EXISTS stats (workload TEXT, config TEXT, seg_id INTEGER, stat_group TEXT, stat TEXT, value REAL,
+                                  PRIMARY KEY (workload, config, stat_group, stat, seg_id));
+CREATE TABLE IF NOT EXISTS weighted (workload TEXT, config TEXT, stat_group TEXT, stat TEXT, pos INTEGER,
+                                     weighted_average REAL, weighted_ratio REAL,
+                                     PRIMARY KEY (workload, config, stat_group, stat));
+CREATE TABLE IF NOT EXISTS groups (workload TEXT, config TEXT, stat_group TEXT, file TEXT, weighted_total REAL,
+                                   PRIMARY KEY (workload, config, stat_group));
+CREATE TABLE IF NOT EXISTS derived (workload TEXT, config TEXT, metric TEXT, value REAL,
+                                    PRIMARY KEY (workload, config, metric));
+CREATE INDEX IF NOT EXISTS stats_by_stat ON stats (stat, workload, config);
+CREATE INDEX IF NOT EXISTS weighted_by_stat ON weighted (stat, workload, config);
+"""
+
+# write results of (workload, config) pairs, {(workload, config): collect_results(...)},
+# replacing what the store had for those pairs in one transaction
+def write_results_db(db_path, pair_results):
+    con = sqlite3.connect(db_path, timeout=60)
+    try:
+        con.executescript(results_schema)
+        with con:
+            for (workload, config), results in pair_results.items():
+                for table, rows in results.items():
+                    con.execute(f"DELETE FROM {table} WHERE workload = ? AND config = ?", (workload, config))
+                    if rows:
+                        marks = ", ".join(["?"] * (len(rows[0]) + 2))
+                        con.executemany(f"INSERT INTO {table} VALUES ({marks})", [(workload, config) + tuple(row) for row in rows])
+    finally:
+        con.close()
+
+# gather the results of one simulation directory and write its reports, returns rows for the results store
+# stat_groups accumulate weighted totals, so each gather gets its own copy
+def gather(sp_dir, sim_root_dir, use_old_weights, simpoint_weights = None):
+    groups = copy.deepcopy(stat_groups)
+    simpoints = read_simpoints(sp_dir, sim_root_dir, use_old_weights, simpoint_weights = simpoint_weights)
+    read_simpoint_stats(groups, simpoints)
+    # will calculate Stat.weighted_average, StatGroup.weighted_total, and Stat.weighted_ratio, 
+    calculate_weighted_average(groups, simpoints)
+    # simpoints.result
+    report(groups, simpoints, sim_root_dir, use_old_weights)
+    derived = customized_report(groups, simpoints, sim_root_dir, use_old_weights)
+    return collect_results(groups, simpoints, derived)
+
+# stat groups and derived ratios are declared in stat_groups.json next to this script,
+# set STAT_GROUPS_SPEC to use another spec
+stat_groups_spec = os.getenv("STAT_GROUPS_SPEC", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stat_groups.json"))
+stat_groups, derived_ratios = load_stat_groups(stat_groups_spec)
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
@@ -428,10 +367,4 @@ if __name__ == "__main__":
     else:
         use_old_weights = False
 
-    simpoints = read_simpoints(sys.argv[1], sys.argv[2], use_old_weights)
-    read_simpoint_stats(stat_groups, simpoints)
-    # will calculate Stat.weighted_average, StatGroup.weighted_total, and Stat.weighted_ratio, 
-    calculate_weighted_average(stat_groups, simpoints)
-    # simpoints.result
-    report(stat_groups, simpoints, sys.argv[2], use_old_weights)
-    customized_report(stat_groups, simpoints, sys.argv[2], use_old_weights)
+    gather(sys.argv[1], sys.argv[2], use_old_weights)
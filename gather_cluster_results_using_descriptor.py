@@ -1,6 +1,11 @@
 import json
 import argparse
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import experiment_manifest
+import gather_cluster_results
 
 def read_descriptor_from_json(filename="experiment.json"):
     # Read the descriptor data from a JSON file
@@ -15,11 +20,17 @@ def read_descriptor_from_json(filename="experiment.json"):
         print(f"Error decoding JSON in file '{filename}': {e}")
         return None
 
+def gather_pair(sp_dir, exp_path, simpoint_weights):
+    start = time.perf_counter()
+    results = gather_cluster_results.gather(sp_dir, exp_path, False, simpoint_weights)
+    return results, time.perf_counter() - start
+
 def run_experiment():
     # Create a parser for command-line arguments
     parser = argparse.ArgumentParser(description='Read descriptor file name')
     parser.add_argument('-d','--descriptor_name', required=True, help='Experiment descriptor name. Usage: -d exp2.json')
     parser.add_argument('-a','--application_name', required=True, help='Application name. Usage: -a simple_multi_update')
+    parser.add_argument('-j','--jobs', type=int, default=os.cpu_count(), help='Number of (workload, config) pairs gathered in parallel. Usage: -j 8')
 
     # Parse the command-line arguments
     args = parser.parse_args()
@@ -38,20 +49,68 @@ def run_experiment():
     architecture = descriptor_data["architecture"]
     experiment = descriptor_data["experiment"]
 
-    # Run Scarab
+    # Gather every (workload, config) pair on a process pool
+    sim_root = str(os.getenv('HOME')) + '/simpoint_flow/simulations/'
+    pairs = []
+    failed = {}
+    # pairs with simpoints the manifest of run_exp_using_descriptor.py has as not done are not gathered
+    manifest_path = experiment_manifest.manifest_path(sim_root, experiment)
+    manifest = experiment_manifest.Manifest(manifest_path, experiment) if os.path.exists(manifest_path) else None
     for workload in descriptor_data["workloads_list"]:
+        if args.application_name == "allbench":
+            sp_dir = '/simpoint_traces/' + workload + '/simpoints/'
+        else:
+            sp_dir = str(os.getenv('HOME')) + '/simpoint_flow/' + workload + '/simpoints/'
+
+        # Simpoints are the same for every config of a workload, read them once
+        try:
+            simpoint_weights = gather_cluster_results.read_simpoint_weights(sp_dir, False)
+        except (OSError, ValueError, AssertionError) as e:
+            for config_key in descriptor_data["configurations"].keys():
+                failed[(workload, config_key)] = f"can't read simpoints in {sp_dir}: {type(e).__name__}: {e}"
+            continue
+
         for config_key in descriptor_data["configurations"].keys():
-            exp_path = str(os.getenv('HOME')) + '/simpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
-            print(exp_path)
+            exp_path = sim_root + workload + '/' + experiment + '/' + config_key
             if not os.path.exists(exp_path):
-              print(f"The experiment does not exist!")
-              return None
-            config_value = descriptor_data["configurations"][config_key]
-            if args.application_name == "allbench":
-                command = 'python3 /usr/local/bin/gather_cluster_results.py /simpoint_traces/' + workload + '/simpoints/ $HOME/simpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
-            else:
-                command = 'python3 /usr/local/bin/gather_cluster_results.py $HOME/simpoint_flow/' + workload + '/simpoints/ $HOME/simpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
-            os.system(command)
+                failed[(workload, config_key)] = f"{exp_path} does not exist"
+                continue
+            incomplete = manifest.incomplete(workload, config_key) if manifest != None else []
+            if incomplete:
+                failed[(workload, config_key)] = "simpoints not done: " + ", ".join(f"{job['cluster']} {job['status']}" for job in incomplete)
+                continue
+            pairs.append((workload, config_key, sp_dir, exp_path, simpoint_weights))
+
+    total = len(pairs) + len(failed)
+    gathered = 0
+    pair_results = {}
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(gather_pair, sp_dir, exp_path, simpoint_weights): (workload, config_key, exp_path)
+                   for workload, config_key, sp_dir, exp_path, simpoint_weights in pairs}
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            workload, config_key, exp_path = futures[future]
+            try:
+                pair_results[(workload, config_key)], elapsed = future.result()
+                gathered += 1
+                print(f"GATHERED [{done}/{len(pairs)}] {exp_path} ({elapsed:.2f}s)")
+            # a helper calling exit() in the worker must not stop the other pairs
+            except (Exception, SystemExit) as e:
+                failed[(workload, config_key)] = f"{type(e).__name__}: {e}"
+                print(f"FAILED [{done}/{len(pairs)}] {exp_path}: {type(e).__name__}: {e}")
+
+    print(f"Gathered {gathered} of {total} (workload, config) pairs")
+
+    # All results of the experiment in one file, read by plot_data.py
+    if pair_results:
+        db_path = gather_cluster_results.results_db_path(sim_root, experiment)
+        gather_cluster_results.write_results_db(db_path, pair_results)
+        print(f"Results written to {db_path}")
+    if failed:
+        print("Failed pairs:")
+        for (workload, config_key), reason in failed.items():
+            print(f"  {workload} {config_key}: {reason}")
+        exit(1)
 
 if __name__ == "__main__":
     run_experiment()
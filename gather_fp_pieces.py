@@ -1,68 +1,120 @@
+import argparse
+import glob
+import os
+import sys
+from multiprocessing import Pool
+
+from bbv_format import BBVWriter
+
+# segments parsed per task when parsing in parallel
+parse_chunk_size = 64
+
+# lines buffered before they are written to bbfp
+write_batch_lines = 1024
+
 def line_to_map(line):
-    line = line.split()
-    fp = {}
-    for pair in line:
-        # format :bb_id:freq
-        bb_id, freq = pair.split(":")[1:]
-        fp[int(bb_id)] = int(freq)
-    return fp
-
-def append_bbfp(fp_file, segment_map):
-    pairs = []
-    for bb_id, bb_freq in segment_map.items():
-        pairs.append(":".join(["", str(bb_id), str(bb_freq)]))
-        
-    with open(fp_file, "a") as bbfp:
-        bbfp.write("T" + " ".join(pairs) + "\n")
+    # format [T]:bb_id:freq :bb_id:freq ..., split in one pass into alternating ids and freqs
+    tokens = line[line.find(":"):].replace(":", " ").split()
+    return dict(zip(map(int, tokens[0::2]), map(int, tokens[1::2])))
+
+def read_segment(file):
+    # the single fingerprint line of a segment
+    with open(file, "r") as f:
+        lines = f.read().splitlines()
+    assert sum(1 for line in lines if line) == 1, "segment fp provides more than one line"
+    return lines[0]
+
+def parse_segment(file):
+    # bb_id -> freq of a segment, run in the pool when parsing in parallel
+    return line_to_map(read_segment(file))
 
 def map_conversion(segment_map, addr_id_map, bb_count):
-    new_segment_map = {}
-    for bb_addr, bb_freq in segment_map.items():
-        if not bb_addr in addr_id_map:
-            addr_id_map[bb_addr] = bb_count
+    # bb ids are numbered from 1 in the order they are first seen. The old id is looked up once
+    new_ids = []
+    for bb_addr in segment_map:
+        bb_id = addr_id_map.get(bb_addr)
+        if bb_id == None:
+            bb_id = addr_id_map[bb_addr] = bb_count
             bb_count += 1
-        new_segment_map[addr_id_map[bb_addr]] = bb_freq
-    assert len(new_segment_map) == len(segment_map)
-    return new_segment_map, addr_id_map, bb_count
-    
-    
-def gather_fp_pieces(fp_dir, num_of_segments, file_prefix, no_convert):
-    import glob
-    
-    pre_segment_id = -1
-    bb_count = 1
-    addr_id_map = {}
+        new_ids.append(bb_id)
+    return new_ids, bb_count
 
+def segment_files(fp_dir, file_prefix):
+    # segment files in id order, checking no segment is missing
     # ref: https://stackoverflow.com/questions/4287209/sort-list-of-strings-by-integer-suffix
-    for file in sorted(glob.glob("{}/{}.*".format(fp_dir, file_prefix)), key = lambda x: int(x.split("/")[-1].split(".")[1])):
-        print(file, flush=True)
+    files = sorted(glob.glob("{}/{}.*".format(fp_dir, file_prefix)), key = lambda x: int(x.split("/")[-1].split(".")[1]))
+    for pre_segment_id, file in enumerate(files, start=-1):
         segment_id = file.split(".")[-1]
         assert int(segment_id) == pre_segment_id + 1, "{} != {}".format(segment_id, pre_segment_id + 1)
-        pre_segment_id = int(segment_id)
+    return files
+
+def gather_fp_pieces(fp_dir, num_of_segments, file_prefix, no_convert, jobs = 1, binary = False):
+    files = segment_files(fp_dir, file_prefix)
+
+    bb_count = 1
+    addr_id_map = {}
+    pool = None
 
-        with open(file, "r") as f:
-            lines = f.read().splitlines()
-            assert sum(1 for line in lines if line) == 1, "segment fp provides more than one line"
+    if no_convert and not binary:
+        segments = map(read_segment, files)
+    elif jobs > 1:
+        # segments are parsed in parallel, imap keeps them in order for numbering
+        pool = Pool(jobs)
+        segments = pool.imap(parse_segment, files, parse_chunk_size)
+    else:
+        segments = map(parse_segment, files)
 
-            if (not no_convert):
-                segment_map = line_to_map(lines[0])
-                segment_map, addr_id_map, bb_count = map_conversion(segment_map, addr_id_map, bb_count)
-                append_bbfp(fp_dir + "/bbfp", segment_map)
-            else:
-                with open(fp_dir + "/bbfp", "a") as bbfp:
-                    bbfp.write(lines[0] + "\n")
+    if binary:
+        # bbfp.bin holds the same vectors in the binary format of bbv_format.py. Unconverted ids are addresses, kept as 64 bits
+        with BBVWriter(fp_dir + "/bbfp.bin", wide_ids=no_convert) as writer:
+            for i, segment in enumerate(segments):
+                if no_convert:
+                    writer.add_segment(list(segment), list(segment.values()))
+                else:
+                    new_ids, bb_count = map_conversion(segment, addr_id_map, bb_count)
+                    writer.add_segment(new_ids, list(segment.values()))
 
-    if pre_segment_id + 1 != num_of_segments:
-        print("saw {} segments expected {}".format(pre_segment_id + 1, num_of_segments))
+                if (i + 1) % write_batch_lines == 0:
+                    print("{} [{}/{}]".format(files[i], i + 1, len(files)), flush=True)
+    else:
+        # one buffered writer for every segment instead of reopening bbfp per segment
+        with open(fp_dir + "/bbfp", "a", buffering=1 << 20) as bbfp:
+            batch = []
+            for i, segment in enumerate(segments):
+                if no_convert:
+                    batch.append(segment)
+                else:
+                    new_ids, bb_count = map_conversion(segment, addr_id_map, bb_count)
+                    batch.append("T" + " ".join([":{}:{}".format(bb_id, freq) for bb_id, freq in zip(new_ids, segment.values())]))
 
-import sys
-import os
+                if len(batch) == write_batch_lines:
+                    bbfp.write("\n".join(batch) + "\n")
+                    batch = []
+                    print("{} [{}/{}]".format(files[i], i + 1, len(files)), flush=True)
+
+            if batch:
+                bbfp.write("\n".join(batch) + "\n")
+
+    if pool != None:
+        pool.close()
+        pool.join()
+
+    print("gathered {} segments, {} basic blocks".format(len(files), bb_count - 1), flush=True)
+    if len(files) != num_of_segments:
+        print("saw {} segments expected {}".format(len(files), num_of_segments))
 
 if __name__ == "__main__":
-    if not os.path.isdir(sys.argv[1]):
-        print("segment directory {} does not exist!")
-        exit
-    if len(sys.argv) == 5 and sys.argv[4] == "no_convert":
-        gather_fp_pieces(sys.argv[1], int(sys.argv[2]), sys.argv[3], True)
-    else:
-        gather_fp_pieces(sys.argv[1], int(sys.argv[2]), sys.argv[3], False)
+    parser = argparse.ArgumentParser(description='Merge segment fingerprints into one bbfp file, renumbering basic blocks')
+    parser.add_argument('fp_dir', help='Directory of the segment fingerprints, bbfp is written there')
+    parser.add_argument('num_of_segments', type=int, help='Number of segments expected')
+    parser.add_argument('file_prefix', help='Segment files are <file_prefix>.<segment id>')
+    parser.add_argument('convert', nargs='?', choices=['no_convert'], help='no_convert copies the lines without renumbering')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Processes parsing segments. Usage: -j 8')
+    parser.add_argument('--binary', action='store_true', help='Write bbfp.bin in the binary format of bbv_format.py instead of the text bbfp')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.fp_dir):
+        print("segment directory {} does not exist!".format(args.fp_dir))
+        sys.exit(1)
+
+    gather_fp_pieces(args.fp_dir, args.num_of_segments, args.file_prefix, args.convert == 'no_convert', args.jobs, args.binary)
@@ -0,0 +1,266 @@
+import argparse
+import heapq
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import runtime_history
+
+# Runs local jobs (scarab simulations, post-processing pieces...) on a bounded number of workers.
+# Jobs start highest priority first, in submission order within a priority. The state and exit code
+# of every job is written to a status file as they change, so a failed run can be found afterwards.
+# With a runtime history (--history, see runtime_history.py) jobs of a priority start longest expected
+# first, so one long simulation doesn't start last and hold up the rest, and the history learns their times.
+#
+# Job files have one job per line: <name>\t<priority>\t<directory>\t<command>
+# The command runs with bash -c in the directory ("-" for the current one), like eval in the run scripts.
+
+# memory one scarab simulation is expected to need, bounds the default worker count
+default_job_mem_gb = 4
+
+def available_mem_bytes():
+    # MemAvailable of /proc/meminfo, None if it can't be read
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def default_workers(job_mem_gb = default_job_mem_gb):
+    # one worker per usable core, fewer if memory can't hold them. SCHEDULER_JOBS overrides both
+    if os.getenv("SCHEDULER_JOBS"):
+        return max(1, int(os.getenv("SCHEDULER_JOBS")))
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    mem = available_mem_bytes()
+    if mem == None:
+        return cores
+    return max(1, min(cores, int(mem // (job_mem_gb * 2**30))))
+
+class Job:
+    # command is a shell string (run with bash -c) or an argv list. stdout and stderr go to log if given,
+    # env replaces the environment if given
+    def __init__(self, name, command, cwd = None, priority = 0, log = None, env = None):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.priority = priority
+        self.log = log
+        self.env = env
+        # expected seconds, runtime_history.py key and instructions simulated, when known
+        self.estimate = None
+        self.history_key = None
+        self.instructions = None
+        # queued, running, done, failed or cancelled
+        self.state = "queued"
+        self.exit_code = None
+        self.start = None
+        self.end = None
+        self.process = None
+
+    def launch(self):
+        args = ["/bin/bash", "-c", self.command] if isinstance(self.command, str) else self.command
+        log = open(self.log, "w") if self.log != None else None
+        try:
+            # own process group so cancelling also stops what the command started
+            self.process = subprocess.Popen(args, cwd=self.cwd, env=self.env, stdout=log, stderr=subprocess.STDOUT if log != None else None,
+                                            start_new_session=True)
+        finally:
+            if log != None:
+                log.close()
+        self.start = time.time()
+        self.state = "running"
+
+    def seconds(self):
+        if self.start == None:
+            return None
+        return (self.end if self.end != None else time.time()) - self.start
+
+class JobScheduler:
+    def __init__(self, workers = None, status_file = None):
+        self.workers = workers if workers != None else default_workers()
+        self.status_file = status_file
+        self.jobs = []
+        # heap of (-priority, -expected seconds, submission order, job)
+        self.queue = []
+        self.lock = threading.Lock()
+        self.cancelled = False
+        # set by signal handlers, which must not take the lock: run cancels the jobs for them
+        self.cancel_requested = False
+
+    def submit(self, job):
+        with self.lock:
+            heapq.heappush(self.queue, (-job.priority, -(job.estimate or 0), len(self.jobs), job))
+            self.jobs.append(job)
+        return job
+
+    def run(self):
+        # runs every submitted job, returning once all have finished or were cancelled
+        print("running {} jobs on {} workers".format(len(self.jobs), self.workers), flush=True)
+        self.write_status()
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(min(self.workers, len(self.jobs)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+                if self.cancel_requested and not self.cancelled:
+                    self.cancel()
+        return self.jobs
+
+    def worker(self):
+        while True:
+            with self.lock:
+                if self.cancelled or self.queue == []:
+                    return
+                job = heapq.heappop(self.queue)[-1]
+                try:
+                    job.launch()
+                except OSError as e:
+                    print("ERR: Can't start job {}: {}".format(job.name, e), flush=True)
+                    job.state = "failed"
+                    continue
+            self.write_status()
+
+            exit_code = job.process.wait()
+
+            with self.lock:
+                job.end = time.time()
+                job.exit_code = exit_code
+                job.state = "cancelled" if self.cancelled else "done" if exit_code == 0 else "failed"
+                finished = sum(1 for job in self.jobs if job.state in ["done", "failed"])
+            print("JOB [{}/{}] {} {} with exit code {} ({:.1f}s)".format(
+                finished, len(self.jobs), job.name, job.state, exit_code, job.seconds()), flush=True)
+            self.write_status()
+
+    def cancel(self):
+        # stops running jobs and drops queued ones
+        with self.lock:
+            self.cancelled = True
+            for job in self.jobs:
+                if job.state == "running":
+                    try:
+                        os.killpg(job.process.pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+                elif job.state == "queued":
+                    job.state = "cancelled"
+            self.queue = []
+        print("cancelled, stopping running jobs", flush=True)
+
+    def write_status(self):
+        if self.status_file == None:
+            return
+
+        with self.lock:
+            rows = ["name\tstate\texit_code\tpriority\tseconds\tdirectory\testimate\n"]
+            for job in self.jobs:
+                seconds = job.seconds()
+                rows.append("{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(job.name, job.state, "" if job.exit_code == None else job.exit_code,
+                                                                job.priority, "" if seconds == None else "{:.1f}".format(seconds),
+                                                                job.cwd if job.cwd != None else "-",
+                                                                "" if job.estimate == None else "{:.1f}".format(job.estimate)))
+
+            tmp = "{}.{}.tmp".format(self.status_file, os.getpid())
+            with open(tmp, "w") as f:
+                f.writelines(rows)
+            os.replace(tmp, self.status_file)
+
+    def failed(self):
+        return [job for job in self.jobs if job.state != "done"]
+
+    def predicted_makespan(self):
+        # makespan if every job takes its estimate, in the order the queue starts them
+        order = [entry[-1] for entry in sorted(self.queue, key=lambda entry: entry[:-1])]
+        return runtime_history.predicted_makespan([job.estimate or 0 for job in order], self.workers)
+
+    def makespan(self):
+        started = [job for job in self.jobs if job.start != None]
+        if started == []:
+            return 0
+        return max(job.end or time.time() for job in started) - min(job.start for job in started)
+
+def estimate_jobs(jobs, history):
+    # estimates the jobs that have a history key, returns how many came from history, kips and default
+    sources = {"history": 0, "kips": 0, "default": 0}
+    for job in jobs:
+        if job.history_key != None:
+            job.estimate, source = history.estimate(job.history_key, job.instructions)
+            sources[source] += 1
+    return sources
+
+def run_jobs(jobs, workers = None, status_file = None, history = None):
+    # runs jobs on a scheduler until all finish. Ctrl-C or SIGTERM cancels them. Returns the jobs that did not succeed.
+    # With a RuntimeHistory, jobs start longest expected first and their times are recorded
+    if history != None:
+        sources = estimate_jobs(jobs, history)
+    scheduler = JobScheduler(workers, status_file)
+    for job in jobs:
+        scheduler.submit(job)
+    if history != None:
+        predicted = scheduler.predicted_makespan()
+        print("predicted makespan {:.1f}s on {} workers ({} estimates from history, {} from kips, {} default)".format(
+            predicted, scheduler.workers, sources["history"], sources["kips"], sources["default"]), flush=True)
+
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            handlers[signum] = signal.signal(signum, lambda signum, frame: setattr(scheduler, "cancel_requested", True))
+    try:
+        scheduler.run()
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+    failed = scheduler.failed()
+    print("{} of {} jobs succeeded".format(len(scheduler.jobs) - len(failed), len(scheduler.jobs)), flush=True)
+    if history != None:
+        print("makespan {:.1f}s, predicted {:.1f}s".format(scheduler.makespan(), predicted), flush=True)
+        history.record([(job.history_key, job.seconds(), job.instructions)
+                        for job in scheduler.jobs if job.state == "done" and job.history_key != None])
+    for job in failed:
+        print("FAILED {} ({}, exit code {})".format(job.name, job.state, job.exit_code), flush=True)
+    return failed
+
+def read_job_file(job_file):
+    jobs = []
+    with open(job_file, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.rstrip("\n")
+            if line.strip() == "" or line.startswith("#"):
+                continue
+            fields = line.split("\t", 3)
+            if len(fields) != 4:
+                print("ERR: {}:{} is not <name>\\t<priority>\\t<directory>\\t<command>".format(job_file, line_number))
+                exit(1)
+            name, priority, cwd, command = fields
+            jobs.append(Job(name, command, None if cwd == "-" else cwd, int(priority)))
+    return jobs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the jobs of a job file on a bounded number of workers')
+    parser.add_argument('job_file', help='One job per line: <name>\\t<priority>\\t<directory>\\t<command>')
+    parser.add_argument('-j', '--jobs', type=int, help='Workers. Default is one per core, bounded by available memory, or $SCHEDULER_JOBS')
+    parser.add_argument('--job_mem_gb', type=float, default=default_job_mem_gb, help='Memory a job needs, for the default worker count')
+    parser.add_argument('--status', help='Status file rewritten as jobs change state')
+    parser.add_argument('--history', nargs='?', const=runtime_history.default_history_file(),
+                        help='Runtime history file, to start the longest jobs first and record their times. Default is ~/simpoint_flow/runtime_history.json')
+    parser.add_argument('--estimates', help='What jobs simulate: <name>\\t<workload>\\t<segment>\\t<config>\\t<instructions> per line')
+    args = parser.parse_args()
+
+    workers = args.jobs if args.jobs != None else default_workers(args.job_mem_gb)
+    jobs = read_job_file(args.job_file)
+    history = None
+    if args.history != None:
+        history = runtime_history.RuntimeHistory(args.history)
+        estimates = runtime_history.read_estimates(args.estimates) if args.estimates != None else {}
+        for job in jobs:
+            job.history_key, job.instructions = estimates.get(job.name, (None, None))
+    failed = run_jobs(jobs, workers, args.status, history)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+# Runs the long steps of run.sh (tracing and simulations through docker exec) and tells as soon as they finish.
+# A daemon owns the processes it launches and learns of each exit right away from a pidfd (Linux 5.3+,
+# Python 3.9+) or, without pidfds, a thread blocked in waitpid. So run.sh neither polls /proc nor has to
+# find what it started in docker top. Jobs belong to a group, run.sh waits for a whole group.
+#
+# Clients send one JSON request per line on a unix socket ($ORCHESTRATOR_SOCKET) and get one JSON reply:
+#   {"op": "launch", "name": n, "group": g, "argv": [...], "log": path or null} -> {"id": i}
+#   {"op": "status"} -> {"jobs": [...]}
+#   {"op": "wait", "group": g} -> {"jobs": [...]} once every job of g finished
+#   {"op": "cancel", "group": g} -> {"cancelled": n}
+#   {"op": "shutdown"} cancels what still runs and stops the daemon
+# Cancelling stops the launched process group. For docker exec that is the client only, the command in
+# the container keeps running.
+
+has_pidfd = hasattr(os, "pidfd_open")
+
+def default_socket():
+    return os.getenv("ORCHESTRATOR_SOCKET", "/tmp/orchestrator_{}.sock".format(os.getenv("USER", os.getuid())))
+
+def job_summary(job):
+    return {key: job[key] for key in ["id", "name", "group", "argv", "log", "pid", "state", "exit_code", "start", "end"]}
+
+class Orchestrator:
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.jobs = []
+        self.processes = {}
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+        self.stopping = False
+
+        self.selector = selectors.DefaultSelector()
+        # wakes the watcher up when a pidfd was added
+        self.wake_read, self.wake_write = os.pipe()
+        self.selector.register(self.wake_read, selectors.EVENT_READ, None)
+
+    def launch(self, name, group, argv, log = None):
+        with self.lock:
+            if self.stopping:
+                raise RuntimeError("shutting down")
+            job = {"id": len(self.jobs), "name": name, "group": group, "argv": argv, "log": log, "pid": None,
+                   "state": "running", "exit_code": None, "start": time.time(), "end": None}
+            out = open(log, "a") if log != None else None
+            try:
+                process = subprocess.Popen(argv, stdout=out, stderr=subprocess.STDOUT if out != None else None,
+                                           stdin=subprocess.DEVNULL, start_new_session=True)
+            finally:
+                if out != None:
+                    out.close()
+            job["pid"] = process.pid
+            self.jobs.append(job)
+            self.processes[job["id"]] = process
+
+            if has_pidfd:
+                self.selector.register(os.pidfd_open(process.pid), selectors.EVENT_READ, job)
+                os.write(self.wake_write, b"x")
+            else:
+                threading.Thread(target=self.wait_child, args=(job,), daemon=True).start()
+        print("orchestrator: launched {} {} (pid {})".format(group, name, process.pid), flush=True)
+        return job
+
+    def wait_child(self, job):
+        self.finish(job, self.processes[job["id"]].wait())
+
+    def watch(self):
+        # pidfds turn readable when their process exits
+        while True:
+            for key, _ in self.selector.select():
+                if key.data == None:
+                    os.read(self.wake_read, 4096)
+                    continue
+                self.selector.unregister(key.fileobj)
+                os.close(key.fileobj)
+                self.finish(key.data, self.processes[key.data["id"]].wait())
+
+    def finish(self, job, exit_code):
+        with self.lock:
+            job["end"] = time.time()
+            job["exit_code"] = exit_code
+            if job["state"] != "cancelled":
+                job["state"] = "done" if exit_code == 0 else "failed"
+            self.finished.notify_all()
+        print("orchestrator: {} {} {} with exit code {} ({:.1f}s)".format(
+            job["group"], job["name"], job["state"], exit_code, job["end"] - job["start"]), flush=True)
+
+    def group_jobs(self, group):
+        return [job for job in self.jobs if group == None or job["group"] == group]
+
+    def wait(self, group):
+        with self.lock:
+            self.finished.wait_for(lambda: all(job["end"] != None for job in self.group_jobs(group)))
+            return [job_summary(job) for job in self.group_jobs(group)]
+
+    def cancel(self, group = None):
+        cancelled = 0
+        with self.lock:
+            for job in self.group_jobs(group):
+                if job["end"] == None:
+                    job["state"] = "cancelled"
+                    try:
+                        os.killpg(job["pid"], signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+                    cancelled += 1
+        return cancelled
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "launch":
+            return {"id": self.launch(request["name"], request.get("group", "default"), request["argv"], request.get("log"))["id"]}
+        if op == "status":
+            with self.lock:
+                return {"jobs": [job_summary(job) for job in self.jobs]}
+        if op == "wait":
+            return {"jobs": self.wait(request.get("group"))}
+        if op == "cancel":
+            return {"cancelled": self.cancel(request.get("group"))}
+        if op == "shutdown":
+            with self.lock:
+                self.stopping = True
+            return {"cancelled": self.cancel()}
+        return {"error": "unknown op {}".format(op)}
+
+    def serve_client(self, connection):
+        with connection, connection.makefile("rw") as stream:
+            for line in stream:
+                try:
+                    reply = self.handle(json.loads(line))
+                except (ValueError, KeyError, TypeError, OSError, RuntimeError) as e:
+                    reply = {"error": "{}: {}".format(type(e).__name__, e)}
+                stream.write(json.dumps(reply) + "\n")
+                stream.flush()
+                if self.stopping:
+                    break
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        if has_pidfd:
+            threading.Thread(target=self.watch, daemon=True).start()
+        print("orchestrator: listening on {} ({})".format(self.socket_path, "pidfd" if has_pidfd else "waitpid"), flush=True)
+
+        server.settimeout(1)
+        try:
+            while not self.stopping:
+                try:
+                    connection, _ = server.accept()
+                except socket.timeout:
+                    continue
+                connection.settimeout(None)
+                threading.Thread(target=self.serve_client, args=(connection,), daemon=True).start()
+        finally:
+            server.close()
+            os.remove(self.socket_path)
+
+def request(socket_path, message):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    with client, client.makefile("rw") as stream:
+        stream.write(json.dumps(message) + "\n")
+        stream.flush()
+        reply = json.loads(stream.readline())
+    if "error" in reply:
+        print("ERR: orchestrator: {}".format(reply["error"]))
+        sys.exit(1)
+    return reply
+
+def start(socket_path, timeout = 10):
+    # starts a daemon in the background, its output and the output of its jobs go to ours
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--socket", socket_path],
+                               stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() != None:
+            break
+        try:
+            request(socket_path, {"op": "status"})
+            return process.pid
+        except (ConnectionRefusedError, FileNotFoundError):
+            time.sleep(0.05)
+    print("ERR: orchestrator did not start on {}".format(socket_path))
+    sys.exit(1)
+
+def wait_pids(pids):
+    # waits for processes that are not our children, pidfds need no polling
+    if not has_pidfd:
+        while any(os.path.exists("/proc/{}".format(pid)) for pid in pids):
+            time.sleep(1)
+        return
+
+    selector = selectors.DefaultSelector()
+    for pid in pids:
+        try:
+            selector.register(os.pidfd_open(pid), selectors.EVENT_READ, pid)
+        except ProcessLookupError:
+            pass
+    while selector.get_map():
+        for key, _ in selector.select():
+            print("process {} finished".format(key.data), flush=True)
+            selector.unregister(key.fileobj)
+            os.close(key.fileobj)
+
+def print_jobs(jobs):
+    for job in jobs:
+        seconds = (job["end"] if job["end"] != None else time.time()) - job["start"]
+        print("{}\t{}\t{}\t{}\t{:.1f}s\t{}".format(job["group"], job["name"], job["state"],
+                                                   "" if job["exit_code"] == None else job["exit_code"], seconds, job["log"] or "-"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Launch processes through a daemon that reports their completion')
+    parser.add_argument('--socket', default=default_socket(), help='Unix socket of the daemon. Default is $ORCHESTRATOR_SOCKET')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('serve', help='Run the daemon in the foreground')
+    commands.add_parser('start', help='Start the daemon in the background')
+    launch = commands.add_parser('launch', help='launch [--name N] [--group G] [--log L] -- <command...>')
+    launch.add_argument('--name', help='Job name, the command by default')
+    launch.add_argument('--group', default='default', help='Group the job is waited for with')
+    launch.add_argument('--log', help='File for stdout and stderr, the daemon output by default')
+    launch.add_argument('argv', nargs=argparse.REMAINDER)
+    wait = commands.add_parser('wait', help='Wait for every job of a group, exits 1 if any did not succeed')
+    wait.add_argument('group', nargs='?')
+    commands.add_parser('status', help='Print every job')
+    cancel = commands.add_parser('cancel', help='Cancel the running jobs of a group')
+    cancel.add_argument('group', nargs='?')
+    commands.add_parser('shutdown', help='Cancel running jobs and stop the daemon')
+    waitpid = commands.add_parser('waitpid', help='Wait for processes that are not children, without a daemon')
+    waitpid.add_argument('pids', nargs='*', type=int)
+    # the socket option may also follow the command
+    for command in commands.choices.values():
+        command.add_argument('--socket', default=argparse.SUPPRESS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        Orchestrator(args.socket).serve()
+    elif args.command == 'start':
+        start(args.socket)
+    elif args.command == 'launch':
+        argv = args.argv[1:] if args.argv[:1] == ['--'] else args.argv
+        if argv == []:
+            print("ERR: launch needs a command")
+            sys.exit(1)
+        print(request(args.socket, {"op": "launch", "name": args.name or " ".join(argv), "group": args.group,
+                                    "argv": argv, "log": os.path.abspath(args.log) if args.log else None})["id"])
+    elif args.command == 'wait':
+        jobs = request(args.socket, {"op": "wait", "group": args.group})["jobs"]
+        print_jobs(jobs)
+        sys.exit(1 if any(job["state"] != "done" for job in jobs) else 0)
+    elif args.command == 'status':
+        print_jobs(request(args.socket, {"op": "status"})["jobs"])
+    elif args.command == 'cancel':
+        print("cancelled {} jobs".format(request(args.socket, {"op": "cancel", "group": args.group})["cancelled"]))
+    elif args.command == 'shutdown':
+        request(args.socket, {"op": "shutdown"})
+    else:
+        wait_pids(args.pids)
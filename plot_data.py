@@ -1,11 +1,13 @@
 import os
 import json
+import sqlite3
 import argparse
 import pandas as pd
 import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib import cm
+from gather_cluster_results import results_db_path
 
 matplotlib.rc('font', size=14)
 plt.rcParams['font.family'] = 'serif'
@@ -24,6 +26,30 @@ def read_descriptor_from_json(descriptor_filename):
         print(f"Error decoding JSON in file '{descriptor_filename}': {e}")
         return None
 
+def read_results_db(db_path):
+  # (workload, config) -> {name: value} of the stats plotted here, from the experiment's results store
+  results = {}
+  con = sqlite3.connect(db_path)
+  try:
+    for workload, config, metric, value in con.execute("SELECT workload, config, metric, value FROM derived WHERE metric IN ('IPC', 'instructions', 'cycles')"):
+      results.setdefault((workload, config), {})[metric] = value
+    for workload, config, stat, value in con.execute("SELECT workload, config, stat, weighted_average FROM weighted "
+                                                     "WHERE (stat_group = 'icache_access' AND stat = 'ICACHE_MISS') "
+                                                     "OR (stat_group = 'inst_lost_wait_for_icache_miss' AND stat = 'INST_LOST_WAIT_FOR_ICACHE_MISS')"):
+      results.setdefault((workload, config), {})[stat] = value
+  finally:
+    con.close()
+  return results
+
+def read_results_csv(exp_path, config_key):
+  # same as read_results_db for one config, from the csvs written by gather_cluster_results.py
+  df_ipc = pd.read_csv(exp_path+config_key+'/ipc.csv')
+  df_imiss = pd.read_csv(exp_path+config_key+'/icache_access.csv', index_col='Simpoints')
+  df_imiss_cyc = pd.read_csv(exp_path+config_key+'/inst_lost_wait_for_icache_miss.csv', index_col='Simpoints')
+  return {'IPC': df_ipc['IPC'][0], 'instructions': df_ipc['instructions'][0], 'cycles': df_ipc['cycles'][0],
+          'ICACHE_MISS': df_imiss['ICACHE_MISS_w_val']['weighted_avg'],
+          'INST_LOST_WAIT_FOR_ICACHE_MISS': df_imiss_cyc['INST_LOST_WAIT_FOR_ICACHE_MISS_w_val']['weighted_avg']}
+
 def get_IPC(descriptor_data, baseline_name, sim_path):
   benchmarks_org = descriptor_data["workloads_list"].copy()
   benchmarks = descriptor_data["workloads_list"].copy()
@@ -32,6 +58,13 @@ def get_IPC(descriptor_data, baseline_name, sim_path):
   mpki = {}
   imiss_cycle = {}
 
+  # one results file for the whole experiment if gather_cluster_results_using_descriptor.py wrote it
+  db_path = results_db_path(sim_path, descriptor_data["experiment"])
+  results_db = None
+  if os.path.exists(db_path):
+    print("reading " + db_path)
+    results_db = read_results_db(db_path)
+
   try:
     for config_key in descriptor_data["configurations"].keys():
       print(config_key)
@@ -48,23 +81,29 @@ def get_IPC(descriptor_data, baseline_name, sim_path):
       for benchmark in benchmarks_org:
         print(benchmark)
         exp_path = sim_path+benchmark+'/'+descriptor_data["experiment"]+'/'
-        print(exp_path+baseline_name+'/ipc.csv')
-        df_ipc = pd.read_csv(exp_path+baseline_name+'/ipc.csv')
-        IPC_baseline = df_ipc['IPC'][0]
-
-        cycles = 0
-        insts = 0
-        df_ipc = pd.read_csv(exp_path+config_key+'/ipc.csv')
-        df_imiss = pd.read_csv(exp_path+config_key+'/icache_access.csv', index_col='Simpoints')
-        df_imiss_cyc = pd.read_csv(exp_path+config_key+'/inst_lost_wait_for_icache_miss.csv', index_col='Simpoints')
-        cycles = df_ipc['cycles'][0]
-        insts = df_ipc['instructions'][0]
-        IPC = df_ipc['IPC'][0]
+        # pairs that failed to gather are not in the results file, try their csvs like without one
+        missing = [key for key in dict.fromkeys([baseline_name, config_key]) if results_db == None or (benchmark, key) not in results_db]
+        if results_db != None and missing != []:
+          print("ERR: " + ", ".join(benchmark + " " + key for key in missing) + " not in " + db_path + ", reading the csvs")
+        if baseline_name in missing:
+          print(exp_path+baseline_name+'/ipc.csv')
+          baseline = {'IPC': pd.read_csv(exp_path+baseline_name+'/ipc.csv')['IPC'][0]}
+        else:
+          baseline = results_db[(benchmark, baseline_name)]
+        if config_key in missing:
+          results = read_results_csv(exp_path, config_key)
+        else:
+          results = results_db[(benchmark, config_key)]
+        IPC_baseline = baseline['IPC']
+
+        cycles = results['cycles']
+        insts = results['instructions']
+        IPC = results['IPC']
         # IPC_speedup = IPC/IPC_baseline
         IPC_speedup = 100.0*IPC/IPC_baseline - 100.0
         KI = float(insts)/1000.0
-        imiss = df_imiss['ICACHE_MISS_w_val']['weighted_avg']
-        imiss_cyc = df_imiss_cyc['INST_LOST_WAIT_FOR_ICACHE_MISS_w_val']['weighted_avg']
+        imiss = results['ICACHE_MISS']
+        imiss_cyc = results['INST_LOST_WAIT_FOR_ICACHE_MISS']
         MPKI = imiss/KI
         cyc_imiss = imiss_cyc/KI
         avg_IPC_speedup_config *= IPC_speedup
@@ -43,19 +43,18 @@ color_list = [
 ]
 color_list.reverse()
 
-def read_all_for_stat(whole_sim_dir, num_of_dumps, file_prefix, s):
-    # get all dump stat
-    stats = []
+def read_all_dumps(whole_sim_dir, num_of_dumps, plan):
+    # get all dump stats, dumps[dump][group id][stat id], reading each dump file once
+    dumps = []
     for dump in range(num_of_dumps):
-        stats.append(get_acc_stat_from_file("{}/{}.period.{}".format(whole_sim_dir,
-                                            file_prefix, dump), s.s_name, s.pos))
+        dumps.append(plan.read(whole_sim_dir, ".period.{}".format(dump)))
 
     # whole stat safe check
     # do not know the position of cumulative stat
     # assert(whole_stat == get_acc_stat_from_file("{}/{}.period.{}".format(whole_sim_dir,
     #                                             file_prefix, num_of_dumps), s.s_name, s.pos))
 
-    return stats
+    return dumps
 
 def calculate_weighted_average_for_stat(points, stats):
     weighted_average = 0
@@ -250,10 +249,12 @@ if __name__ == "__main__":
 
     assert len(labels) == num_of_dumps
 
+    dumps = read_all_dumps(WHOLESIMDIR, num_of_dumps, StatPlan(stat_groups))
+
     for g_id, g in enumerate(stat_groups):
         print(g.g_name)
         for s_id, s in enumerate(g.s_list):
-            stats = read_all_for_stat(WHOLESIMDIR, num_of_dumps, g.f_name, s)
+            stats = [dump[g_id][s_id] for dump in dumps]
             assert len(stats) == num_of_dumps
             if g_id == 0 and s_id == 0:
                 assert g.g_name == "instructions", "the first group stat needs to be instructions"
@@ -1,7 +1,6 @@
 from gather_cluster_results import *
+from job_scheduler import Job, run_jobs
 import os, sys
-import subprocess
-from time import sleep
 import shutil
 # pip install plotly==5.18.0
 import plotly.graph_objects as go
@@ -31,7 +30,7 @@ def get_top_simpoint(simpoints):
 
 # ub: upper bound in M
 def run_vary_warmup_legth(SCARABHOME, MODULESDIR, TRACEFILE, OUTDIR, segID, SEGSIZE, ub):
-    p_list = []
+    jobs = []
     warmup_unit = 1000000
     seg_root = OUTDIR + "/" + str(segID)
     os.makedirs(seg_root, exist_ok=True)
@@ -79,33 +78,25 @@ def run_vary_warmup_legth(SCARABHOME, MODULESDIR, TRACEFILE, OUTDIR, segID, SEGS
                         "--inst_limit", str(instLimit),
                         "--full_warmup", str(WARMUP)
                         ]
-            # log file at cur dir
-            log_file = "./sim.log"
+            # log file at the warmup dir
             print(scarab_cmd, flush=True)
-            with open(log_file, "w") as outfile:
-                p_list.append(subprocess.Popen(scarab_cmd, stdout=outfile, shell=False))
-            while True:
-                live = 0
-                for p in p_list:
-                    if p.poll() is None:
-                        live += 1
-                if live < 40:
-                    break
-                else:
-                    sleep(120)
+            jobs.append(Job("warmup_" + os.path.basename(warmup_dir), scarab_cmd, cwd=warmup_dir, log=warmup_dir + "/sim.log"))
 
     print("wait for all warm-up runs to finish...")
-    for p in p_list:
-        p.wait()
+    run_jobs(jobs, status_file=seg_root + "/warmup.status")
 
 def plot(OUTDIR, segID, ub):
     seg_root = OUTDIR + "/" + str(segID)
     warmup_dir_list = [seg_root + "/" + str(WARMUP) for WARMUP in range(ub+1)]
 
-    for g in stat_groups:
+    # every stat of every warmup run, each stat file read once
+    plan = StatPlan(stat_groups)
+    warmup_vals = [plan.read(warmup_dir) for warmup_dir in warmup_dir_list]
+
+    for g_id, g in enumerate(stat_groups):
         fig = go.Figure()
-        for s in g.s_list:
-            y_vals=[get_acc_stat_from_file(warmup_dir + "/" + g.f_name, s.s_name, s.pos) for warmup_dir in warmup_dir_list]
+        for s_id, s in enumerate(g.s_list):
+            y_vals=[vals[g_id][s_id] for vals in warmup_vals]
             fig.add_trace(
                 go.Scatter(
                     x=list(range(len(y_vals))),
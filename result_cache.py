@@ -0,0 +1,203 @@
+import argparse
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import sys
+
+# Results of trace based scarab simulations, shared across experiments. Descriptors repeat the same
+# params under different experiment names, a simulation already done by any of them is linked in.
+#
+# The key hashes what decides the result of a simulation:
+#   the scarab binary, by content
+#   the PARAMS.<arch> file, by content
+#   the options of the scarab command, normalized (sorted, the last value of an option wins). Options
+#   naming a file (the trace) count by path, size and modification time, a directory by its path.
+#   The roi, inst_limit and warmup are options too
+# An entry is <cache dir>/<key[:2]>/<key>/ holding every file scarab wrote into the simulation directory
+# and result_key.json, the inputs of the key. store copies the files in, fetch hard links them out when it
+# can and lists them in result_fetched.json. Before scarab runs in the directory again, unlink drops the
+# files of that list still linked to the entry (see run_scarab_mode_4.sh), or scarab would rewrite the
+# cache entry in place. Other files of the directory are left alone.
+#
+# The cache dir is $SCARAB_RESULT_CACHE, $HOME/simpoint_flow/result_cache by default, "none" disables it.
+
+key_version = 1
+
+# inputs of the key, written next to the simulation by key
+key_file = "result_key.json"
+
+# files fetch linked into a simulation directory, with the entry they are linked to
+fetched_file = "result_fetched.json"
+
+# files of a simulation directory that are not results of scarab
+not_result_files = ["sim.log", "PARAMS.in", key_file, fetched_file]
+
+# files of a simulation directory kept in the cache: the stat files (*.stat.0.csv, *.stat.0.out,
+# ramulator.stat.out...), PARAMS.out and whatever else scarab writes
+def is_result_file(file):
+    return file not in not_result_files and not file.endswith(".tmp")
+
+def cache_dir():
+    path = os.getenv("SCARAB_RESULT_CACHE", str(os.getenv("HOME")) + "/simpoint_flow/result_cache")
+    if path == "none":
+        return None
+    return path
+
+def entry_dir(key):
+    return os.path.join(cache_dir(), key[:2], key)
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def path_identity(value):
+    # what a path option stands for in the key, the value itself if it's not a path
+    if os.path.isfile(value):
+        stat = os.stat(value)
+        return [os.path.realpath(value), stat.st_size, stat.st_mtime_ns]
+    if os.path.isdir(value):
+        return os.path.realpath(value)
+    return value
+
+redirections = ("&>", ">>", ">", "1>", "2>")
+
+def normalize_command(command):
+    # (binary, {option: value}) of a scarab command line. Redirections are dropped
+    tokens = shlex.split(command)
+    options = {}
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith(redirections):
+            # "&> sim.log" or "&>sim.log"
+            i += 2 if token in redirections else 1
+            continue
+        if token.startswith("--"):
+            if "=" in token:
+                name, value = token[2:].split("=", 1)
+            elif i + 1 < len(tokens) and not tokens[i + 1].startswith(("--",) + redirections):
+                name, value = token[2:], tokens[i + 1]
+                i += 1
+            else:
+                name, value = token[2:], ""
+            options[name] = path_identity(value)
+        else:
+            options.setdefault("", []).append(path_identity(token))
+        i += 1
+    return tokens[0], dict(sorted(options.items()))
+
+def key_inputs(params_file, command):
+    binary, options = normalize_command(command)
+    return {"version": key_version,
+            "binary": file_digest(binary),
+            "params_file": file_digest(params_file),
+            "options": options}
+
+def result_key(inputs):
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def link_or_copy(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def has(key):
+    return cache_dir() != None and os.path.isdir(entry_dir(key))
+
+def fetch(key, out_dir):
+    # links the cached results of key into out_dir, False if there are none
+    if not has(key):
+        return False
+
+    entry = entry_dir(key)
+    files = [file for file in os.listdir(entry) if is_result_file(file)]
+    os.makedirs(out_dir, exist_ok=True)
+    # links of an earlier fetch, maybe of another key
+    unlink(out_dir)
+    for file in files:
+        link_or_copy(os.path.join(entry, file), os.path.join(out_dir, file))
+        # results count as written now, see experiment_manifest.py
+        os.utime(os.path.join(out_dir, file))
+    with open(os.path.join(out_dir, fetched_file), "w") as f:
+        json.dump({"key": key, "entry": entry, "files": files}, f, indent=1)
+    print("result cache hit {}: {} files linked into {}".format(key, len(files), out_dir))
+    return True
+
+def unlink(out_dir):
+    # removes the files fetch linked into out_dir that are still links to the cache entry
+    fetched_path = os.path.join(out_dir, fetched_file)
+    if not os.path.exists(fetched_path):
+        return
+    with open(fetched_path, "r") as f:
+        fetched = json.load(f)
+
+    # the entry recorded by fetch, the cache dir may have changed since
+    for file in fetched["files"]:
+        path = os.path.join(out_dir, file)
+        cached = os.path.join(fetched["entry"], file)
+        if os.path.exists(path) and os.path.exists(cached) and os.path.samefile(path, cached):
+            os.remove(path)
+    os.remove(fetched_path)
+
+def store(key, out_dir):
+    # adds the results in out_dir under key, if the simulation finished
+    if cache_dir() == None or has(key):
+        return
+    if not os.path.exists(os.path.join(out_dir, "memory.stat.0.csv")):
+        print("WARN: {} has no memory.stat.0.csv, not caching it".format(out_dir))
+        return
+
+    entry = entry_dir(key)
+    tmp = "{}.{}.tmp".format(entry, os.getpid())
+    try:
+        os.makedirs(tmp)
+        for file in os.listdir(out_dir):
+            if is_result_file(file) and os.path.isfile(os.path.join(out_dir, file)):
+                # a copy, the simulation directory may be written again
+                shutil.copy2(os.path.join(out_dir, file), os.path.join(tmp, file))
+        if os.path.exists(os.path.join(out_dir, key_file)):
+            shutil.copy(os.path.join(out_dir, key_file), os.path.join(tmp, key_file))
+        # another simulation of the same key may have finished first, keep that one
+        os.rename(tmp, entry)
+    except OSError as e:
+        if not os.path.isdir(entry):
+            print("WARN: can't cache {}: {}".format(out_dir, e))
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cache of scarab simulation results keyed by their inputs')
+    parser.add_argument('command', choices=['key', 'has', 'fetch', 'store', 'unlink'],
+                        help='key <PARAMS file> <scarab command> [<dir>] prints the key and saves its inputs in dir, '
+                             'has <key> exits 1 on a miss, fetch <key> <dir> exits 1 on a miss, store <key> <dir>, '
+                             'unlink <dir> drops what fetch linked into dir')
+    parser.add_argument('arguments', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'key':
+        if len(args.arguments) not in [2, 3]:
+            print("ERR: key takes <PARAMS file> <scarab command> [<dir>]")
+            sys.exit(1)
+        inputs = key_inputs(args.arguments[0], args.arguments[1])
+        if len(args.arguments) == 3:
+            with open(os.path.join(args.arguments[2], key_file), "w") as f:
+                json.dump(inputs, f, indent=1)
+        print(result_key(inputs))
+    elif args.command == 'has':
+        sys.exit(0 if has(args.arguments[0]) else 1)
+    elif args.command == 'unlink':
+        unlink(args.arguments[0])
+    elif len(args.arguments) != 2:
+        print("ERR: {} takes <key> <dir>".format(args.command))
+        sys.exit(1)
+    elif args.command == 'fetch':
+        sys.exit(0 if fetch(args.arguments[0], args.arguments[1]) else 1)
+    else:
+        store(args.arguments[0], args.arguments[1])
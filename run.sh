@@ -97,9 +97,13 @@ mkdir -p $OUTDIR
 
 source utilities.sh
 
+# the steps below run through orchestrator.py, which owns their processes and reports as soon as they finish
+export ORCHESTRATOR_SOCKET=/tmp/orchestrator_${USER}_$$.sock
+python3 orchestrator.py start || exit 1
+trap "python3 orchestrator.py shutdown" EXIT
+
 # build docker images and start containers
 echo "build docker images and start containers.."
-taskPids=()
 start=`date +%s`
 while read APPNAME ;do
   source setup_apps.sh
@@ -127,62 +131,53 @@ while read APPNAME ;do
 
     # update the script
     docker cp ./run_simpoint_trace.sh $APP_GROUPNAME\_$USER:/usr/local/bin
-    docker exec $ENVVARS --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER run_simpoint_trace.sh "$APPNAME" "$APP_GROUPNAME" "$BINCMD" "$SIMPOINT" "$DRIO_ARGS" &
-    sleep 2
-    while read -r line ;do
-      IFS=" " read PID CMD <<< $line
-      if [ "$CMD" == "/bin/bash /usr/local/bin/run_simpoint_trace.sh $APPNAME $APP_GROUPNAME $BINCMD $SIMPOINT $DRIO_ARGS" ]; then
-        taskPids+=($PID)
-      fi
-    done < <(docker top $APP_GROUPNAME\_$USER -eo pid,cmd)
+    python3 orchestrator.py launch --name $APPNAME --group simpoint/tracing -- docker exec $ENVVARS --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER run_simpoint_trace.sh "$APPNAME" "$APP_GROUPNAME" "$BINCMD" "$SIMPOINT" "$DRIO_ARGS"
   fi
 done < apps.list
 
-wait_for_non_child "simpoint/tracing" "${taskPids[@]}"
+# exit status of run.sh, set when a step fails. The cleanup steps run anyway
+exitStatus=0
+
+if ! wait_for_group "simpoint/tracing"; then
+  echo "ERR: simpoint/tracing failed, see the output above"
+  exitStatus=1
+fi
 end=`date +%s`
 report_time "post-processing" "$start" "$end"
 
-if [ $SCARABMODE ]; then
+# simulations need the traces
+if [ $SCARABMODE ] && [ $exitStatus -ne 0 ]; then
+  echo "skip Scarab simulation, tracing failed"
+fi
+
+if [ $SCARABMODE ] && [ $exitStatus -eq 0 ]; then
   # run Scarab simulation
   echo "run Scarab simulation.."
-  taskPids=()
   start=`date +%s`
 
   while read APPNAME; do
     source setup_apps.sh
     # update the script
     docker cp ./run_exp_using_descriptor.py $APP_GROUPNAME\_$USER:/usr/local/bin
+    docker cp ./experiment_manifest.py $APP_GROUPNAME\_$USER:/usr/local/bin
+    docker cp ./job_scheduler.py $APP_GROUPNAME\_$USER:/usr/local/bin
+    docker cp ./runtime_history.py $APP_GROUPNAME\_$USER:/usr/local/bin
     if [ "$APP_GROUPNAME" == "allbench_traces" ]; then
       cp ${EXPERIMENT}.json $OUTDIR
-      docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE &
-      while read -r line; do
-        IFS=" " read PID CMD <<< $line
-        if [ "$CMD" == "python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE" ]; then
-          taskPids+=($PID)
-        fi
-      done < <(docker top $APP_GROUPNAME\_$USER -eo pid,cmd)
+      python3 orchestrator.py launch --name $APPNAME --group Scarab-simulation -- docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE
     elif [ "$APP_GROUPNAME" == "isca2024_udp" ] || [ "$APP_GROUPNAME" == "docker_traces" ]; then
       cp ${APP_GROUPNAME}/${EXPERIMENT}.json $OUTDIR
-      docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE &
-      while read -r line; do
-        IFS=" " read PID CMD <<< $line
-        if [ "$CMD" == "python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE" ]; then
-          taskPids+=($PID)
-        fi
-      done < <(docker top $APP_GROUPNAME\_$USER -eo pid,cmd)
+      python3 orchestrator.py launch --name $APPNAME --group Scarab-simulation -- docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -m $SCARABMODE
     else
       cp ${EXPERIMENT}.json $OUTDIR
-      docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -c $BINCMD -m $SCARABMODE &
-      while read -r line; do
-        IFS=" " read PID CMD <<< $line
-        if [ "$CMD" == "python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -c $BINCMD -m $SCARABMODE" ]; then
-          taskPids+=($PID)
-        fi
-      done < <(docker top $APP_GROUPNAME\_$USER -eo pid,cmd)
+      python3 orchestrator.py launch --name $APPNAME --group Scarab-simulation -- docker exec --user $USER --workdir /home/$USER --privileged $APP_GROUPNAME\_$USER python3 /usr/local/bin/run_exp_using_descriptor.py -d $EXPERIMENT.json -a $APPNAME -g $APP_GROUPNAME -c $BINCMD -m $SCARABMODE
     fi
   done < apps.list
 
-  wait_for_non_child "Scarab-simulation" "${taskPids[@]}"
+  if ! wait_for_group "Scarab-simulation"; then
+    echo "ERR: Scarab-simulation failed, see the output above"
+    exitStatus=1
+  fi
   end=`date +%s`
   report_time "Scarab-simulation" "$start" "$end"
 fi
@@ -229,3 +224,5 @@ if [ $CLEANUP ]; then
   end=`date +%s`
   report_time "volume-cleanup" "$start" "$end"
 fi
+
+exit $exitStatus
@@ -8,14 +8,23 @@ OUTDIR=$2
 cd $OUTDIR
 mkdir -p simpoints
 
+# SimPoint only reads text fingerprints, convert binary ones (bbv_format.py) next to them
+if [[ "$FPFILE" == *.bin ]]; then
+  python3 /usr/local/bin/bbv_format.py to_text $FPFILE ${FPFILE%.bin}
+  FPFILE=${FPFILE%.bin}
+fi
+
 lines=($(wc -l $FPFILE))
 # intended to round to nearest int
 # but in fact it is just rouding down
 maxK=$(echo "(sqrt($lines)+0.5)/1" | bc)
 echo "fingerprint size: $lines, maxk: $maxK"
-# binary search with maxK
-spCmd="$tmpdir/simpoint -maxK $maxK -fixedLength off -numInitSeeds 10 -loadFVFile $FPFILE -saveSimpoints $OUTDIR/simpoints/opt.p -saveSimpointWeights $OUTDIR/simpoints/opt.w -saveVectorWeights $OUTDIR/simpoints/vector.w -saveLabels $OUTDIR/simpoints/opt.l -coveragePct .99 &> $OUTDIR/simpoints/simp.opt.log"
-# search every one with maxK
+# binary search with maxK, trying as many K per round as there are cores (simpoint_cluster.py)
+spCmd="python3 /usr/local/bin/simpoint_cluster.py $FPFILE $OUTDIR/simpoints --maxK $maxK --seeds 10 --coverage 0.99 &> $OUTDIR/simpoints/simp.opt.log"
+# the SimPoint 3.2 binary, single threaded
+# spCmd="$tmpdir/simpoint -maxK $maxK -fixedLength off -numInitSeeds 10 -loadFVFile $FPFILE -saveSimpoints $OUTDIR/simpoints/opt.p -saveSimpointWeights $OUTDIR/simpoints/opt.w -saveVectorWeights $OUTDIR/simpoints/vector.w -saveLabels $OUTDIR/simpoints/opt.l -coveragePct .99 &> $OUTDIR/simpoints/simp.opt.log"
+# search every one with maxK, every (K, seed) run in parallel
+# spCmd="python3 /usr/local/bin/simpoint_cluster.py $FPFILE $OUTDIR/simpoints -k 1:$maxK --seeds 1000 --coverage 0.99 &> $OUTDIR/simpoints/simp.opt.log"
 # spCmd="$tmpdir/simpoint -k 1:$maxK -fixedLength off -numInitSeeds 1000 -loadFVFile $FPFILE -saveSimpoints $OUTDIR/simpoints/opt.p -saveSimpointWeights $OUTDIR/simpoints/opt.w -saveVectorWeights $OUTDIR/simpoints/vector.w -saveLabels $OUTDIR/simpoints/opt.l -coveragePct .99 &> $OUTDIR/simpoints/simp.opt.log"
 echo "cluster fingerprint..."
 echo "command: ${spCmd}"
@@ -2,6 +2,9 @@ import json
 import argparse
 import os
 
+import experiment_manifest
+import job_scheduler
+
 def read_descriptor_from_json(filename="experiment.json"):
     # Read the descriptor data from a JSON file
     try:
@@ -28,6 +31,8 @@ def run_experiment():
     parser.add_argument('-g','--application_group_name', required=True, help='Application group name. Usage: -g mongodb')
     parser.add_argument('-c','--binary_command', required=False, help='Binary command. Usage -c /usr/bin/mongd --config /etc/mongod.conf')
     parser.add_argument('-m','--scarab_mode', required=True, help='Scarab mode. Usage -m 2')
+    parser.add_argument('-j','--jobs', type=int, help='(workload, config) units run at once. Default is as many as the budget allows. Usage -j 4')
+    parser.add_argument('--budget', type=int, help='Simulations run at once over all units. Default is one per core, bounded by available memory, or $SCHEDULER_JOBS')
 
     # Parse the command-line arguments
     args = parser.parse_args()
@@ -48,31 +53,86 @@ def run_experiment():
     architecture = descriptor_data["architecture"]
     experiment = descriptor_data["experiment"]
 
-    # Run Scarab
+    # Simulations already done with the same inputs are kept, see experiment_manifest.py
+    sim_root = str(os.getenv('HOME')) + '/simpoint_flow/simulations/'
+    os.makedirs(sim_root, exist_ok=True)
+    manifest = experiment_manifest.Manifest(experiment_manifest.manifest_path(sim_root, experiment), experiment)
+
+    # One unit per (workload, config), run concurrently by job_scheduler.py. Each unit's log is
+    # <experiment>.logs/<workload>.<config>.log, states and exit codes are in <experiment>.units.status.
+    # Ctrl-C or SIGTERM stops every unit and the simulations they started
+    log_dir = sim_root + experiment + '.logs'
+    os.makedirs(log_dir, exist_ok=True)
+    units = []
     for workload in descriptor_data["workloads_list"]:
         for config_key in descriptor_data["configurations"].keys():
-            if args.scarab_mode == '4':
-              exp_path = str(os.getenv('HOME')) + '/simpoint_flow/simulations/' + workload + '/' + experiment + '/' + config_key
-              print(exp_path)
-              if os.path.exists(exp_path+'/ipc.csv'):
-                print(f"The experiment already exists! Change the experiment name.")
-                continue
-            if args.scarab_mode == '5':
-              exp_path = str(os.getenv('HOME')) + '/nonsimpoint_flow/simulations/' + workload + '/' + experiment + '/' +config_key
-              print(exp_path)
-              if os.path.exists(exp_path+'/memory.stat.0.csv'):
-                print(f"The experiment already exists! Change the experiment name.")
-                continue
             config_value = descriptor_data["configurations"][config_key]
+            env = dict(os.environ)
+            if args.scarab_mode in ['4', '5']:
+                exp_path = experiment_manifest.simulation_dir(args.application_name, workload, experiment, config_key, args.scarab_mode)
+                print(exp_path)
+                jobs = manifest_jobs(manifest, args.application_name, workload, experiment, config_key, config_value, architecture, args.scarab_mode)
+                if jobs == None:
+                    continue
+                pending = [job for job in jobs if job["status"] != "done"]
+                if args.scarab_mode == '4':
+                    if pending == [] and os.path.exists(exp_path+'/ipc.csv'):
+                        print(f"All {len(jobs)} simpoints of {workload} {config_key} are done, skipping.")
+                        continue
+                    # run_scarab_mode_4*.sh only simulates these clusters, an empty list only gathers
+                    env["SIMPOINT_CLUSTERS"] = " ".join(str(job["cluster"]) for job in pending)
+                    print(f"{len(pending)} of {len(jobs)} simpoints of {workload} {config_key} to simulate: {env['SIMPOINT_CLUSTERS']}")
+                elif pending == []:
+                    print(f"{workload} {config_key} is done, skipping.")
+                    continue
             if args.application_name == "allbench" or args.application_name == "isca2024":
                 if workload in ["602.gcc_s", "clang", "gcc", "mongodb", "mysql", "postgres", "verilator", "xgboost"]:
                     use_traces_simp = "1"
                 else:
                     use_traces_simp = "0"
-                command = 'run_scarab_allbench.sh "' + workload + '" "' + args.application_group_name + '" "" "' + experiment + '/' + config_key + '" "' + config_value + '" "' + args.scarab_mode + '" "' + architecture + '" "' + use_traces_simp + '"'
+                command = ['run_scarab_allbench.sh', workload, args.application_group_name, "", experiment + '/' + config_key, config_value, args.scarab_mode, architecture, use_traces_simp]
             else:
-                command = 'run_scarab.sh "' + args.application_name + '" "' + args.application_group_name + '" "' + args.binary_command + '" "' + experiment + '/' + config_key + '" "' + config_value + '" "' + args.scarab_mode + '" "' + architecture + '"'
-            os.system(command)
+                command = ['run_scarab.sh', args.application_name, args.application_group_name, args.binary_command or "", experiment + '/' + config_key, config_value, args.scarab_mode, architecture]
+            units.append((workload, config_key, config_value, job_scheduler.Job(workload + '/' + config_key, command, log=log_dir + '/' + workload + '.' + config_key + '.log', env=env)))
+
+    # the budget is shared: units at once times the simulations each runs stays within it
+    budget = args.budget if args.budget != None else job_scheduler.default_workers()
+    workers = max(1, min(len(units), args.jobs if args.jobs != None else budget))
+    for _, _, _, unit in units:
+        unit.env["SCHEDULER_JOBS"] = str(max(1, budget // workers))
+    failed = job_scheduler.run_jobs([unit for _, _, _, unit in units], workers, sim_root + experiment + '.units.status')
+
+    if args.scarab_mode in ['4', '5']:
+        for workload, config_key, config_value, unit in units:
+            jobs = manifest_jobs(manifest, args.application_name, workload, experiment, config_key, config_value, architecture, args.scarab_mode,
+                                 unit.exit_code if args.scarab_mode == '5' else None)
+            if jobs != None:
+                pending = [str(job["cluster"]) + " " + job["status"] for job in jobs if job["status"] != "done"]
+                print(f"{workload} {config_key}: {len(jobs) - len(pending)} of {len(jobs)} done" + (", not done: " + ", ".join(pending) if pending else ""))
+        manifest.save()
+        print(f"Manifest written to {manifest.path}")
+
+    for workload, config_key, _, unit in units:
+        if unit in failed:
+            print(f"See {unit.log} for {workload} {config_key}")
+    if failed:
+        exit(1)
+
+def manifest_jobs(manifest, application_name, workload, experiment, config_key, config_value, architecture, mode, exit_code = None):
+    # refreshes the manifest jobs of a (workload, config), one per simpoint in mode 4 and one in mode 5
+    exp_path = experiment_manifest.simulation_dir(application_name, workload, experiment, config_key, mode)
+    inputs = {"params": config_value, "architecture": architecture}
+    if mode == '5':
+        return [manifest.update(workload, config_key, "-", exp_path, inputs, exit_code)]
+
+    sp_dir = experiment_manifest.simpoints_dir(application_name, workload)
+    try:
+        clusters = experiment_manifest.read_clusters(sp_dir)
+    except (OSError, ValueError) as e:
+        print(f"ERR: can't read simpoints of {workload} in {sp_dir}: {e}")
+        return None
+    return [manifest.update(workload, config_key, c_id, exp_path + '/' + str(seg_id), dict(inputs, segment=seg_id, simpoints=sp_dir))
+            for c_id, seg_id in clusters]
 
 if __name__ == "__main__":
     run_experiment()
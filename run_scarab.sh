@@ -68,7 +68,7 @@ if [ "$SCARABMODE" == "4" ]; then
     fi
     SEGSIZE=$(cat "$segmentSizeFile")
     echo "SEGSIZE read from $segmentSizeFile is $SEGSIZE"
-    bash run_scarab_mode_4.sh "$SCARABHOME" "$MODULESDIR" "$TRACEFILE" "$SCARABPARAMS" "$SPDIR" "$SEGSIZE" "$OUTDIR" "$WARMUP" "$SCARABARCH"
+    SIM_CONFIG=${SCENARIONUM#*/} bash run_scarab_mode_4.sh "$SCARABHOME" "$MODULESDIR" "$TRACEFILE" "$SCARABPARAMS" "$SPDIR" "$SEGSIZE" "$OUTDIR" "$WARMUP" "$SCARABARCH"
   else
   # otherwise ask the user to run manually
     echo -e "There are multiple trace files.\n\
@@ -90,7 +90,10 @@ elif [ "$SCARABMODE" == "3" ]; then
 
   ################################################################
   # trace-based or exec-driven simulations
-  taskPids=()
+  # queued in a job file, job_scheduler.py runs them on as many workers as the machine holds
+  mkdir -p $APPHOME/simulations/$SCENARIONUM
+  jobFile=$APPHOME/simulations/$SCENARIONUM/simulations.jobs
+  > $jobFile
   start=`date +%s`
   # simulation in parallel -> use map of trace file
   for clusterID in "${!clusterMap[@]}"
@@ -112,21 +115,17 @@ elif [ "$SCARABMODE" == "3" ]; then
     --pin_stderr=\"$APPHOME/simulations/$SCENARIONUM/$clusterID/pin.err\" \
     "
 
-    echo "simulating cluster ${clusterID}..."
+    echo "queueing cluster ${clusterID}..."
     echo "command: ${scarabCmd}"
-    eval $scarabCmd &
-    taskPids+=($!)
+    # split on whitespace as eval did, so the command fits on one line of the job file
+    printf "%s\t0\t%s\t%s\n" "cluster_$clusterID" "$APPHOME/simulations/$SCENARIONUM/$clusterID" "$(echo $scarabCmd)" >> $jobFile
   done
 
   echo "wait for all simulations to finish..."
-  for taskPid in ${taskPids[@]}; do
-    if wait $taskPid; then
-      echo "simulation process $taskPid success"
-    else
-      echo "simulation process $taskPid fail"
-      exit
-    fi
-  done
+  if ! python3 /usr/local/bin/job_scheduler.py $jobFile --status $APPHOME/simulations/$SCENARIONUM/simulations.status; then
+    echo "simulation fail, see $APPHOME/simulations/$SCENARIONUM/simulations.status"
+    exit
+  fi
   end=`date +%s`
   runtime=$((end-start))
   hours=$((runtime / 3600));
@@ -154,7 +154,7 @@ if [ "$SCARABMODE" == "4" ]; then
   fi
   SEGSIZE=$(cat "$segmentSizeFile")
   echo "SEGSIZE read from $segmentSizeFile is $SEGSIZE"
-  bash run_scarab_mode_4_allbench.sh "$SCARABHOME" "$MODULESDIR" "$TRACEFILE" "$SCARABPARAMS" "$SPDIR" "$SEGSIZE" "$OUTDIR" "$WARMUP" "$SCARABARCH" "$TRACESSIMP"
+  SIM_CONFIG=${SCENARIONUM#*/} bash run_scarab_mode_4_allbench.sh "$SCARABHOME" "$MODULESDIR" "$TRACEFILE" "$SCARABPARAMS" "$SPDIR" "$SEGSIZE" "$OUTDIR" "$WARMUP" "$SCARABARCH" "$TRACESSIMP"
 elif [ "$SCARABMODE" == "3" ]; then
   SIMHOME=$HOME/simpoint_flow/simulations/$APPNAME
   EVALHOME=$HOME/simpoint_flow/evaluations/$APPNAME
@@ -172,7 +172,10 @@ elif [ "$SCARABMODE" == "3" ]; then
 
   ################################################################
   # trace-based or exec-driven simulations
-  taskPids=()
+  # queued in a job file, job_scheduler.py runs them on as many workers as the machine holds
+  mkdir -p $SIMHOME/$SCENARIONUM
+  jobFile=$SIMHOME/$SCENARIONUM/simulations.jobs
+  > $jobFile
   start=`date +%s`
   # simulation in parallel -> use map of trace file
   for clusterID in "${!clusterMap[@]}"
@@ -194,21 +197,17 @@ elif [ "$SCARABMODE" == "3" ]; then
     --pin_stderr=\"$SIMHOME/$SCENARIONUM/$clusterID/pin.err\" \
     "
 
-    echo "simulating cluster ${clusterID}..."
+    echo "queueing cluster ${clusterID}..."
     echo "command: ${scarabCmd}"
-    eval $scarabCmd &
-    taskPids+=($!)
+    # split on whitespace as eval did, so the command fits on one line of the job file
+    printf "%s\t0\t%s\t%s\n" "cluster_$clusterID" "$SIMHOME/$SCENARIONUM/$clusterID" "$(echo $scarabCmd)" >> $jobFile
   done
 
   echo "wait for all simulations to finish..."
-  for taskPid in ${taskPids[@]}; do
-    if wait $taskPid; then
-      echo "simulation process $taskPid success"
-    else
-      echo "simulation process $taskPid fail"
-      exit
-    fi
-  done
+  if ! python3 /usr/local/bin/job_scheduler.py $jobFile --status $SIMHOME/$SCENARIONUM/simulations.status; then
+    echo "simulation fail, see $SIMHOME/$SCENARIONUM/simulations.status"
+    exit
+  fi
   end=`date +%s`
   runtime=$((end-start))
   hours=$((runtime / 3600));
@@ -36,12 +36,23 @@ done < $SPDIR/opt.p.lpt0.99
 
 ################################################################
 # trace-based simulations
-taskPids=()
+# queued in a job file, job_scheduler.py runs them on as many workers as the machine holds
+jobFile=$OUTDIR/simulations.jobs
+> $jobFile
+# what each job simulates, the scheduler starts the longest expected first, see runtime_history.py
+estimatesFile=$OUTDIR/simulations.estimates
+> $estimatesFile
+workload=$(basename $(dirname $SPDIR))
+config=${SIM_CONFIG:-$(basename $OUTDIR)}
 start=`date +%s`
-# simulation in parallel
 # actually array would suffice
 for clusterID in "${!clusterMap[@]}"
 do
+    # SIMPOINT_CLUSTERS lists the clusters to simulate when set, the others are already done
+    if [ -n "${SIMPOINT_CLUSTERS+x}" ] && [[ " $SIMPOINT_CLUSTERS " != *" $clusterID "* ]]; then
+        echo "skipping clusterID ${clusterID}, already simulated"
+        continue
+    fi
     WARMUP=$WARMUPORG
     segID=${clusterMap[$clusterID]}
     mkdir -p $OUTDIR/$segID
@@ -115,17 +126,41 @@ do
 
     fi
 
-    echo "simulating clusterID ${clusterID}, segment $segID..."
+    # results of a simulation with the same inputs, from any experiment, are linked in instead, see result_cache.py
+    cacheKey=$(python3 /usr/local/bin/result_cache.py key $SCARABHOME/src/PARAMS.$SCARABARCH "$scarabCmd" $OUTDIR/$segID)
+    if [ -n "$cacheKey" ]; then
+        # on a miss, results linked in from the cache before are unlinked so scarab doesn't rewrite the cache entry
+        jobCmd="python3 /usr/local/bin/result_cache.py fetch $cacheKey . || { python3 /usr/local/bin/result_cache.py unlink . && $scarabCmd && python3 /usr/local/bin/result_cache.py store $cacheKey . ; }"
+    else
+        jobCmd="python3 /usr/local/bin/result_cache.py unlink . && $scarabCmd"
+    fi
+
+    echo "queueing clusterID ${clusterID}, segment $segID..."
     echo "command: ${scarabCmd}"
-    eval $scarabCmd &
-    taskPids+=($!)
+    printf "%s\t0\t%s\t%s\n" "cluster_$clusterID" "$OUTDIR/$segID" "$jobCmd" >> $jobFile
+    # a cached result takes no time, it would only spoil the history
+    if [ -z "$cacheKey" ] || ! python3 /usr/local/bin/result_cache.py has $cacheKey; then
+        printf "%s\t%s\t%s\t%s\t%s\n" "cluster_$clusterID" "$workload" "$segID" "$config" "$instLimit" >> $estimatesFile
+    fi
     cd -
 done
 
-wait_for "simpoint simiulations" "${taskPids[@]}"
+if ! python3 /usr/local/bin/job_scheduler.py $jobFile --status $OUTDIR/simulations.status --history --estimates $estimatesFile; then
+  echo "simpoint simiulations fail, see $OUTDIR/simulations.status"
+  exit
+fi
 end=`date +%s`
 report_time "simpoint simiulations" "$start" "$end"
 
+# only gather once every simpoint has its stats
+for clusterID in "${!clusterMap[@]}"
+do
+    if [ ! -f $OUTDIR/${clusterMap[$clusterID]}/memory.stat.0.csv ]; then
+        echo "simpoint of clusterID ${clusterID} has no results in $OUTDIR/${clusterMap[$clusterID]}, not gathering"
+        exit
+    fi
+done
+
 # aggregate the simulation results
 cd $OUTDIR
 python3 gather_cluster_results.py $SPDIR $OUTDIR
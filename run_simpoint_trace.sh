@@ -122,7 +122,7 @@ if [ "$SIMPOINT" == "2" ]; then
   fi
 
   # clustering
-  bash run_clustering.sh $APPHOME/fingerprint/bbfp $APPHOME
+  bash run_clustering.sh $APPHOME/fingerprint/bbfp.bin $APPHOME
 
 elif [ "$SIMPOINT" == "1" ]; then
   # dir for all relevant data: fingerprint, traces, log, sim stats...
@@ -64,14 +64,15 @@ echo "final SEGSIZE is $SEGSIZE, written to $OUTDIR/fingerprint/segment_size"
 echo "$SEGSIZE" > $OUTDIR/fingerprint/segment_size
 
 # post-processing
-taskPids=()
+# queued in a job file, job_scheduler.py runs them on as many workers as the machine holds
+jobFile=$OUTDIR/fingerprint/post_processing.jobs
+> $jobFile
 start=`date +%s`
 
 for segmentID in $(seq 0 $(( $numSegment-1 )))
 do
   mkdir $segmentID
   # do not care about the params file
-  cd $segmentID
   scarabCmd="$HOME/scarab/src/scarab --frontend memtrace \
             --cbp_trace_r0=$TRACEFILE \
             --memtrace_modules_log=$MODULESDIR \
@@ -83,29 +84,19 @@ do
             --trace_footprint_output=$OUTDIR/fingerprint/footprint_pieces/segment.$segmentID \
             --use_fetched_count=1 \
             &> sim.log"
-  echo "processing segmentID ${segmentID}..."
+  echo "queueing segmentID ${segmentID}..."
   echo "command: ${scarabCmd}"
-  eval $scarabCmd &
-  taskPids+=($!)
-  cd -
-
-  # control the number of processing in paralell
-  if [ "${#taskPids[@]}" -gt 40 ]; then
-    echo "post-processing reaches 40 tasks, wait"
-    if wait ${taskPids[0]}; then
-      echo "${taskPids[0]} success"
-    else
-      echo "${taskPids[0]} fail"
-    fi
-    taskPids=("${taskPids[@]:1}")
-  fi
-
+  printf "%s\t0\t%s\t%s\n" "segment_$segmentID" "$OUTDIR/fingerprint/$segmentID" "$scarabCmd" >> $jobFile
 done
 
-wait_for "post-processing" "${taskPids[@]}"
+if ! python3 /usr/local/bin/job_scheduler.py $jobFile --status $OUTDIR/fingerprint/post_processing.status; then
+  echo "post-processing fail, see $OUTDIR/fingerprint/post_processing.status"
+  exit
+fi
 end=`date +%s`
 report_time "post-processing" "$start" "$end"
 
 # aggregate the fingerprint pieces
-python3 /usr/local/bin/gather_fp_pieces.py $OUTDIR/fingerprint/pieces $numSegment segment
-cp $OUTDIR/fingerprint/pieces/bbfp $OUTDIR/fingerprint/bbfp
\ No newline at end of file
+# kept binary (bbv_format.py) until run_clustering.sh converts it for SimPoint
+python3 /usr/local/bin/gather_fp_pieces.py $OUTDIR/fingerprint/pieces $numSegment segment -j $(nproc) --binary
+cp $OUTDIR/fingerprint/pieces/bbfp.bin $OUTDIR/fingerprint/bbfp.bin
\ No newline at end of file
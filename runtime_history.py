@@ -0,0 +1,95 @@
+import fcntl
+import json
+import os
+
+# Wall time of past simulations, to start the longest ones first (see job_scheduler.py --history).
+# Entries are keyed <workload>/<segment>/<config family> and hold the mean seconds of their runs and the
+# instructions simulated. A job never run before is estimated from its instructions and the KIPS measured
+# on the same workload and config family, falling back to the family, the workload and then all runs.
+#
+# The history is a JSON file shared by every simulation of the machine, updates take a lock on it.
+
+# rough scarab speed for when there is no history at all, only the relative order matters then
+default_kips = 100
+
+def default_history_file():
+    return str(os.getenv('HOME')) + '/simpoint_flow/runtime_history.json'
+
+def config_family(config_key):
+    # baseline/32 -> baseline, fe_ftq_block_num.32/icache_size.64K -> fe_ftq_block_num
+    return config_key.strip().split("/")[0].split(".")[0]
+
+def history_key(workload, segment, config_key):
+    return "/".join([workload, str(segment), config_family(config_key)])
+
+class RuntimeHistory:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def kips(self, key):
+        # measured KIPS of the entries closest to key, None if there are none
+        workload, _, family = key.split("/")
+        for match in [lambda w, f: w == workload and f == family, lambda w, f: f == family,
+                      lambda w, f: w == workload, lambda w, f: True]:
+            instructions = seconds = 0
+            for other, entry in self.entries.items():
+                w, _, f = other.split("/")
+                if match(w, f) and entry["instructions"] and entry["seconds"] > 0:
+                    instructions += entry["instructions"]
+                    seconds += entry["seconds"]
+            if seconds > 0:
+                return instructions / seconds / 1000
+        return None
+
+    def estimate(self, key, instructions = None):
+        # (expected seconds, how it was found: history, kips or default), None seconds if nothing is known
+        if key in self.entries:
+            return self.entries[key]["seconds"], "history"
+        if not instructions:
+            return None, "default"
+        kips = self.kips(key)
+        if kips != None:
+            return instructions / kips / 1000, "kips"
+        return instructions / default_kips / 1000, "default"
+
+    def record(self, runs):
+        # adds (key, seconds, instructions) runs, merged with what other processes recorded meanwhile
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+            for key, seconds, instructions in runs:
+                entry = self.entries.setdefault(key, {"seconds": 0, "runs": 0, "instructions": instructions})
+                entry["seconds"] = (entry["seconds"] * entry["runs"] + seconds) / (entry["runs"] + 1)
+                entry["runs"] += 1
+                if instructions:
+                    entry["instructions"] = instructions
+            tmp = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+def read_estimates(estimates_file):
+    # job name -> (history key, instructions) of a <name>\t<workload>\t<segment>\t<config>\t<instructions> file
+    estimates = {}
+    with open(estimates_file, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 5:
+                name, workload, segment, config_key, instructions = fields
+                estimates[name] = (history_key(workload, segment, config_key), int(instructions) if instructions else None)
+    return estimates
+
+def predicted_makespan(seconds, workers):
+    # makespan of list scheduling jobs of these durations in this order on workers
+    free = [0.0] * max(1, workers)
+    for duration in seconds:
+        i = free.index(min(free))
+        free[i] += duration
+    return max(free)
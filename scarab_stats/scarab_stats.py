@@ -9,87 +9,490 @@ import matplotlib
 import json
 import os
 import math
+import time
+import hashlib
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 def get_elem(l, i):
     return list(map(lambda x:x[i], l))
 
+# Rows of a saved experiment csv that hold simpoint metadata rather than stats
+metadata_rows = ["Experiment",
+                 "Architecture",
+                 "Configuration",
+                 "Workload",
+                 "Segment Id",
+                 "Cluster Id",
+                 "Weight"]
+
+# Metadata that repeats for many simpoints, stored as pandas categoricals
+categorical_metadata = ["Experiment", "Architecture", "Configuration", "Workload"]
+
+def empty_metadata():
+    metadata = pd.DataFrame({"Experiment": pd.Categorical([]),
+                             "Architecture": pd.Categorical([]),
+                             "Configuration": pd.Categorical([]),
+                             "Workload": pd.Categorical([]),
+                             "Segment Id": pd.Series(dtype="int64"),
+                             "Cluster Id": pd.Series(dtype="int64"),
+                             "Weight": pd.Series(dtype="float64")})
+    metadata.index.name = "simpoint"
+    return metadata
+
+# Extensions of saved experiments loaded with pyarrow instead of as csv
+binary_formats = [".parquet", ".feather"]
+
+# Built in derived stats, computed per simpoint. Use as derive_stat("IPC") or inside other equations
+derived_stats = {"IPC": "`Periodic Instructions` / `Periodic Cycles`",
+                 "CPI": "`Periodic Cycles` / `Periodic Instructions`",
+                 "ICACHE_MPKI": "ICACHE_MISS_count / `Periodic Instructions` * 1000",
+                 "ICACHE_MISS_RATE": "ICACHE_MISS_count / (ICACHE_MISS_count + ICACHE_HIT_count)",
+                 "DCACHE_MPKI": "DCACHE_MISS_count / `Periodic Instructions` * 1000",
+                 "DCACHE_MISS_RATE": "DCACHE_MISS_count / (DCACHE_MISS_count + DCACHE_HIT_count)",
+                 "BTB_MPKI": "BTB_ON_PATH_MISS_count / `Periodic Instructions` * 1000",
+                 "ICACHE_MISS_STALL_FRACTION": "INST_LOST_WAIT_FOR_ICACHE_MISS_count / `Periodic Cycles`"}
+
+# Characters that end a stat name in an equation. Names containing them (or spaces) are quoted with `backticks`
+operator_chars = "+-*/()=`"
+number_pattern = re.compile(r"(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+def tokenize_equation(equation: str):
+    '''Splits an equation into (kind, text) tokens. kind is "num", "stat" or the operator itself'''
+    tokens = []
+    i = 0
+    while i < len(equation):
+        c = equation[i]
+
+        if c.isspace():
+            i += 1
+
+        elif c == "`":
+            end = equation.find("`", i + 1)
+            if end == -1:
+                raise ValueError(f"Unclosed ` in '{equation}'")
+            tokens.append(("stat", equation[i + 1:end]))
+            i = end + 1
+
+        elif equation.startswith("**", i):
+            tokens.append(("**", "**"))
+            i += 2
+
+        elif c in operator_chars:
+            tokens.append((c, c))
+            i += 1
+
+        else:
+            # Names run until whitespace or an operator. Numbers are names that are entirely a number,
+            # except exponents like 1e-3 whose sign would otherwise split them
+            number = number_pattern.match(equation, i)
+            end = i
+            while end < len(equation) and not equation[end].isspace() and equation[end] not in operator_chars:
+                end += 1
+
+            if number != None and number.end() >= end:
+                tokens.append(("num", number.group()))
+                i = number.end()
+            else:
+                tokens.append(("stat", equation[i:end]))
+                i = end
+
+    return tokens
+
+class EquationParser:
+    '''Recursive descent parser from tokens to a tree of tuples, which doubles as the key for shared subexpressions:
+    ("num", value), ("stat", name), ("neg", x) or (operator, left, right)
+
+    expr  := term (("+" | "-") term)*
+    term  := unary (("*" | "/") unary)*
+    unary := "-" unary | "+" unary | power
+    power := atom ("**" unary)?
+    atom  := number | stat | "(" expr ")"'''
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def take(self, kind = None):
+        if self.peek() == None or (kind != None and self.peek() != kind):
+            found = "end of equation" if self.peek() == None else f"'{self.tokens[self.i][1]}'"
+            raise ValueError(f"Expected {kind or 'a value'}, found {found}")
+        self.i += 1
+        return self.tokens[self.i - 1]
+
+    def parse(self):
+        tree = self.expr()
+        if self.peek() != None:
+            raise ValueError(f"Unexpected '{self.tokens[self.i][1]}'")
+        return tree
+
+    def expr(self):
+        tree = self.term()
+        while self.peek() in ["+", "-"]:
+            tree = (self.take()[0], tree, self.term())
+        return tree
+
+    def term(self):
+        tree = self.unary()
+        while self.peek() in ["*", "/"]:
+            tree = (self.take()[0], tree, self.unary())
+        return tree
+
+    def unary(self):
+        if self.peek() == "-":
+            self.take()
+            return ("neg", self.unary())
+        if self.peek() == "+":
+            self.take()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        tree = self.atom()
+        if self.peek() == "**":
+            self.take()
+            tree = ("**", tree, self.unary())
+        return tree
+
+    def atom(self):
+        if self.peek() == "(":
+            self.take()
+            tree = self.expr()
+            self.take(")")
+            return tree
+
+        kind, text = self.take()
+        if kind == "num":
+            return ("num", float(text))
+        if kind == "stat":
+            return ("stat", text)
+        raise ValueError(f"Unexpected '{text}'")
+
+def parse_equation(equation: str):
+    '''Splits '<result_name> = <expression>' into the name and expression tree.
+    A bare name from derived_stats is accepted as its built in equation'''
+    tokens = tokenize_equation(equation)
+
+    if len(tokens) == 1 and tokens[0][0] == "stat" and tokens[0][1] in derived_stats:
+        name = tokens[0][1]
+        return name, EquationParser(tokenize_equation(derived_stats[name])).parse()
+
+    if len(tokens) < 3 or tokens[0][0] != "stat" or tokens[1][0] != "=":
+        raise ValueError("Equation should be '<result_name> = ...'")
+
+    return tokens[0][1], EquationParser(tokens[2:]).parse()
+
+# Vectorized operation of each binary operator in an expression tree
+equation_operators = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide, "**": np.power}
+
+def equation_stats(tree):
+    '''Names of every stat used by an expression tree'''
+    if tree[0] == "stat":
+        return [tree[1]]
+    if tree[0] == "num":
+        return []
+    return [stat for child in tree[1:] for stat in equation_stats(child)]
+
+def pair_sums(values, codes, weights, num_pairs: int):
+    '''Weighted sums over the last axis of values (..., simpoints) into (..., num_pairs), each simpoint
+    going to the pair of its code. A pair only sums its own simpoints, so a NaN in one pair leaves the
+    others alone. Simpoints with no weight or a code of -1 are skipped, pairs without simpoints are 0'''
+    keep = (weights != 0) & (codes >= 0)
+    order = np.argsort(codes[keep], kind="stable")
+    kept_codes = codes[keep][order]
+    weighted = (values[..., keep] * weights[keep])[..., order]
+
+    sums = np.zeros(values.shape[:-1] + (num_pairs,))
+    if len(kept_codes) > 0:
+        starts = np.flatnonzero(np.r_[True, kept_codes[1:] != kept_codes[:-1]])
+        sums[..., kept_codes[starts]] = np.add.reduceat(weighted, starts, axis=-1)
+    return sums
+
 class Experiment:
-    def __init__(self, stats):
-        '''Stats is either a path to saved experiment or list of stats'''
-        if type(stats) == str:
-            self.data = pd.read_csv(stats, low_memory=False)
+    def __init__(self, stats, load_stats: List[str] = None, configurations: List[str] = None, workloads: List[str] = None):
+        '''Stats is either a path to saved experiment or list of stats
+
+        data is a float64 frame with one row per stat and one column per simpoint.
+        simpoints holds the metadata of every simpoint column, one row per simpoint.
+        load_stats, configurations and workloads select what to read from parquet/feather files.'''
+        # Simpoints added with add_simpoint, merged into data by defragment
+        self._pending = []
+
+        # Simpoints whose simulations had not finished when loaded, column label -> directory.
+        # Their columns are all nan until filled by refresh
+        self.missing = {}
+
+        # stat_aggregator that loaded the experiment from simulations, used by refresh
+        self.loader = None
+
+        # Simulation directory of every simpoint column, when loaded from simulations
+        self.directories = {}
+
+        # Lazily loaded experiments only hold the stats read so far in data. stat_index maps
+        # config -> {stat: file holding it}, known_stats is every stat that can be read
+        self.stat_index = None
+        self.known_stats = []
 
+        # Every equation derived so far, in order. Replayed on simpoints filled by refresh, so a
+        # stat redefined from itself (IPC = IPC * 2) is rebuilt from base stats the same way
+        self.derived = []
+
+        if type(stats) == str and os.path.splitext(stats)[1] in binary_formats:
+            self.read_binary(stats, load_stats, configurations, workloads)
+
+        elif type(stats) == str:
+            self.read_csv(stats)
+
+        else:
+            self.data = pd.DataFrame(index=pd.Index(stats, name="stats"), dtype="float64")
+            self.simpoints = empty_metadata()
+
+    def read_csv(self, path:str):
+        raw = pd.read_csv(path, index_col=0, low_memory=False)
+        raw.index.name = "stats"
+
+        metadata = raw.loc[metadata_rows].T
+        metadata.index.name = "simpoint"
+        for row in categorical_metadata:
+            metadata[row] = metadata[row].astype("category")
+        metadata["Segment Id"] = pd.to_numeric(metadata["Segment Id"]).astype("int64")
+        metadata["Cluster Id"] = pd.to_numeric(metadata["Cluster Id"]).astype("int64")
+        metadata["Weight"] = pd.to_numeric(metadata["Weight"]).astype("float64")
+
+        # Cast once on load so nothing downstream has to
+        self.data = raw.drop(index=metadata_rows).astype("float64")
+        self.simpoints = metadata
+
+    def read_binary(self, path:str, stats: List[str] = None, configurations: List[str] = None, workloads: List[str] = None):
+        '''Loads a parquet or feather file written by to_parquet/to_feather.
+
+        Only the requested stat columns are read from disk. Parquet files hold one row group per
+        configuration, so rows of other configurations are skipped using the row group statistics.'''
+        import pyarrow.parquet as pq
+        import pyarrow.feather as feather
+
+        columns = None if stats == None else ["simpoint"] + metadata_rows + list(stats)
+
+        if path.endswith(".parquet"):
+            filters = []
+            if configurations != None: filters.append(("Configuration", "in", list(configurations)))
+            if workloads != None: filters.append(("Workload", "in", list(workloads)))
+            table = pq.read_table(path, columns=columns, filters=filters if filters != [] else None)
         else:
-            self.data = pd.DataFrame()
-            rows = stats.copy()
-            rows.append("Experiment")
-            rows.append("Architecture")
-            rows.append("Configuration")
-            rows.append("Workload")
-            rows.append("Segment Id")
-            rows.append("Cluster Id")
-            rows.append("Weight")
-
-            self.data["stats"] = rows
+            table = feather.read_table(path, columns=columns, memory_map=True)
+
+        frame = table.to_pandas().set_index("simpoint")
+
+        # Feather has no predicate pushdown, filter after the projected read
+        if configurations != None: frame = frame[frame["Configuration"].isin(configurations)]
+        if workloads != None: frame = frame[frame["Workload"].isin(workloads)]
+
+        metadata = frame[metadata_rows].copy()
+        for row in categorical_metadata:
+            metadata[row] = metadata[row].astype("object").astype("category")
+        self.simpoints = metadata
+
+        self.data = frame.drop(columns=metadata_rows).T.astype("float64")
+        self.data.index.name = "stats"
+
+        saved = json.loads((table.schema.metadata or {}).get(b"scarab_stats", b"{}"))
+        self.missing = {label: directory for label, directory in saved.get("missing", {}).items() if label in self.data.columns}
+
+    def to_arrow(self):
+        '''Experiment as an arrow table with one row per simpoint, metadata columns then stats'''
+        import pyarrow as pa
+        self.require_stats(self.known_stats)
+        self.defragment()
+
+        frame = pd.concat([self.simpoints, self.data.T], axis=1)
+        frame.index.name = "simpoint"
+        table = pa.Table.from_pandas(frame.reset_index(), preserve_index=False)
+
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"scarab_stats"] = json.dumps({"missing": self.missing}).encode()
+        return table.replace_schema_metadata(metadata)
+
+    def to_parquet(self, path:str):
+        '''Saves experiment as parquet, one row group per configuration'''
+        import pyarrow.parquet as pq
+        import pyarrow.compute as pc
+
+        table = self.to_arrow()
+        with pq.ParquetWriter(path, table.schema, compression="zstd") as writer:
+            for config in self.get_configurations():
+                writer.write_table(table.filter(pc.equal(table["Configuration"].cast("string"), config)))
+
+    def to_feather(self, path:str):
+        '''Saves experiment as feather (arrow ipc), which is memory mapped on load'''
+        import pyarrow.feather as feather
+        feather.write_feather(self.to_arrow(), path, compression="zstd")
 
     def add_simpoint(self, simpoint_data, experiment, arch, config, workload, seg_id, c_id, weight):
-        column = simpoint_data
-        column.append(experiment)
-        column.append(arch)
-        column.append(config)
-        column.append(workload)
-        column.append(seg_id)
-        column.append(c_id)
-        column.append(weight)
+        label = f"{config} {workload} {c_id}"
+        self._pending.append((label, np.asarray(simpoint_data, dtype="float64"),
+                              [experiment, arch, config, workload, int(seg_id), int(c_id), float(weight)]))
+
+    def defragment(self):
+        '''Merge simpoints added since the last call into data and simpoints'''
+        if self._pending == []:
+            return
+
+        labels = [label for label, _, _ in self._pending]
+        columns = np.column_stack([self.data.to_numpy()] + [values for _, values, _ in self._pending])
+        self.data = pd.DataFrame(columns, index=self.data.index, columns=list(self.data.columns) + labels)
+
+        added = pd.DataFrame([row for _, _, row in self._pending], index=labels, columns=metadata_rows)
+        metadata = pd.concat([self.simpoints.astype({row: "object" for row in categorical_metadata}), added])
+        for row in categorical_metadata:
+            metadata[row] = metadata[row].astype("category")
+        metadata = metadata.astype({"Segment Id": "int64", "Cluster Id": "int64", "Weight": "float64"})
+        metadata.index.name = "simpoint"
+        self.simpoints = metadata
+
+        self._pending = []
+
+    def select_simpoints(self, config: List[str], workload: List[str]):
+        '''Boolean mask over simpoint columns whose configuration and workload exactly match one requested'''
+        self.defragment()
+        return (self.simpoints["Configuration"].isin(config) & self.simpoints["Workload"].isin(workload)).to_numpy()
+
+    def aggregate_workloads(self, config: List[str], stats: List[str], workload: List[str]):
+        '''Weighted sum of every stat over the simpoints of each (config, workload) pair.
+
+        Returns a frame indexed by stat with a (Configuration, Workload) column per pair. All stats
+        are aggregated at once, each pair over its own simpoints only (see pair_sums). Pairs without
+        simpoints are 0.'''
+        mask = self.select_simpoints(config, workload)
+        metadata = self.simpoints[mask]
+
+        pairs = pd.MultiIndex.from_product([config, workload], names=["Configuration", "Workload"])
+        codes = pairs.get_indexer(pd.MultiIndex.from_arrays([metadata["Configuration"].astype("object"),
+                                                             metadata["Workload"].astype("object")]))
+
+        values = self.data.loc[stats].to_numpy()[:, mask]
+        sums = pair_sums(values, codes, metadata["Weight"].to_numpy(), len(pairs))
+        return pd.DataFrame(sums, index=pd.Index(stats, name="stats"), columns=pairs)
+
+    def stat_files_of(self, label: str, stats: List[str]):
+        '''Stat files of a lazily loaded simpoint that hold the given stats, in read order'''
+        config = self.simpoints.loc[label, "Configuration"]
+
+        # Configs with no finished simpoint when loaded are indexed once one finishes
+        if config not in self.stat_index:
+            index = self.loader.stat_file_index(self.directories[label])
+            self.stat_index[config] = index
+            self.known_stats += [stat for stat in index if stat not in set(self.known_stats)]
+
+        index = self.stat_index[config]
+        needed = {index[stat] for stat in stats if stat in index}
+        return [file for file in stat_files + ["ramulator.stat.out"] if file in needed]
+
+    def require_stats(self, stats: List[str], num_workers: int = None, use_processes: bool = False):
+        '''Reads the given stats from the simulations of a lazily loaded experiment, if not read yet.
+
+        Only the stat files holding them are parsed. Does nothing for experiments loaded in full'''
+        if self.stat_index == None:
+            return
+        self.defragment()
+
+        known = set(self.known_stats)
+        needed = [stat for stat in dict.fromkeys(stats) if stat in known and stat not in self.data.index]
+        if needed == []:
+            return
+
+        labels = [label for label in self.data.columns if label not in self.missing]
+        files = [self.stat_files_of(label, needed) for label in labels]
+        loaded = self.loader.read_simpoints_concurrently([self.directories[label] for label in labels], num_workers, use_processes, files)
+
+        rows = np.full((len(needed), len(self.data.columns)), np.nan)
+        if labels != []:
+            positions = self.data.columns.get_indexer(labels)
+            rows[:, positions] = np.column_stack([data.reindex(needed).to_numpy() for data in loaded])
+
+        data = pd.concat([self.data, pd.DataFrame(rows, index=needed, columns=self.data.columns)])
 
-        self.data[f"{config} {workload} {c_id}"] = column
+        # Keep stats in file order, derived stats last
+        order = [stat for stat in self.known_stats if stat in data.index]
+        self.data = data.reindex(order + [stat for stat in data.index if stat not in known])
+        self.data.index.name = "stats"
+
+    def fill_simpoints(self, columns: dict):
+        '''Writes loaded stats (label -> float64 series) into existing simpoint columns in place.
+        Stats not seen before are added as new rows, nan for every other simpoint'''
+        self.defragment()
+
+        new_stats = []
+        for values in columns.values():
+            new_stats += [stat for stat in values.index if stat not in self.data.index and stat not in new_stats]
+
+        if new_stats != []:
+            print("WARN: Refreshed simpoints contain new stats, filled with nan elsewhere:", new_stats)
+            self.data = self.data.reindex(list(self.data.index) + new_stats)
+            self.data.index.name = "stats"
+
+        positions = self.data.columns.get_indexer(list(columns.keys()))
+        self.data.iloc[:, positions] = np.column_stack([values.reindex(self.data.index).to_numpy() for values in columns.values()])
+
+        for label in columns.keys():
+            self.missing.pop(label, None)
+
+        # Only the refreshed columns, the others already went through every equation once
+        if self.derived != []:
+            self.derive_stats(self.derived, columns=list(positions))
+
+    def refresh(self, num_workers: int = None, use_processes: bool = False):
+        '''Loads simpoints that finished since the experiment was loaded. Returns their labels'''
+        if self.loader == None:
+            print("ERR: Experiment was not loaded from simulations with load_experiment_json, can't refresh")
+            return []
+
+        return self.loader.refresh_experiment(self, num_workers, use_processes)
 
     def retrieve_stats(self, config: List[str], stats: List[str], workload: List[str], 
         aggregation_level:str = "Workload", simpoints: List[str] = None):
+        self.require_stats(stats)
+        self.defragment()
         results = {}
 
         if aggregation_level == "Workload":
-            for c in config:
-                for w in workload:
-                    selected_simpoints = [col for col in self.data.columns if f"{c} {w}" in col]
-
-                    for stat in stats:
-                        values = list(self.data[selected_simpoints][self.data["stats"] == stat].iloc[0])
-                        weights = list(self.data[selected_simpoints][self.data["stats"] == "Weight"].iloc[0])
-                        values = list(map(float, values))
-                        weights = list(map(float, weights))
-                        results[f"{c} {w} {stat}"] = sum([v*w for v, w in zip(values, weights)])
+            aggregated = self.aggregate_workloads(config, stats, workload).to_numpy()
+            for i, (c, w) in enumerate((c, w) for c in config for w in workload):
+                for j, stat in enumerate(stats):
+                    results[f"{c} {w} {stat}"] = float(aggregated[j, i])
 
         elif aggregation_level == "Simpoint":
+            mask = self.select_simpoints(config, workload)
+            metadata = self.simpoints[mask]
+            values = self.data.loc[stats].to_numpy()[:, mask]
+            positions = {(c, w, str(sp)): i for i, (c, w, sp) in 
+                         enumerate(zip(metadata["Configuration"], metadata["Workload"], metadata["Cluster Id"]))}
+
             for c in config:
                 for w in workload:
 
                     # Set selected simpoints to all possible if not provided
                     if simpoints == None:
-                        selected_simpoints = [col.split(" ")[-1] for col in self.data.columns if f"{c} {w}" in col]
-                    else: selected_simpoints = simpoints
-                    
+                        selected_simpoints = [sp for (pc, pw, sp) in positions if pc == c and pw == w]
+                    else: selected_simpoints = [str(sp) for sp in simpoints]
+
                     for sp in selected_simpoints:
-                        for stat in stats:
-                            col = f"{c} {w} {sp}"
-                            results[f"{c} {w} {sp} {stat}"] = self.data[col][self.data["stats"] == stat].iloc[0]
+                        i = positions[(c, w, sp)]
+                        for j, stat in enumerate(stats):
+                            results[f"{c} {w} {sp} {stat}"] = float(values[j, i])
         
         elif aggregation_level == "Config":
-            for c in config:
-                config_data = {stat:[] for stat in stats}
-                for w in workload:
-                    selected_simpoints = [col for col in self.data.columns if f"{c} {w}" in col]
-
-                    for stat in stats:
-                        values = list(self.data[selected_simpoints][self.data["stats"] == stat].iloc[0])
-                        weights = list(self.data[selected_simpoints][self.data["stats"] == "Weight"].iloc[0])
-                        values = list(map(float, values))
-                        weights = list(map(float, weights))
-                        config_data[stat].append(sum([v*w for v, w in zip(values, weights)]))
-
-                #print(config_data)
-                for stat, val in config_data.items():
-                    results[F"{c} {stat}"] = reduce(lambda x,y: x*y, val) ** (1/len(val))
+            aggregated = self.aggregate_workloads(config, stats, workload).to_numpy()
+
+            # Geometric mean across workloads, columns are grouped by config
+            aggregated = aggregated.reshape(len(stats), len(config), len(workload))
+            config_data = np.prod(aggregated, axis=2) ** (1/len(workload))
+
+            for i, c in enumerate(config):
+                for j, stat in enumerate(stats):
+                    results[F"{c} {stat}"] = float(config_data[j, i])
         
         else:
             print(f"ERROR: Invalid aggreagation level {aggregation_level}.")
@@ -98,130 +501,460 @@ class Experiment:
 
         return results
 
-    def defragment(self):
-        self.data = self.data.copy()
-
     def derive_stat(self, equation:str):
-        # TODO: Doesn't work for stats with spaces in the names
-        # Make sure tokens have space padding
-        single_char_tokens = ["+", "-", "*", "/", "(", ")", "="]
-        equation = "".join([f" {c} " if c in single_char_tokens else c for c in equation])
-        
-        # Tokenize
-        tokens = list(filter(None, equation.split(" ")))
-
-        total_cols = len(self.data)
-        total_setups = len(self.data.iloc[0])
+        '''Derives one stat, see derive_stats'''
+        self.derive_stats([equation])
+
+    def expand_builtins(self, tree, defined, expanding = ()):
+        '''Replaces names from derived_stats that aren't stats of the experiment with their equations'''
+        if tree[0] == "num":
+            return tree
+
+        if tree[0] == "stat":
+            name = tree[1]
+            if name in defined or name in self.data.index or name in self.known_stats or name not in derived_stats:
+                return tree
+            if name in expanding:
+                raise ValueError(f"Built in stat {name} refers to itself")
+            return self.expand_builtins(parse_equation(name)[1], defined, expanding + (name,))
+
+        return (tree[0],) + tuple(self.expand_builtins(child, defined, expanding) for child in tree[1:])
+
+    def derive_stats(self, equations: List[str], columns: List[int] = None):
+        '''Derives stats from equations like '<result_name> = <expression>', or names from derived_stats.
+
+        All equations are compiled first and evaluated in one pass over rows of the stats, so
+        subexpressions shared between equations are computed once. Equations can use the results of
+        earlier ones. Derived stats are computed for the simpoints refreshed later too. columns limits
+        the equations to these simpoint column positions, to replay them on refreshed simpoints. Returns their names'''
+        self.defragment()
+
+        compiled = []
+        defined = set()
+        try:
+            for equation in equations:
+                name, tree = parse_equation(equation)
+                compiled.append((name, self.expand_builtins(tree, defined), equation))
+                defined.add(name)
+        except ValueError as e:
+            print(f"ERR: Can't parse equation. {e}")
+            return []
+
+        # Stats read by each equation must exist before it, either as stats or earlier results
+        needed = []
+        defined = set()
+        for name, tree, equation in compiled:
+            needed += [stat for stat in equation_stats(tree) if stat not in defined]
+            defined.add(name)
+
+        self.require_stats(needed)
+        unknown = [stat for stat in dict.fromkeys(needed) if stat not in self.data.index]
+        if unknown != []:
+            print(f"ERR: Stats used in equations don't exist: {unknown}")
+            return []
+
+        # One float64 block, rows are views into it
+        values = self.data.to_numpy()
+        if columns != None:
+            values = values[:, columns]
+        rows = {stat: i for i, stat in enumerate(self.data.index)}
+        results = {}
+        memo = {}
+
+        def evaluate(tree):
+            if tree in memo:
+                return memo[tree]
+
+            if tree[0] == "num":
+                result = tree[1]
+            elif tree[0] == "stat":
+                result = results[tree[1]] if tree[1] in results else values[rows[tree[1]]]
+            elif tree[0] == "neg":
+                result = -evaluate(tree[1])
+            else:
+                result = equation_operators[tree[0]](evaluate(tree[1]), evaluate(tree[2]))
 
-        #self.data.loc[total_cols] = list(self.data.loc[self.data["stats"] == "Weight"])
-        
-        values = []
-        panda_fy = lambda name: f'lookup["{name}"]'
+            memo[tree] = result
+            return result
 
-        lookup_cols = {old:new for old, new in zip(self.data.T.columns, self.data.T.iloc[0])}
-        str_rows = [list(self.data["stats"]).index(row) for row in ["Experiment","Architecture","Configuration","Workload"]]
+        used = set()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for name, tree, equation in compiled:
+                results[name] = np.broadcast_to(np.asarray(evaluate(tree), dtype="float64"), (values.shape[1],))
 
-        lookup = self.data.T.rename(columns=lookup_cols).drop("stats")
-        str_rows = [lookup.columns[i] for i in str_rows]
-        lookup = lookup.drop(columns=str_rows).astype("float")
-        
-        for i, tok in enumerate(tokens):
-            if i == 0:
-                if tok.isnumeric() or tok in single_char_tokens:
-                    print("ERR: Equation should be '<result_name> = ...'")
-                    return
-                
-                tokens[i] = "values.append(list("
-                values.append(tok)
-                continue
+                # Cached subexpressions may have read the stat just redefined
+                used.update(equation_stats(tree))
+                if name in used:
+                    memo.clear()
 
-            if i == 1:
-                if tok != "=":
-                    print("ERR: Equation should be '<result_name> = ...'")
-                    return
-                tokens[i] = ""
 
-            if not tok.isnumeric() and not tok in single_char_tokens:
-                tokens[i] = panda_fy(tok)
+        # A replay on refreshed columns is already recorded
+        if columns == None:
+            self.derived += [equation for _, _, equation in compiled]
 
-            if tok.isnumeric():
-                tokens[i] = str(tok)
+        new = [name for name in results if name not in rows]
+        if new != []:
+            added = pd.DataFrame(np.nan, index=new, columns=self.data.columns)
+            self.data = pd.concat([self.data, added])
+            self.data.index.name = "stats"
+            rows = {stat: i for i, stat in enumerate(self.data.index)}
 
-        tokens.append("))")
-        to_eval = " ".join(tokens)
+        positions = [rows[name] for name in results]
+        if columns == None:
+            self.data.iloc[positions] = np.vstack([results[name] for name in results])
+        else:
+            self.data.iloc[positions, columns] = np.vstack([results[name] for name in results])
 
-        # TODO: Unsafe!
-        eval(to_eval)
+        return list(results)
 
-        row = [values[0]] + values[1]
-        self.data.loc[total_cols] = row
-        return
-    
     def to_csv(self, path:str):
-        '''Turns selected stats from selected workloads/configs into a pandas dataframe'''
+        '''Saves the experiment in the transposed csv format read by Experiment(path)'''
+        self.require_stats(self.known_stats)
+        self.defragment()
 
-        self.data.to_csv(path, index=False)
+        out = pd.concat([self.data.astype("object"), self.simpoints.astype("object").T])
+        out.index.name = "stats"
+        out.to_csv(path)
 
     def return_raw_data(self, must_contain: list = None, keep_weight: bool = False):
-        # Extra rows added by stat program as metadata
-        metadata = ["Experiment",
-                    "Architecture",
-                    "Configuration",
-                    "Workload",
-                    "Segment Id",
-                    "Cluster Id"]
-        
-        if not keep_weight: metadata.append("Weight")
-        
-        rows_to_drop = [self.data.index[self.data["stats"] == stat][0] for stat in metadata]
+        '''Returns the float64 stats, indexed by stat name'''
+        self.require_stats([stat for stat in self.known_stats if must_contain == None or must_contain in stat])
+        self.defragment()
+        data = self.data
 
         if must_contain != None:
-            bit_map = list(map(lambda x: not must_contain in x, list(self.data["stats"])))
-            rows_to_drop += list(self.data.index[bit_map])
-            #for row in list(self.data["stats"]):
-            #    if must_contain not in row:
-            #        rows_to_drop.append(self.data.index[self.data["stats"] == row][0])
-        
-        return self.data.drop(rows_to_drop)
+            data = data[[must_contain in stat for stat in data.index]]
+
+        if keep_weight:
+            weight = pd.DataFrame([self.simpoints["Weight"].to_numpy()], index=["Weight"], columns=data.columns)
+            data = pd.concat([data, weight])
+            data.index.name = "stats"
+
+        return data
 
     def get_experiments(self):
-        return list(set(list(self.data[self.data["stats"] == "Experiment"].iloc[0])[1:]))
+        self.defragment()
+        return list(self.simpoints["Experiment"].unique())
 
     def get_configurations(self):
-        return list(set(list(self.data[self.data["stats"] == "Configuration"].iloc[0])[1:]))
+        self.defragment()
+        return list(self.simpoints["Configuration"].unique())
 
     def get_workloads(self):
-        return list(set(list(self.data[self.data["stats"] == "Workload"].iloc[0])[1:]))
+        self.defragment()
+        return list(self.simpoints["Workload"].unique())
 
     def get_stats(self):
-        return list(set(self.data["stats"]))
+        return list(set(self.data.index) | set(self.known_stats))
 
     def __repr__(self):
         return str(self)
 
     def __str__(self):
+        self.defragment()
         return f"{', '.join(list(self.data.columns))}"
 
-# Files for pandas to read, does not like the per line data
+# Metadata columns identifying the same simpoint across experiments
+simpoint_keys = ["Configuration", "Workload", "Cluster Id"]
+
+def simpoint_key_index(experiment: Experiment):
+    '''(Configuration, Workload, Cluster Id) of every simpoint column'''
+    experiment.defragment()
+    return pd.MultiIndex.from_arrays([experiment.simpoints[key].astype("object") if key in categorical_metadata
+                                      else experiment.simpoints[key] for key in simpoint_keys], names=simpoint_keys)
+
+def align_experiments(experiments: List[Experiment], stats: List[str], configs: List[str] = None, workloads: List[str] = None):
+    '''Aligns experiments on the simpoints they all have loaded.
+
+    Returns (keys, values, weights). keys is the (Configuration, Workload, Cluster Id) index of the
+    shared simpoints, in the order of the first experiment. values has shape (experiments, stats, simpoints).
+    weights are the simpoint weights of the first experiment'''
+    for experiment in experiments:
+        experiment.require_stats(stats)
+
+    indexes = [simpoint_key_index(experiment) for experiment in experiments]
+
+    # Simpoints still missing in any experiment can't be compared
+    present = [index[~experiment.simpoints.index.isin(list(experiment.missing))] for experiment, index in zip(experiments, indexes)]
+    keys = present[0]
+    for index in present[1:]:
+        keys = keys[keys.isin(index)]
+
+    if configs != None: keys = keys[keys.get_level_values("Configuration").isin(configs)]
+    if workloads != None: keys = keys[keys.get_level_values("Workload").isin(workloads)]
+
+    positions = [index.get_indexer(keys) for index in indexes]
+    values = np.stack([experiment.data.to_numpy()[np.ix_(experiment.data.index.get_indexer(stats), position)]
+                       for experiment, position in zip(experiments, positions)])
+    weights = experiments[0].simpoints["Weight"].to_numpy()[positions[0]]
+
+    return keys, values, weights
+
+# Files for pandas to read as stats. Per line data is read separately, see per_line_files
 stat_files = ["bp.stat.0.csv",
               "core.stat.0.csv",
               "fetch.stat.0.csv",
               "inst.stat.0.csv",
               "l2l1pref.stat.0.csv",
               "memory.stat.0.csv",
-              #"per_branch_stats.csv",
-              #"per_line_icache_line_info.csv",
               "power.stat.0.csv",
               "pref.stat.0.csv",
-              "stream.stat.0.csv"]#,
-              #"uop_queue_fill_cycles.csv",
-              #"uop_queue_fill_pws.csv",
-              #"uop_queue_fill_unique_pws.csv"]
+              "stream.stat.0.csv"]
+
+# Per branch / per cache line tables, one row per address. Too large to hold as stats of an Experiment,
+# read into PerLineStats with stat_aggregator.load_per_line_stats
+per_line_files = ["per_branch_stats.csv",
+                  "per_line_icache_line_info.csv",
+                  "uop_queue_fill_cycles.csv",
+                  "uop_queue_fill_pws.csv",
+                  "uop_queue_fill_unique_pws.csv"]
+
+# Column used as the key of a per line table, the first one found. Otherwise the first column is the key
+per_line_keys = ["cl_addr", "addr", "pc", "branch_addr", "fetch_addr"]
+
+# Module level so process pools can pickle it
+def read_per_line_file(directory: str, file: str, stats: List[str] = None, base: int = None):
+    '''Reads one per line table of a simpoint as (keys, values, stats, base).
+
+    keys is a sorted uint64 array of the unique keys and values a float64 array with one row per key
+    and one column per stat. Keys are hex if prefixed with 0x or containing hex letters, decimal
+    otherwise, unless base is given. Later rows of a duplicated key win'''
+    header = pd.read_csv(f"{directory}{file}", nrows=0, skipinitialspace=True).columns
+    header = [column.strip() for column in header]
+    key = next((column for column in per_line_keys if column in header), header[0])
+
+    df = pd.read_csv(f"{directory}{file}", skipinitialspace=True, dtype={key: str})
+    df.columns = header
+    if stats == None:
+        stats = [column for column in header if column != key and pd.api.types.is_numeric_dtype(df[column])]
+
+    digits = df[key].str.strip()
+    prefixed = digits.str.match("0[xX]")
+    digits = digits.str.replace("^0[xX]", "", regex=True)
+    if base == None:
+        base = 16 if prefixed.any() or digits.str.contains("[a-fA-F]").any() else 10
+
+    keys = np.array([int(digit, base) for digit in digits], dtype=np.uint64)
+    values = df[stats].to_numpy(dtype="float64")
+
+    _, last_reversed = np.unique(keys[::-1], return_index=True)
+    last = len(keys) - 1 - last_reversed
+    return keys[last], values[last], stats, base
+
+class PerLineStats:
+    '''One per line table (see per_line_files) of an experiment, aggregated over the simpoints of every
+    config and workload.
+
+    tables maps (config, workload) -> (keys, values). keys is a sorted uint64 array, values a float64
+    array with one row per key and one column per stat, weighted sums over simpoints as in retrieve_stats.
+    A key a simpoint does not have counts as 0 for it'''
+    def __init__(self, file: str, stats: List[str], base: int):
+        self.file = file
+        self.stats = stats
+        self.base = base
+        self.tables = {}
+
+    def add_simpoint(self, config: str, workload: str, keys, values, weight: float):
+        if not (config, workload) in self.tables:
+            self.tables[(config, workload)] = (keys, weight * values)
+            return
+
+        old_keys, old_values = self.tables[(config, workload)]
+        merged = np.union1d(old_keys, keys)
+        sums = np.zeros((len(merged), len(self.stats)))
+        sums[np.searchsorted(merged, old_keys)] += old_values
+        sums[np.searchsorted(merged, keys)] += weight * values
+        self.tables[(config, workload)] = (merged, sums)
+
+    def format_keys(self, keys):
+        return [hex(key) if self.base == 16 else str(key) for key in keys.tolist()]
+
+    def table(self, config: str, workload: str):
+        '''Stats of one config and workload as a dataframe indexed by the uint64 key'''
+        keys, values = self.tables[(config, workload)]
+        return pd.DataFrame(values, index=pd.Index(keys, name="key"), columns=self.stats)
+
+    def top(self, stat: str, n: int = 10, configs: List[str] = None, workloads: List[str] = None, rank: str = "sum"):
+        '''The n keys of each workload with the largest stat, with one column per config.
+
+        Keys are ranked by their sum or max over configs, or by the value in one config if rank is a config name.
+        Only the stat column of each table is used, so nothing is copied into a dataframe before ranking'''
+        if not stat in self.stats:
+            print(f"ERR: {stat} is not a column of {self.file}. Columns are: {self.stats}")
+            return None
+
+        configs = configs if configs != None else self.get_configurations()
+        workloads = workloads if workloads != None else self.get_workloads()
+        if not rank in ["sum", "max"] and not rank in configs:
+            print("ERR: rank must be sum, max or one of the compared configs")
+            return None
+
+        column = self.stats.index(stat)
+        tables = []
+        for workload in workloads:
+            present = [config for config in configs if (config, workload) in self.tables]
+            if present == []:
+                continue
+
+            keys = reduce(np.union1d, [self.tables[(config, workload)][0] for config in present])
+            values = np.zeros((len(keys), len(present)))
+            for i, config in enumerate(present):
+                config_keys, config_values = self.tables[(config, workload)]
+                values[np.searchsorted(keys, config_keys), i] = config_values[:, column]
+
+            score = values.sum(axis=1) if rank == "sum" else values.max(axis=1) if rank == "max" else values[:, present.index(rank)] if rank in present else np.zeros(len(keys))
+            best = np.argpartition(-score, n - 1)[:n] if len(keys) > n else np.arange(len(keys))
+            best = best[np.argsort(-score[best], kind="stable")]
+
+            table = pd.DataFrame(values[best], columns=present)
+            table.insert(0, "key", self.format_keys(keys[best]))
+            table.insert(0, "Workload", workload)
+            table[rank] = score[best]
+            tables.append(table)
+
+        if tables == []:
+            print("ERR: No tables loaded for the given configs and workloads")
+            return None
+
+        return pd.concat(tables, ignore_index=True)
+
+    def get_configurations(self):
+        return list(dict.fromkeys(config for config, _ in self.tables))
+
+    def get_workloads(self):
+        return list(dict.fromkeys(workload for _, workload in self.tables))
+
+    def __repr__(self):
+        rows = sum(len(keys) for keys, _ in self.tables.values())
+        return f"PerLineStats of {self.file}: {len(self.tables)} config/workload tables, {rows} rows, stats {self.stats}"
+
+class StatCache:
+    '''On-disk cache of parsed simpoint directories, one compressed npz file per directory.
+
+    An entry is only used if the path, size and mtime of every stat file still match, so
+    rerun simpoints are parsed again. Least recently used entries are evicted once the
+    cache grows past max_bytes.'''
+    def __init__(self, path: str = "~/.cache/scarab_stats", max_bytes: int = 256 * 2**20):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+
+    def __getstate__(self):
+        # Locks can't be pickled for process pools, each process gets its own
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def entry_path(self, directory: str):
+        return os.path.join(self.path, hashlib.sha1(os.path.abspath(directory).encode()).hexdigest() + ".npz")
+
+    def fingerprint(self, directory: str, files: List[str], options: str = ""):
+        '''Path, size and mtime of every file. None if a file is missing'''
+        key = [f"{os.path.abspath(directory)} {options}"]
+        for file in files:
+            try:
+                st = os.stat(os.path.join(directory, file))
+            except FileNotFoundError:
+                return None
+            key.append(f"{file} {st.st_size} {st.st_mtime_ns}")
+        return key
+
+    def get(self, directory: str, files: List[str], options: str = ""):
+        '''Returns the cached series of a directory, or None if missing or stale'''
+        key = self.fingerprint(directory, files, options)
+        entry = self.entry_path(directory)
+        if key == None or not os.path.exists(entry):
+            return None
+
+        try:
+            with np.load(entry, allow_pickle=False) as cached:
+                if cached["key"].tolist() != key:
+                    return None
+                data = pd.Series(cached["values"], index=cached["stats"].tolist(), dtype="float64")
+        except (OSError, KeyError, ValueError):
+            print(f"WARN: Ignoring unreadable cache entry {entry}")
+            return None
+
+        # Mark as recently used for eviction
+        os.utime(entry)
+        return data
+
+    def put(self, directory: str, files: List[str], data: pd.Series, options: str = ""):
+        key = self.fingerprint(directory, files, options)
+        if key == None:
+            return
+
+        entry = self.entry_path(directory)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez_compressed(tmp, key=np.array(key), stats=np.array(list(data.index), dtype=str),
+                            values=data.to_numpy(dtype="float64"))
+        size = os.path.getsize(tmp)
+
+        with self.lock:
+            # A rewritten entry only adds the difference to its old size
+            old_size = os.path.getsize(entry) if os.path.exists(entry) else 0
+            os.replace(tmp, entry)
+
+            if self.total_bytes == None:
+                self.total_bytes = self.size()
+            else:
+                self.total_bytes += size - old_size
+
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        '''(last use, size, path) of every entry, least recently used first'''
+        found = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(".npz") or ".tmp." in entry.name:
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            found.append((st.st_mtime, st.st_size, entry.path))
+        return sorted(found)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        '''Removes least recently used entries until the cache is under max_bytes'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        self.total_bytes = 0
+
+# Module level so process pools can pickle it. Reads only the given stat files if files is not None
+def timed_read_simpoint(aggregator, directory, files=None):
+    start = time.perf_counter()
+    data = aggregator.read_simpoint(directory) if files == None else aggregator.read_simpoint_files(directory, files)
+    return data, time.perf_counter() - start
 
 class stat_aggregator:
-    def __init__(self) -> None:
+    def __init__(self, use_cache: bool = True, cache_path: str = "~/.cache/scarab_stats", cache_max_mb: float = 256) -> None:
         self.experiments = {}
         self.simpoint_info = {}
+        self.cache = StatCache(cache_path, int(cache_max_mb * 2**20)) if use_cache else None
 
     def colorwheel(self, x):
         print ((math.cos(2*math.pi*x)+1.5)/2.5, (math.cos(2*math.pi*x+(math.pi/1.5))+1.5)/2.5, (math.cos(2*math.pi*x+2*(math.pi/4))+1.5)/2.5)
@@ -259,93 +992,141 @@ class stat_aggregator:
         return all_stats
         
 
-    # Load simpoint from csv file as pandas dataframe
-    def load_simpoint(self, path, load_ramulator=True, ignore_duplicates = True, return_stats = False, order = None):
-        data = pd.Series(dtype=pd.Float64Dtype)
-        all_stats = []
-        
+    # Load simpoint from csv files as a float64 series indexed by stat name, through the cache if enabled
+    def read_simpoint(self, path, load_ramulator=True, ignore_duplicates = True):
+        files = stat_files + (["ramulator.stat.out"] if load_ramulator else [])
+        options = f"ignore_duplicates={ignore_duplicates}"
+
+        if self.cache != None:
+            data = self.cache.get(path, files, options)
+            if data is not None:
+                return data
+
+        data = self.parse_simpoint(path, load_ramulator, ignore_duplicates)
+
+        if self.cache != None:
+            self.cache.put(path, files, data, options)
+
+        return data
+
+    # Parse the stat files of a simpoint, bypassing the cache
+    def parse_simpoint(self, path, load_ramulator=True, ignore_duplicates = True):
+        parts = []
+        seen = set()
+
         for file in stat_files:
-            filename = f"{path}{file}"
-            df = pd.read_csv(filename).T
-            df.columns = df.iloc[0]
-            df = df.drop(df.index[0])
+            values = self.parse_stat_file(path, file)
 
+            # Stats already read from an earlier file win
             if ignore_duplicates:
-                duplicates = set(df.columns) & set(data.index)
-                
-                if duplicates != set():
-                    df = df.drop(columns=list(duplicates))
-            
-            # Check duplicates in df.columns
-            if True in df.columns.duplicated():
-                print("WARN: CSV file contains duplicates")
-                print("Duplicates are:", set(df.columns[df.columns.duplicated(False)]))
-                print("Checking if issue is resolvable...")
-
-                duplicated = set(df.columns[df.columns.duplicated(False)])
-                equals = [(df[lbl].iloc[0] == df[lbl].iloc[0][0]).all() for lbl in duplicated]
-                if not all(equals):
-                    print(f"ERR: Unable to resolve duplicates. Duplicate columns have unique values. File:{filename}")
-                    exit(1)
-                
-                print("Duplicates equivalent! Resolved")
-                df = df.drop_duplicates()
-            
-            # Check for elements in both
-            if set(df.columns) & set(all_stats) != set():
-                print("ERR: Duplication prevention logic failed")
-                exit(1)
-
-            all_stats += list(df.columns)
-            data = pd.concat([data, df.iloc[0]])
+                values = values[~values.index.isin(seen)]
 
+            seen.update(values.index)
+            parts.append(values)
 
         if load_ramulator:
-            f = open(f"{path}ramulator.stat.out")
-            lines = f.readlines()
+            parts.append(self.parse_stat_file(path, "ramulator.stat.out"))
 
+        data = pd.concat(parts)
+        return data[~data.index.duplicated()]
+
+    # Parse one stat file of a simpoint as a float64 series indexed by stat name
+    def parse_stat_file(self, path, file):
+        filename = f"{path}{file}"
+
+        if file == "ramulator.stat.out":
             tmp = []
             tmp_lbl = []
-            for line in lines:
-                if not "ramulator." in line:
-                    continue
+            with open(filename) as f:
+                for line in f:
+                    if not "ramulator." in line:
+                        continue
 
-                all_stats.append(line.split()[0])
-                tmp_lbl.append(line.split()[0])
-                tmp.append(line.split()[1])
+                    tmp_lbl.append(line.split()[0])
+                    tmp.append(float(line.split()[1]))
 
-            data = pd.concat([data, pd.Series(tmp, index=tmp_lbl)])
+            return pd.Series(tmp, index=tmp_lbl, dtype="float64")
 
-            f.close()
+        df = pd.read_csv(filename)
 
+        # First column holds the stat names, second the values
+        values = pd.Series(df.iloc[:, 1].to_numpy(dtype="float64"), index=df.iloc[:, 0].to_numpy())
 
-        #if order != None:
-        #    tmp = []
-        #    for lbl in order:
-        #        if lbl in list(data.index):
-        #            tmp.append(data[lbl])
-        #        else: tmp.append("nan")
-        
-        # TODO: REmove duplicates. Ramulator duplicated??
+        # Check duplicates in the file
+        if values.index.has_duplicates:
+            print("WARN: CSV file contains duplicates")
+            duplicated = values[values.index.duplicated(keep=False)]
+            print("Duplicates are:", set(duplicated.index))
+            print("Checking if issue is resolvable...")
+
+            if (duplicated.groupby(level=0).nunique(dropna=False) > 1).any():
+                print(f"ERR: Unable to resolve duplicates. Duplicate columns have unique values. File:{filename}")
+                exit(1)
+
+            print("Duplicates equivalent! Resolved")
+            values = values[~values.index.duplicated()]
 
-        if order != None: 
-            data.drop_duplicates()
+        return values
+
+    # Read only some stat files of a simpoint, in the order given. Uses the full cache entry if it is fresh
+    def read_simpoint_files(self, path, files: List[str]):
+        if self.cache != None:
+            data = self.cache.get(path, stat_files + ["ramulator.stat.out"], "ignore_duplicates=True")
+            if data is not None:
+                return data
+
+        if files == []:
+            return pd.Series(dtype="float64")
+
+        data = pd.concat([self.parse_stat_file(path, file) for file in files])
+        return data[~data.index.duplicated()]
+
+    # Map each stat of a simpoint to the file it is read from. Earlier files win, as in parse_simpoint
+    def stat_file_index(self, path, load_ramulator=True):
+        index = {}
+        for file in stat_files + (["ramulator.stat.out"] if load_ramulator else []):
+            for stat in self.parse_stat_file(path, file).index:
+                index.setdefault(stat, file)
+        return index
+
+    # Load simpoint from csv file as list of values, or list of stat names if return_stats
+    def load_simpoint(self, path, load_ramulator=True, ignore_duplicates = True, return_stats = False, order = None):
+        data = self.read_simpoint(path, load_ramulator, ignore_duplicates)
+
+        if return_stats: return list(data.index)
 
         if order != None:
-            data = data.reindex(order, fill_value="nan")
+            data = data.reindex(order)
 
-        data = list(map(float, list(data)))
-        if order != None: print(len(data), len(order))
-            
-        if not return_stats: return data
-        else: return all_stats
+        return list(data)
 
     # Load experiment from saved file
     def load_experiment_csv(self, path):
         return Experiment(path)
 
+    # Read the simpoints of a workload as (cluster id, segment id, weight)
+    def read_simpoint_weights(self, metadata_path):
+        simpoints = []
+        with open(f"{metadata_path}opt.p.lpt0.99", "r") as cluster_ids, open(f"{metadata_path}opt.w.lpt0.99", "r") as weights:
+
+            for cluster_id, weight in zip(cluster_ids.readlines(), weights.readlines()):
+                cluster_id, seg_id_1 = [int(i) for i in cluster_id.split()]
+                weight, seg_id_2 = float(weight.split()[0]), int(weight.split()[1])
+
+                if seg_id_1 != seg_id_2:
+                    print(f"ERROR: Simpoints listed out of order in {metadata_path}opt.p.lpt0.99 and opt.w.lpt0.99.")
+                    print(f"       Encountered {seg_id_1} in .p and {seg_id_2} in .w")
+                    exit(1)
+
+                simpoints.append((cluster_id, seg_id_1, weight))
+
+        return simpoints
+
     # Load experiment form json file, and the corresponding simulations directory
-    def load_experiment_json(self, experiment_file: str, simulations_path: str, simpoints_path: str):
+    # Simpoint directories are read concurrently by num_workers threads (processes if use_processes)
+    # If lazy, stats are only read from the simulations when first used, see Experiment.require_stats
+    def load_experiment_json(self, experiment_file: str, simulations_path: str, simpoints_path: str,
+                             num_workers: int = None, use_processes: bool = False, lazy: bool = False):
         # Load json data from experiment file
         json_data = None
         with open(experiment_file, "r") as file:
@@ -358,87 +1139,176 @@ class stat_aggregator:
         experiment_name = json_data["experiment"]
         architecture = json_data["architecture"]
 
-        known_stats = None
+        # Simpoints are the same for every config, read them once per workload
+        workload_simpoints = {workload: self.read_simpoint_weights(f"{simpoints_path}{workload}/simpoints/")
+                              for workload in json_data["workloads_list"]}
 
-        # Set set of all stats. Should only differ by config
+        # Every simpoint directory to load, in experiment order
+        jobs = []
         for config in json_data["configurations"]:
-            # Use first workload
-            workload = json_data["workloads_list"][0]
-
-            # Get path to the simpoint metadata
-            metadata_path = f"{simpoints_path}{workload}/simpoints/"
-
-            # Get path to the simpoint metadata
-            with open(f"{metadata_path}opt.p.lpt0.99", "r") as cluster_ids, open(f"{metadata_path}opt.w.lpt0.99", "r") as weights:
-
-                cluster_id, weight = (cluster_ids.readlines()[0], weights.readlines()[0])
-                cluster_id, seg_id_1 = [int(i) for i in cluster_id.split()]
-                weight, seg_id_2 = float(weight.split()[0]), int(weight.split()[1])
-
-                if seg_id_1 != seg_id_2:
-                    print(f"ERROR: Simpoints listed out of order in {metadata_path}opt.p.lpt0.99 and opt.w.lpt0.99.")
-                    print(f"       Encountered {seg_id_1} in .p and {seg_id_2} in .w")
-                    exit(1)
-
-                directory = f"{simulations_path}{workload}/{experiment_name}/{config}/{str(cluster_id)}/"
-                print("CHECK", directory)
-
-                a = self.load_simpoint(directory, return_stats=True)
-                if known_stats == None: known_stats = a
+            for workload in json_data["workloads_list"]:
+                for cluster_id, seg_id, weight in workload_simpoints[workload]:
+                    directory = f"{simulations_path}{workload}/{experiment_name}/{config}/{str(cluster_id)}/"
+                    jobs.append((config, workload, seg_id, cluster_id, weight, directory))
+
+        # Simulations still running (or failed) are marked missing instead of read
+        complete = [self.simpoint_complete(job[-1]) for job in jobs]
+        for job, done in zip(jobs, complete):
+            if not done: print(f"MISSING {job[-1]}")
+
+        if lazy:
+            # Only index which file holds each stat, once per config from its first finished simpoint
+            stat_index = {}
+            loaded = []
+            for (config, _, _, _, _, directory), done in zip(jobs, complete):
+                if done and config not in stat_index:
+                    stat_index[config] = self.stat_file_index(directory)
+                    loaded.append(pd.Series(np.nan, index=list(stat_index[config]), dtype="float64"))
                 else:
-                    if set(a) != set(known_stats):
-                        print("WARN: Stats differ across configs")
+                    loaded.append(pd.Series(dtype="float64") if done else None)
+        else:
+            loaded = self.read_simpoints_concurrently([job[-1] for job, done in zip(jobs, complete) if done], num_workers, use_processes)
+            loaded = iter(loaded)
+            loaded = [next(loaded) if done else None for done in complete]
 
-                        # Difference contains new (unseen) stats, and stats which were previously seen but are not present in this config
-                        difference = set(a) - set(known_stats) | set(known_stats) - set(a)
-                        print("Differing stats:", difference)
-                        print("WARN: Differing stats will be resolved by adding empty (nan) values for configs where they don't exist")
+        # Set set of all stats. Should only differ by config
+        known_stats = []
+        known_set = set()
+        checked_configs = set()
+        for (config, _, _, _, _, directory), data in zip(jobs, loaded):
+            if data is None:
+                continue
 
-                        # Only add those which are new
-                        known_stats += list(set(a) - set(known_stats))
+            a = set(data.index)
+            if config not in checked_configs and known_stats != [] and a != known_set:
+                print("WARN: Stats differ across configs")
+
+                # Difference contains new (unseen) stats, and stats which were previously seen but are not present in this config
+                difference = a - known_set | known_set - a
+                print("Differing stats:", difference)
+                print("WARN: Differing stats will be resolved by adding empty (nan) values for configs where they don't exist")
+            checked_configs.add(config)
+
+            # Only add those which are new
+            known_stats += [stat for stat in data.index if stat not in known_set]
+            known_set |= a
+
+        # Create experiment object in one pass over the loaded simpoints
+        experiment = Experiment([] if lazy else known_stats)
+        experiment.loader = self
+        if lazy:
+            experiment.stat_index = stat_index
+            experiment.known_stats = known_stats
+
+        for (config, workload, seg_id, cluster_id, weight, directory), data in zip(jobs, loaded):
+            label = f"{config} {workload} {cluster_id}"
+            experiment.directories[label] = directory
+            if data is None:
+                experiment.missing[label] = directory
+                data = pd.Series(dtype="float64")
+
+            experiment.add_simpoint(data.reindex(experiment.data.index).to_numpy(), experiment_name, architecture, config, workload, seg_id, cluster_id, weight)
+        
+        experiment.defragment()
+        if experiment.missing != {}:
+            print(f"WARN: {len(experiment.missing)} of {len(jobs)} simpoints are missing and set to nan. Use experiment.refresh() to load them once they finish")
+        print("\n\n", experiment)
 
-        if len(known_stats) != len(set(known_stats)):
-            print("ERR: After finding superset, known_stats contains duplicates")
-            duplicates = [a for a in known_stats if known_stats.count(a) > 1]
-            print(f"Duplicates ({len(duplicates)}):", duplicates)
-            exit(1)
+        return experiment
 
-        # Create initial experiment object
-        experiment = None
+    # Load the missing simpoints of an experiment that have finished since it was loaded
+    def refresh_experiment(self, experiment: Experiment, num_workers: int = None, use_processes: bool = False):
+        finished = [label for label, directory in experiment.missing.items() if self.simpoint_complete(directory)]
+        if finished == []:
+            print(f"No new simpoints finished, {len(experiment.missing)} still missing")
+            return []
 
-        # Load each configuration
-        for config in json_data["configurations"]:
+        directories = [experiment.missing[label] for label in finished]
+        if experiment.stat_index == None:
+            loaded = self.read_simpoints_concurrently(directories, num_workers, use_processes)
+        else:
+            # Lazy experiments only read the stats already loaded, the rest are read on use
+            stats = list(experiment.data.index)
+            files = [experiment.stat_files_of(label, stats) for label in finished]
+            loaded = self.read_simpoints_concurrently(directories, num_workers, use_processes, files)
+            loaded = [data.reindex(stats) for data in loaded]
+
+        experiment.fill_simpoints(dict(zip(finished, loaded)))
+
+        print(f"Refreshed {len(finished)} simpoints, {len(experiment.missing)} still missing")
+        return finished
+
+    # A simpoint can be read once scarab has written all of its stat files
+    def simpoint_complete(self, directory, load_ramulator=True):
+        files = stat_files + (["ramulator.stat.out"] if load_ramulator else [])
+        return all(os.path.exists(f"{directory}{file}") for file in files)
+
+    # Read simpoint directories concurrently, returning their series in the order given
+    # files optionally lists the stat files to read from each directory
+    def read_simpoints_concurrently(self, directories: List[str], num_workers: int = None, use_processes: bool = False,
+                                    files: List[List[str]] = None):
+        results = [None] * len(directories)
+        start = time.perf_counter()
+
+        executor_type = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_type(max_workers=num_workers) as executor:
+            futures = {executor.submit(timed_read_simpoint, self, directory, None if files == None else files[i]): i
+                       for i, directory in enumerate(directories)}
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                results[i], elapsed = future.result()
+                print(f"LOADED [{done}/{len(directories)}] {directories[i]} ({elapsed:.2f}s)")
+
+        print(f"Loaded {len(directories)} simpoints in {time.perf_counter() - start:.2f}s")
+        return results
 
-            # Load each workload for each configuration
-            for workload in json_data["workloads_list"]:
+    # Load a per line table (per_line_files) from the simulations of an experiment loaded with load_experiment_json
+    # Simpoints are read concurrently and summed with their weights per (config, workload), see PerLineStats
+    def load_per_line_stats(self, experiment: Experiment, file: str, stats: List[str] = None, configs: List[str] = None,
+                            workloads: List[str] = None, num_workers: int = None, use_processes: bool = False):
+        if experiment.directories == {}:
+            print("ERR: Experiment was not loaded from simulations with load_experiment_json, can't read per line stats")
+            return None
 
-                # Get path to the simpoint metadata
-                metadata_path = f"{simpoints_path}{workload}/simpoints/"
-                with open(f"{metadata_path}opt.p.lpt0.99", "r") as cluster_ids, open(f"{metadata_path}opt.w.lpt0.99", "r") as weights:
+        experiment.defragment()
+        simpoints = experiment.simpoints
+        if configs != None: simpoints = simpoints[simpoints["Configuration"].isin(configs)]
+        if workloads != None: simpoints = simpoints[simpoints["Workload"].isin(workloads)]
+
+        labels = []
+        for label in simpoints.index:
+            directory = experiment.directories[label]
+            if label in experiment.missing or not os.path.exists(f"{directory}{file}"):
+                print(f"MISSING {directory}{file}")
+                continue
+            labels.append(label)
 
-                    for cluster_id, weight in zip(cluster_ids.readlines(), weights.readlines()):
-                        cluster_id, seg_id_1 = [int(i) for i in cluster_id.split()]
-                        weight, seg_id_2 = float(weight.split()[0]), int(weight.split()[1])
+        if labels == []:
+            print(f"ERR: No simpoint has {file}")
+            return None
 
-                        if seg_id_1 != seg_id_2:
-                            print(f"ERROR: Simpoints listed out of order in {metadata_path}opt.p.lpt0.99 and opt.w.lpt0.99.")
-                            print(f"       Encountered {seg_id_1} in .p and {seg_id_2} in .w")
-                            exit(1)
+        # The first simpoint decides the columns and how keys are parsed for the rest
+        start = time.perf_counter()
+        keys, values, stats, base = read_per_line_file(experiment.directories[labels[0]], file, stats)
+        per_line = PerLineStats(file, stats, base)
 
-                        directory = f"{simulations_path}{workload}/{experiment_name}/{config}/{str(cluster_id)}/"
+        executor_type = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_type(max_workers=num_workers) as executor:
+            futures = [executor.submit(read_per_line_file, experiment.directories[label], file, stats, base) for label in labels[1:]]
 
-                        if experiment == None:
-                            experiment = Experiment(known_stats)
-                        
-                        print(f"LOAD {directory}")
-                        data = self.load_simpoint(directory, order=known_stats)
-                        experiment.add_simpoint(data, experiment_name, architecture, config, workload, seg_id_1, cluster_id, weight)
-                        print(f"LOADED")
-        
-        experiment.defragment()
-        print("\n\n", experiment)
+            # Summed in simpoint order so results don't depend on scheduling. Each table is freed once summed
+            for done, label in enumerate(labels, start=1):
+                if done > 1:
+                    keys, values = futures[done - 2].result()[:2]
+                    futures[done - 2] = None
 
-        return experiment
+                config, workload, weight = simpoints.loc[label, ["Configuration", "Workload", "Weight"]]
+                per_line.add_simpoint(config, workload, keys, values, weight)
+                print(f"LOADED [{done}/{len(labels)}] {experiment.directories[label]}{file}")
+
+        print(f"Loaded {file} of {len(labels)} simpoints in {time.perf_counter() - start:.2f}s")
+        return per_line
 
     # Plot graph comparing different configs
     # Aggregate simpoints
@@ -907,177 +1777,170 @@ class stat_aggregator:
             plt.show()
         else: plt.savefig(plot_name)
 
-    # Find diff of all numerical stats to investigate when performance differs
-    def diff_stats_all (self, experiment_baseline: Experiment, experiment_new: Experiment, diff_thresh: float = 50,
-                    must_contain: str = None):
-        # Check experiments are similar
-        configs1 = set(experiment_baseline.get_configurations())
-        workloads1 = set(experiment_baseline.get_workloads())
-        stats1 = set(experiment_baseline.get_stats())
-
-        configs2 = set(experiment_new.get_configurations())
-        workloads2 = set(experiment_new.get_workloads())
-        stats2 = set(experiment_new.get_stats())
-
-        if configs1 != configs2:
-            print("ERR: Configs not the same")
-            return
-
-        if workloads1 != workloads2:
-            print("ERR: Workloads not the same")
-            return
-
-        if stats1 != stats2:
-            print("ERR: Stats not the same")
-            return
-        
-        stats1 = stats1 - set(["Experiment", "Architecture", "Configuration", "Workload"])
-        
-        # Filter for stats that contain required phrase
-        ex_baseline_df = experiment_baseline.return_raw_data(must_contain=must_contain).drop_duplicates()
-        ex_new_df = experiment_new.return_raw_data(must_contain=must_contain).drop_duplicates()
-
-        if list(ex_baseline_df["stats"]) != list(ex_new_df["stats"]):
-            print("ERR: Stats not same after geting data")
-            print("This error should not occur")
-            # Stats were checked earlier...
-            return
-        
-        ex_baseline_df = ex_baseline_df.set_index("stats").astype("float")
-        ex_new_df = ex_new_df.set_index("stats").astype("float")
-        
-        differences =  ex_new_df - ex_baseline_df
-        differences.drop_duplicates(inplace=True)
-        diff_bit_vector = (differences.abs() >= diff_thresh).any(axis=1)
-        differences = differences[diff_bit_vector]
-
-
-        different_stats = list(differences.index)
-        
-        # TODO: Maybe process more? Format and return
-        #print(diff_bit_vector)
-        #print(different_stats)
+    # Compare stats of two or more experiments, simpoint by simpoint, against a baseline experiment
+    def compare_experiments (self, experiments: List[Experiment], stats: List[str] = None, configs: List[str] = None,
+                             workloads: List[str] = None, baseline: int = 0, must_contain: str = None,
+                             aggregation_level: str = "Workload", baseline_config: str = None,
+                             normalize: str = "ratio", rank_by: str = "relative"):
+        '''Returns one row per (experiment, config, workload, stat), or per simpoint if aggregation_level is "Simpoint",
+        ranked by the absolute value of the rank_by column.
+
+        Experiments are aligned once on (Configuration, Workload, Cluster Id). baseline and value are the
+        weighted sums over simpoints, as in retrieve_stats. difference and ratio compare them, relative is
+        difference / |baseline| and std is the weighted standard deviation of the per simpoint differences.
+        If baseline_config is set, every simpoint is first normalized (by ratio or difference) to the weighted
+        sum of baseline_config for the same experiment and workload'''
+        if len(experiments) < 2:
+            print("ERR: Need at least two experiments to compare")
+            return None
 
-        stat_averages = differences.sum(axis=1)/differences.count(axis=1)
-        stat_variances = pd.DataFrame()
-        differences.to_csv("dbg.csv")
+        if not aggregation_level in ["Workload", "Simpoint"]:
+            print(f"ERR: Invalid aggregation level {aggregation_level}. Must be 'Workload' or 'Simpoint'")
+            return None
 
-        dropped = []
+        if not normalize in ["ratio", "difference"]:
+            print("ERR: normalize must be ratio or difference")
+            return None
 
-        for stat in differences.index:
-            if list(differences.index).count(stat) > 1:
-                print("WARN: Duplicate stat found:", stat)
-                dropped.append(stat)
-                continue
+        # Stats every experiment has, in the order of the first
+        if stats == None:
+            shared = set.intersection(*[set(experiment.get_stats()) for experiment in experiments])
+            first = experiments[0]
+            stats = [stat for stat in list(first.data.index) + first.known_stats if stat in shared]
+            stats = list(dict.fromkeys(stats))
+            if any(set(experiment.get_stats()) != shared for experiment in experiments):
+                print("WARN: Stats differ across experiments, only comparing stats they all have")
+        if must_contain != None:
+            stats = [stat for stat in stats if must_contain in stat]
 
-            xminusmean = differences.loc[stat] - stat_averages[stat]
-            stat_variances = pd.concat([stat_variances, xminusmean], axis=1)
+        # The baseline config is needed to normalize even if not compared itself
+        selected = configs if configs == None or baseline_config == None else list(configs) + [baseline_config]
+        keys, values, weights = align_experiments(experiments, stats, selected, workloads)
+        if len(keys) == 0:
+            print("ERR: Experiments have no simpoints in common")
+            return None
 
-        stat_variances = stat_variances.pow(2).sum(axis=0)/stat_variances.count(axis=0)
-        stat_stddev = stat_variances.pow(0.5)
+        # Simpoints of each (config, workload) pair are summed with their weights, over their own pair only
+        pairs = pd.MultiIndex.from_arrays([keys.get_level_values("Configuration"), keys.get_level_values("Workload")]).unique()
+        codes = pairs.get_indexer(keys.droplevel("Cluster Id"))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if baseline_config != None:
+                if not baseline_config in pairs.get_level_values(0):
+                    print(f"ERR: baseline_config {baseline_config} not found in experiments")
+                    return None
+
+                means = pair_sums(values, codes, weights, len(pairs))
+                normalizer = pairs.get_indexer(pd.MultiIndex.from_arrays([[baseline_config] * len(pairs), pairs.get_level_values(1)]))
+                if (normalizer == -1).any():
+                    print(f"WARN: Some workloads have no {baseline_config} simpoints, they are not compared")
+                per_simpoint = means[:, :, normalizer][:, :, codes]
+                values = values / per_simpoint if normalize == "ratio" else values - per_simpoint
+
+                # Drop the baseline config itself and workloads it can't normalize
+                keep = (keys.get_level_values("Configuration") != baseline_config) & (normalizer[codes] != -1)
+                if configs != None:
+                    keep &= keys.get_level_values("Configuration").isin(configs)
+                keys, values, weights, codes = keys[keep], values[:, :, keep], weights[keep], codes[keep]
+
+            differences = values - values[baseline]
+
+            if aggregation_level == "Simpoint":
+                rows = keys
+                base = values[baseline]
+                new = values
+                deviation = np.zeros(differences.shape)
+            else:
+                # Pairs with weighted simpoints left, and the simpoints of those pairs
+                used = np.zeros(len(pairs), dtype=bool)
+                used[codes[weights != 0]] = True
+                rows = pairs[used]
+                selected = used[codes]
+                codes = (np.cumsum(used) - 1)[codes[selected]]
+                weights, values, differences = weights[selected], values[:, :, selected], differences[:, :, selected]
+                weight_sums = pair_sums(np.ones(len(codes)), codes, weights, len(rows))
+
+                new = pair_sums(values, codes, weights, len(rows))
+                base = new[baseline]
+                mean_difference = pair_sums(differences, codes, weights, len(rows)) / weight_sums
+                spread = (differences - mean_difference[:, :, codes]) ** 2
+                deviation = np.sqrt(pair_sums(spread, codes, weights, len(rows)) / weight_sums)
+
+            tables = []
+            for i, experiment in enumerate(experiments):
+                if i == baseline:
+                    continue
 
-        stat_stddev.to_csv("dev_dbg.csv")
-        stat_averages.to_csv("avg_dbg.csv")
+                # Rows are stat major, matching the (stats, rows) arrays
+                columns = {"Experiment": np.full(len(stats) * len(rows), i)}
+                for level in rows.names:
+                    columns[level] = np.tile(rows.get_level_values(level), len(stats))
+                columns.update({"stats": np.repeat(stats, len(rows)),
+                                "baseline": base.ravel(),
+                                "value": new[i].ravel(),
+                                "difference": new[i].ravel() - base.ravel(),
+                                "ratio": new[i].ravel() / base.ravel(),
+                                "relative": (new[i].ravel() - base.ravel()) / np.abs(base.ravel()),
+                                "std": deviation[i].ravel()})
+                tables.append(pd.DataFrame(columns))
+
+        table = pd.concat(tables, ignore_index=True)
+        table = table.iloc[np.argsort(-table[rank_by].abs().fillna(-1).to_numpy(), kind="stable")].reset_index(drop=True)
+        return table
 
-        # TODO: Make them have the same stats
+    # Find diff of all numerical stats to investigate when performance differs
+    def diff_stats_all (self, experiment_baseline: Experiment, experiment_new: Experiment, diff_thresh: float = 50,
+                    must_contain: str = None):
+        '''Stats whose difference reaches diff_thresh in any simpoint, with the mean, standard deviation and
+        largest absolute difference over all simpoints. Ranked by absolute mean difference'''
+        table = self.compare_experiments([experiment_baseline, experiment_new], must_contain=must_contain, aggregation_level="Simpoint")
+        if table is None:
+            return None
 
-        print(stat_averages, stat_stddev, list(stat_stddev.index))
-        print(stat_averages[pd.Series(stat_averages.index) in stat_stddev.index])
+        table["abs difference"] = table["difference"].abs()
+        summary = table.groupby("stats", sort=False).agg(mean=("difference", "mean"), std=("difference", "std"),
+                                                         max_abs=("abs difference", "max"), simpoints=("difference", "count"))
+        # Population standard deviation over simpoints
+        summary["std"] *= np.sqrt((summary["simpoints"] - 1) / summary["simpoints"])
 
-        #print("Averages: \n", averages)
-        #print("Variance: \n", variance)
-        #print(differences)
+        summary = summary[summary["max_abs"] >= diff_thresh]
+        return summary.iloc[np.argsort(-summary["mean"].abs().to_numpy(), kind="stable")]
 
     def diff_stats (self, experiment_baseline: Experiment, experiment_new: Experiment, workload: str, 
                     config: str, diff_thresh: float = 0.05, must_contain: str = None, baseline_config: str = None,
                     diff_type: str = "differential"):
-        # Check experiments are similar
-        configs1 = set(experiment_baseline.get_configurations())
-        workloads1 = set(experiment_baseline.get_workloads())
-        stats1 = set(experiment_baseline.get_stats())
-
-        configs2 = set(experiment_new.get_configurations())
-        workloads2 = set(experiment_new.get_workloads())
-        stats2 = set(experiment_new.get_stats())
-
-        if not config in configs1 or not config in configs2:
-            print("ERR: Configs not the same")
-            return
-
-        if not workload in workloads1 or not workload in workloads2:
-            print("ERR: Workloads not the same")
-            return
-
-        if stats1 != stats2:
-            print("ERR: Stats not the same")
-            return
-
-        baseline_raw_data = experiment_baseline.return_raw_data(keep_weight=True).set_index("stats").astype("float")
-        new_raw_data = experiment_new.return_raw_data(keep_weight=True).set_index("stats").astype("float")
-
-        to_drop_for_data = []
-        for col in baseline_raw_data.columns:
-            if f"{config} {workload}" not in col:
-                to_drop_for_data.append(col)
-
-        baseline_data = baseline_raw_data.drop(columns=to_drop_for_data)
-        new_data = new_raw_data.drop(columns=to_drop_for_data)
-        
-        def weighted_avg(df: pd.DataFrame):
-            df = df*df.loc["Weight"]
-            df = df.sum(axis=1)
-            df = df.drop("Weight")
-            return df
-        
-        baseline_data = weighted_avg(baseline_data)
-        new_data = weighted_avg(new_data)
-
-        if baseline_config != None:
-            to_drop_for_baseline_config = []
-            for col in baseline_raw_data.columns:
-                if f"{baseline_config} {workload}" not in col:
-                    to_drop_for_baseline_config.append(col)
+        '''Weighted stats of one workload and config that differ by more than diff_thresh, largest first.
+        Speedups are positive if new is larger, negative if baseline is larger'''
+        for experiment in [experiment_baseline, experiment_new]:
+            if not config in experiment.get_configurations():
+                print("ERR: Configs not the same")
+                return None
+
+            if not workload in experiment.get_workloads():
+                print("ERR: Workloads not the same")
+                return None
+
+        if not diff_type in ["differential", "difference"]:
+            print("diff_type must be differential or difference")
+            return None
 
-            baseline_data_baseline_config = baseline_raw_data.drop(columns=to_drop_for_baseline_config)
-            new_data_baseline_config = new_raw_data.drop(columns=to_drop_for_baseline_config)
-        
-            baseline_data_baseline_config = weighted_avg(baseline_data_baseline_config)
-            new_data_baseline_config = weighted_avg(new_data_baseline_config)
-
-            if diff_type == "differential":
-                baseline_data /= baseline_data_baseline_config
-                new_data /= new_data_baseline_config
-            elif diff_type == "difference":
-                baseline_data -= baseline_data_baseline_config
-                new_data -= new_data_baseline_config
-            else:
-                print("diff_type must be differential or difference")
-                return
+        table = self.compare_experiments([experiment_baseline, experiment_new], configs=[config], workloads=[workload],
+                                         must_contain=must_contain, baseline_config=baseline_config,
+                                         normalize="ratio" if diff_type == "differential" else "difference")
+        if table is None:
+            return None
 
         if diff_type == "differential":
-            speedups = new_data/baseline_data
-            speedups = speedups[speedups != math.inf]
-            speedups = speedups.apply(lambda x: -1/x if x<1 and x != 0 else x)
-        elif diff_type == "difference":
-            speedups = new_data-baseline_data
-
-        speedups = speedups.drop_duplicates()
-
-        if must_contain != None:
-            for col in speedups.index:
-                if must_contain not in col and col in speedups.index:
-                    speedups = speedups.drop(col)
-
-        diff_vector = speedups.abs() > diff_thresh
-
-        print("NOTE: Speedups are positive if new is faster, negative if baseline is faster")
+            ratio = table["ratio"].to_numpy()
+            with np.errstate(divide="ignore"):
+                table["speedup"] = np.where((ratio < 1) & (ratio != 0), -1/ratio, ratio)
+            table = table[np.isfinite(table["speedup"])]
+        else:
+            table["speedup"] = table["difference"]
 
-        print()
-        
-        # TODO: SHow absolute numbers, figure out how to display well
-        print("Differences sorted:", speedups[diff_vector].sort_values())
-        print("\n30 biggest absolute differences (- if baseline is greater):\n", "\n".join([f"{i}: {speedups[diff_vector][i]}" for i in speedups[diff_vector].abs().sort_values().index[:-31:-1]]), sep='')
-        #print(sorted(speedups[diff_vector], key=lambda x:abs(x), reverse=True))
+        table = table[table["speedup"].abs() > diff_thresh]
+        table = table.iloc[np.argsort(-table["speedup"].abs().to_numpy(), kind="stable")]
+        return table.set_index("stats")[["baseline", "value", "speedup", "std"]]
 
 # TODO: Make accessible
 
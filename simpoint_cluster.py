@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bbv_format import load_bbv
+
+# Clusters basic block vectors the way SimPoint 3.2 does for run_clustering.sh, on every core:
+# vectors are normalized (-fixedLength off), randomly projected, clustered with weighted k-means
+# from several random seeds per K, and K is chosen by BIC. Every (K, seed) run is its own task in a
+# process pool, projections are cached between runs and simp.opt.stats has the timing of every run.
+# Writes the same files as simpoint:
+#   opt.p: <segment> <cluster>           opt.w: <weight> <cluster>
+#   opt.l: <cluster> <distance> per segment   vector.w: <weight> <segment>
+#   opt.p.lpt<coverage> / opt.w.lpt<coverage>: largest clusters covering coverage of the weight
+
+# entries projected at a time, bounds the temporaries of project
+project_chunk_entries = 1 << 22
+
+def load_fingerprints(fp_file):
+    # (offsets, ids, counts) of every segment, from a binary bbv file or SimPoint text fingerprints
+    if fp_file.endswith(".bin"):
+        return load_bbv(fp_file)
+
+    offsets = [0]
+    ids = []
+    counts = []
+    with open(fp_file, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            tokens = line[line.find(":"):].replace(":", " ").split()
+            ids += tokens[0::2]
+            counts += tokens[1::2]
+            offsets.append(offsets[-1] + len(tokens) // 2)
+    return np.array(offsets, dtype=np.uint64), np.array(ids, dtype=np.uint64), np.array(counts, dtype=np.uint64)
+
+def project(offsets, ids, counts, dim, seed):
+    # normalizes every vector to sum 1 and projects it to dim dimensions with a uniform [-1, 1] matrix.
+    # Returns the projected vectors and the weight of each vector (its share of all counts)
+    offsets = offsets.astype(np.int64)
+    lengths = np.diff(offsets)
+    totals = np.add.reduceat(counts.astype(np.float64), offsets[:-1]) if len(counts) else np.zeros(len(lengths))
+    totals[lengths == 0] = 0
+
+    # a matrix row per distinct id, not per id value: wide or address valued ids (see bbv_format.py)
+    # would need a row for every value up to the largest. Dense ids 0..n-1 keep their own row
+    unique_ids, id_rows = np.unique(ids, return_inverse=True)
+    rng = np.random.RandomState(seed)
+    matrix = rng.uniform(-1, 1, size=(max(len(unique_ids), 1), dim))
+
+    # one column of the matrix at a time, summed per segment with bincount
+    matrix = np.ascontiguousarray(matrix.T)
+    projected = np.zeros((len(lengths), dim))
+    start = 0
+    while start < len(lengths):
+        end = int(np.searchsorted(offsets, offsets[start] + project_chunk_entries, side="right")) - 1
+        end = min(max(end, start + 1), len(lengths))
+        first, last = offsets[start], offsets[end]
+        rows = np.repeat(np.arange(end - start), lengths[start:end])
+        values = counts[first:last].astype(np.float64) / totals[start + rows]
+        columns = id_rows[first:last]
+        for d in range(dim):
+            projected[start:end, d] = np.bincount(rows, weights=values * matrix[d][columns], minlength=end - start)
+        start = end
+
+    weights = totals / totals.sum()
+    return projected, weights
+
+def assign(data, centers):
+    # closest center of every point, and the squared distance to it
+    distances = (data ** 2).sum(axis=1)[:, None] - 2 * data @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    labels = distances.argmin(axis=1)
+    return labels, np.maximum(distances[np.arange(len(data)), labels], 0)
+
+def kmeans(data, weights, k, seed, max_iterations):
+    # weighted Lloyd's k-means from k distinct randomly sampled points. Empty clusters keep their center.
+    # Returns labels, centers, squared distances, the iterations run and whether the labels converged
+    rng = np.random.RandomState(seed)
+    centers = data[rng.choice(len(data), k, replace=False)]
+    labels = None
+    converged = False
+
+    for iteration in range(1, max_iterations + 1):
+        new_labels, distances = assign(data, centers)
+        if labels is not None and (new_labels == labels).all():
+            converged = True
+            break
+        labels = new_labels
+
+        sums = np.column_stack([np.bincount(labels, weights=weights * data[:, d], minlength=k) for d in range(data.shape[1])])
+        cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+        filled = cluster_weights > 0
+        centers[filled] = sums[filled] / cluster_weights[filled, None]
+
+    return new_labels, centers, distances, iteration, converged
+
+def bic(data, weights, labels, distances, k):
+    # X-means BIC (Pelleg and Moore) with spherical gaussians, each point counted by its weight
+    n, dim = data.shape
+    points = weights * n
+    cluster_points = np.bincount(labels, weights=points, minlength=k)
+    if n <= k:
+        return -math.inf
+
+    # clusters that fit their points exactly would make the likelihood infinite
+    variance = max((points * distances).sum() / (dim * (n - k)), 1e-12)
+
+    used = cluster_points[cluster_points > 0]
+    log_likelihood = (used * np.log(used)).sum() - n * math.log(n) \
+                     - n * dim / 2 * math.log(2 * math.pi * variance) - dim * (n - k) / 2
+    parameters = (k - 1) + k * dim + 1
+    return log_likelihood - parameters / 2 * math.log(n)
+
+def run_seed(k, seed):
+    # k-means seed of a K, numbered from 0. Every (K, seed) pair gets its own random stream
+    return base_seed + 1000003 * k + seed
+
+# shared by pool workers, set once per worker by init_worker
+worker_data = None
+worker_weights = None
+base_seed = 0
+
+def init_worker(data, weights, seed):
+    global worker_data, worker_weights, base_seed
+    worker_data = data
+    worker_weights = weights
+    base_seed = seed
+
+def cluster_run(k, seed, max_iterations):
+    # one k-means run of the (K, seed) grid, run in the pool. Only the score is sent back, the labels
+    # of the chosen run are recomputed from its seed
+    start = time.perf_counter()
+    labels, centers, distances, iterations, converged = kmeans(worker_data, worker_weights, k, run_seed(k, seed), max_iterations)
+    score = bic(worker_data, worker_weights, labels, distances, k)
+    return k, seed, score, iterations, converged, float((worker_weights * distances).sum()), time.perf_counter() - start
+
+class KSearch:
+    # evaluates K values in parallel, every (K, seed) run as its own task so a few large K
+    # don't leave cores idle. Keeps the best seed of every K and the stats of every run
+    def __init__(self, executor, seeds, max_iterations):
+        self.executor = executor
+        self.seeds = seeds
+        self.max_iterations = max_iterations
+        # K -> (bic, seed, iterations) of its best run
+        self.results = {}
+        # (k, seed, bic, iterations, converged, distortion, seconds) of every run
+        self.runs = []
+
+    def evaluate(self, ks):
+        ks = [k for k in ks if k not in self.results]
+        futures = [self.executor.submit(cluster_run, k, seed, self.max_iterations) for k in ks for seed in range(self.seeds)]
+
+        by_k = {k: [] for k in ks}
+        for future in futures:
+            run = future.result()
+            self.runs.append(run)
+            by_k[run[0]].append(run)
+
+        for k, runs in by_k.items():
+            best = max(runs, key=lambda run: run[2])
+            self.results[k] = (best[2], best[1], best[3])
+            print("k {:4d}: bic {:.4f} (seed {}), {}/{} converged, {:.2f}s".format(
+                k, best[2], best[1], sum(run[4] for run in runs), len(runs), sum(run[6] for run in runs)), flush=True)
+
+    def threshold(self, bic_threshold):
+        scores = [result[0] for result in self.results.values()]
+        return min(scores) + bic_threshold * (max(scores) - min(scores))
+
+def search_max_k(search, max_k, bic_threshold, jobs):
+    # like simpoint -maxK: the smallest K whose BIC reaches bic_threshold of the range spanned by K = 1
+    # and max_k, found by a search that tries up to jobs K values per round instead of one
+    search.evaluate([1, max_k])
+    threshold = search.threshold(bic_threshold)
+    low, high = 1, max_k
+    if search.results[1][0] >= threshold:
+        return 1
+
+    while high - low > 1:
+        step = max(1, (high - low) // (jobs + 1))
+        ks = list(range(low + step, high, step))[:jobs]
+        search.evaluate(ks)
+        for k in ks:
+            if search.results[k][0] >= threshold:
+                high = k
+                break
+            low = k
+    return high
+
+def pick_k(search, ks, bic_threshold):
+    # like simpoint -k: the smallest evaluated K whose BIC reaches bic_threshold of the range of all of them
+    search.evaluate(ks)
+    threshold = search.threshold(bic_threshold)
+    return min([k for k in search.results if search.results[k][0] >= threshold], default=min(ks))
+
+def pick_best_k(search):
+    # the evaluated K with the highest BIC
+    return max(search.results, key=lambda k: search.results[k][0])
+
+def write_stats(stats_file, search, chosen_k, timings):
+    # timing and convergence of every (K, seed) run, one tab separated row each, after a summary
+    with open(stats_file, "w") as f:
+        for name, seconds in timings:
+            f.write("# {} {:.3f}s\n".format(name, seconds))
+        runs = search.runs
+        f.write("# {} runs over {} K values, {} converged, {:.3f}s of k-means\n".format(
+            len(runs), len(search.results), sum(run[4] for run in runs), sum(run[6] for run in runs)))
+        f.write("# chose k {} seed {}\n".format(chosen_k, search.results[chosen_k][1]))
+        f.write("k\tseed\tbic\titerations\tconverged\tdistortion\tseconds\n")
+        for k, seed, score, iterations, converged, distortion, seconds in sorted(runs):
+            f.write("{}\t{}\t{}\t{}\t{}\t{}\t{:.4f}\n".format(k, seed, score, iterations, int(converged), distortion, seconds))
+
+def cached_projection(fp_file, dim, seed, cache_dir):
+    # projected fingerprints and weights, reused while the fingerprint file keeps its size and mtime
+    st = os.stat(fp_file)
+    key = "{} {} {} {} {}".format(os.path.abspath(fp_file), st.st_size, st.st_mtime_ns, dim, seed)
+    entry = None
+    if cache_dir != None:
+        os.makedirs(cache_dir, exist_ok=True)
+        entry = os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+        if os.path.exists(entry):
+            try:
+                with np.load(entry, allow_pickle=False) as cached:
+                    if str(cached["key"]) == key:
+                        print("projection cached in {}".format(entry), flush=True)
+                        return cached["data"], cached["weights"], int(cached["entries"])
+            except (OSError, KeyError, ValueError):
+                print("WARN: Ignoring unreadable projection cache {}".format(entry))
+
+    offsets, ids, counts = load_fingerprints(fp_file)
+    data, weights = project(offsets, ids, counts, dim, seed)
+
+    if entry != None:
+        tmp = "{}.{}.tmp.npz".format(entry, os.getpid())
+        np.savez(tmp, key=np.array(key), data=data, weights=weights, entries=np.array(len(ids)))
+        os.replace(tmp, entry)
+    return data, weights, len(ids)
+
+def write_simpoints(out_dir, labels, distances, weights, coverage):
+    # the segment closest to the center of each non empty cluster represents it
+    clusters = np.unique(labels)
+    simpoints = []
+    for cluster in clusters:
+        members = np.flatnonzero(labels == cluster)
+        simpoints.append((int(members[np.argmin(distances[members])]), int(cluster), float(weights[members].sum())))
+
+    with open(out_dir + "/opt.p", "w") as p, open(out_dir + "/opt.w", "w") as w:
+        for segment, cluster, weight in simpoints:
+            p.write("{} {}\n".format(segment, cluster))
+            w.write("{} {}\n".format(weight, cluster))
+
+    with open(out_dir + "/opt.l", "w") as l:
+        l.writelines("{} {}\n".format(label, math.sqrt(distance)) for label, distance in zip(labels.tolist(), distances.tolist()))
+
+    with open(out_dir + "/vector.w", "w") as v:
+        v.writelines("{} {}\n".format(weight, segment) for segment, weight in enumerate(weights.tolist()))
+
+    # largest clusters until they cover coverage of the weight, weights rescaled to sum to 1
+    largest = sorted(simpoints, key=lambda simpoint: -simpoint[2])
+    covered = []
+    for simpoint in largest:
+        covered.append(simpoint)
+        if sum(weight for _, _, weight in covered) >= coverage:
+            break
+    total = sum(weight for _, _, weight in covered)
+
+    suffix = ".lpt{}".format(coverage)
+    with open(out_dir + "/opt.p" + suffix, "w") as p, open(out_dir + "/opt.w" + suffix, "w") as w:
+        for segment, cluster, weight in covered:
+            p.write("{} {}\n".format(segment, cluster))
+            w.write("{} {}\n".format(weight / total, cluster))
+
+    print("{} clusters, {} simpoints cover {:.4f} of the weight".format(len(simpoints), len(covered), total), flush=True)
+
+def parse_k_range(k_range):
+    # "1:30" or "5" to a list of K values
+    if ":" in k_range:
+        first, last = k_range.split(":")
+        return list(range(int(first), int(last) + 1))
+    return [int(k_range)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cluster basic block vectors into simpoints, writing the files simpoint would')
+    parser.add_argument('fp_file', help='Fingerprints, SimPoint text or binary (.bin, see bbv_format.py)')
+    parser.add_argument('out_dir', help='Directory to write opt.p, opt.w, opt.l, vector.w and the coverage files to')
+    parser.add_argument('--maxK', type=int, help='Search K in 1..maxK like simpoint -maxK. Default sqrt(segments)')
+    parser.add_argument('-k', '--k', help='Evaluate every K of a range like simpoint -k. Usage: -k 1:30')
+    parser.add_argument('--seeds', type=int, default=10, help='k-means runs per K, like simpoint -numInitSeeds')
+    parser.add_argument('--dim', type=int, default=15, help='Dimensions of the random projection')
+    parser.add_argument('--iters', type=int, default=100, help='Maximum k-means iterations')
+    parser.add_argument('--bic_threshold', type=float, default=0.9, help='Fraction of the BIC range the chosen K must reach')
+    parser.add_argument('--coverage', type=float, default=0.99, help='Weight covered by the .lpt files')
+    parser.add_argument('--seed', type=int, default=493575226, help='Seed of the projection and k-means')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Processes running the k-means runs of the (K, seed) grid')
+    parser.add_argument('--choose', choices=['threshold', 'best'], default='threshold', help='K with the BIC threshold like simpoint, or with the best BIC')
+    parser.add_argument('--cache_dir', default='~/.cache/simpoint_cluster', help='Where projected fingerprints are cached between runs. "none" disables the cache')
+    parser.add_argument('--stats_file', help='Timing and convergence of every run. Default simp.opt.stats in out_dir')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cache_dir = None if args.cache_dir == "none" else os.path.expanduser(args.cache_dir)
+    data, weights, entries = cached_projection(args.fp_file, args.dim, args.seed, cache_dir)
+    projected = time.perf_counter()
+    print("{} segments, {} entries, projected to {} dimensions ({:.2f}s)".format(len(data), entries, args.dim, projected - start), flush=True)
+    if len(data) == 0:
+        print("ERR: {} has no fingerprints".format(args.fp_file))
+        sys.exit(1)
+
+    # BIC needs more segments than clusters
+    max_k = max(1, min(args.maxK if args.maxK != None else int(math.sqrt(len(data)) + 0.5), len(data) - 1))
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(data, weights, args.seed)) as executor:
+        search = KSearch(executor, args.seeds, args.iters)
+        if args.k != None:
+            ks = [k for k in parse_k_range(args.k) if k < max(len(data), 2)]
+            if args.choose == "threshold":
+                k = pick_k(search, ks, args.bic_threshold)
+            else:
+                search.evaluate(ks)
+                k = pick_best_k(search)
+        else:
+            k = search_max_k(search, max_k, args.bic_threshold, args.jobs)
+            if args.choose == "best":
+                k = pick_best_k(search)
+    searched = time.perf_counter()
+
+    score, seed, iterations = search.results[k]
+    print("chose k {} with bic {:.4f} (seed {}) of {} evaluated K values".format(k, score, seed, len(search.results)), flush=True)
+
+    # the chosen run is deterministic given its seed
+    base_seed = args.seed
+    labels, centers, distances, iterations, converged = kmeans(data, weights, k, run_seed(k, seed), args.iters)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    write_simpoints(args.out_dir, labels, distances, weights, args.coverage)
+    timings = [("projection", projected - start), ("search", searched - projected), ("total", time.perf_counter() - start)]
+    write_stats(args.stats_file if args.stats_file != None else args.out_dir + "/simp.opt.stats", search, k, timings)
+    print("clustered in {:.2f}s".format(time.perf_counter() - start), flush=True)
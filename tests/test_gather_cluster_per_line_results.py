@@ -0,0 +1,37 @@
+import os
+import sys
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+
+import gather_cluster_per_line_results as per_line
+
+def write_lines(sim_dir, rows):
+    os.makedirs(sim_dir)
+    with open(os.path.join(sim_dir, "per_line_icache_line_info.csv"), "w") as f:
+        f.write(",".join(["cl_addr"] + per_line.line_stats) + "\n")
+        for cl_addr in rows:
+            f.write(",".join([cl_addr] + ["1"] * len(per_line.line_stats)) + "\n")
+
+def test_addresses_are_written_back_unchanged(tmp_path):
+    # the first simpoint has only a header, the others mix decimal, padded and hex addresses
+    write_lines(str(tmp_path / "1"), [])
+    write_lines(str(tmp_path / "2"), ["10", "00ff", "0x1F"])
+    write_lines(str(tmp_path / "3"), ["0abc", "0x1f", "10"])
+    simpoints = [per_line.Simpoint(i, 0.5, str(tmp_path / str(i)), i) for i in [1, 2, 3]]
+
+    per_line.report(per_line.calculate_weighted_average(simpoints), str(tmp_path))
+
+    with open(tmp_path / "per_line_icache_line_info.csv") as f:
+        rows = [line.split(",") for line in f.read().splitlines()[1:]]
+    assert [row[0] for row in rows] == ["10", "00ff", "0x1F", "0abc"]
+    # 10 is decimal, not the hex 0x10, and 0x1f is the line 0x1F
+    assert [float(row[1]) for row in rows] == [1.0, 0.5, 1.0, 0.5]
+
+def test_declared_base(tmp_path):
+    write_lines(str(tmp_path / "1"), ["10", "0x10", "1f"])
+    simpoints = [per_line.Simpoint(1, 1.0, str(tmp_path / "1"), 1)]
+
+    cl_addrs, sums, _, names = per_line.calculate_weighted_average(simpoints, 16)
+    assert cl_addrs.tolist() == [16, 31]
+    assert names.tolist() == ["10", "1f"]
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo)
+sys.path.insert(0, os.path.join(repo, "scarab_stats"))
+
+import gather_cluster_results
+import result_cache
+import scarab_stats
+
+def write_simulation(sim_dir):
+    # every file a scarab simulation leaves in its directory, with the stats gather reads
+    os.makedirs(sim_dir)
+    with open(os.path.join(repo, "stat_groups.json")) as f:
+        spec = json.load(f)
+    out_files = {}
+    for group in spec["groups"]:
+        out_files.setdefault(group["file"], set()).update(name for name, _ in group["stats"])
+    for file, names in out_files.items():
+        with open(os.path.join(sim_dir, file), "w") as f:
+            for name in sorted(names):
+                f.write("{} 10 5.0% 10 5.0%\n".format(name))
+    for file in scarab_stats.stat_files:
+        with open(os.path.join(sim_dir, file), "w") as f:
+            f.write("Cumulative_Value,Stat\n1,x\n")
+    for file in ["ramulator.stat.out", "PARAMS.out", "sim.log", "PARAMS.in"]:
+        with open(os.path.join(sim_dir, file), "w") as f:
+            f.write(file + "\n")
+
+def test_fetched_simulation_is_complete_and_gathers(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCARAB_RESULT_CACHE", str(tmp_path / "cache"))
+    write_simulation(str(tmp_path / "old" / "7"))
+    result_cache.store("ab" * 32, str(tmp_path / "old" / "7"))
+
+    sim_root = tmp_path / "new"
+    assert result_cache.fetch("ab" * 32, str(sim_root / "7"))
+    fetched = set(os.listdir(sim_root / "7"))
+    assert "sim.log" not in fetched and "PARAMS.in" not in fetched
+    assert scarab_stats.stat_aggregator(use_cache=False).simpoint_complete(str(sim_root / "7") + "/")
+
+    sp_dir = tmp_path / "simpoints"
+    sp_dir.mkdir()
+    (sp_dir / "opt.p.lpt0.99").write_text("7 0\n")
+    (sp_dir / "opt.w.2.lpt0.99").write_text("1 0\n")
+    gather_cluster_results.gather(str(sp_dir), str(sim_root), False)
+    assert (sim_root / "ipc.csv").exists()
+
+def test_rerun_does_not_write_into_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCARAB_RESULT_CACHE", str(tmp_path / "cache"))
+    write_simulation(str(tmp_path / "old" / "7"))
+    result_cache.store("cd" * 32, str(tmp_path / "old" / "7"))
+    # the old simulation directory writes again after store
+    (tmp_path / "old" / "7" / "memory.stat.0.out").write_text("rewritten\n")
+
+    assert result_cache.fetch("cd" * 32, str(tmp_path / "new" / "7"))
+    # what the mode 4 jobs run before scarab on a miss
+    result_cache.unlink(str(tmp_path / "new" / "7"))
+    (tmp_path / "new" / "7" / "memory.stat.0.out").write_text("rerun\n")
+
+    entry = result_cache.entry_dir("cd" * 32)
+    with open(os.path.join(entry, "memory.stat.0.out")) as f:
+        cached = f.read()
+    assert "rewritten" not in cached and "rerun" not in cached
+
+def test_unlink_keeps_other_links(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCARAB_RESULT_CACHE", str(tmp_path / "cache"))
+    write_simulation(str(tmp_path / "old" / "7"))
+    result_cache.store("ef" * 32, str(tmp_path / "old" / "7"))
+    assert result_cache.fetch("ef" * 32, str(tmp_path / "new" / "7"))
+    # a link the user made next to the fetched files
+    (tmp_path / "trace.bin").write_text("trace\n")
+    os.link(str(tmp_path / "trace.bin"), str(tmp_path / "new" / "7" / "trace.bin"))
+
+    result_cache.unlink(str(tmp_path / "new" / "7"))
+    assert sorted(os.listdir(tmp_path / "new" / "7")) == ["trace.bin"]
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(repo, "scarab_stats"))
+
+import scarab_stats
+
+def make_experiment(c2_value):
+    # c1/w1 has two clean simpoints, c2/w1 one simpoint holding c2_value
+    experiment = scarab_stats.Experiment(["A"])
+    experiment.add_simpoint([1.0], "exp", "arch", "c1", "w1", 0, 0, 0.5)
+    experiment.add_simpoint([3.0], "exp", "arch", "c1", "w1", 1, 1, 0.5)
+    experiment.add_simpoint([c2_value], "exp", "arch", "c2", "w1", 0, 0, 1.0)
+    return experiment
+
+def test_nan_simpoint_stays_in_its_pair():
+    aggregated = make_experiment(np.nan).aggregate_workloads(["c1", "c2"], ["A"], ["w1"])
+    assert aggregated.loc["A", ("c1", "w1")] == 2.0
+    assert np.isnan(aggregated.loc["A", ("c2", "w1")])
+
+def test_compare_keeps_nan_in_its_pair():
+    table = scarab_stats.stat_aggregator(use_cache=False).compare_experiments(
+        [make_experiment(5.0), make_experiment(np.nan)], stats=["A"])
+    clean = table[table["Configuration"] == "c1"].iloc[0]
+    assert (clean["baseline"], clean["value"], clean["std"]) == (2.0, 2.0, 0.0)
+    assert np.isnan(table[table["Configuration"] == "c2"].iloc[0]["value"])
+
+def test_stat_cache_size_after_rewrites(tmp_path):
+    (tmp_path / "sim").mkdir()
+    (tmp_path / "sim" / "memory.stat.0.csv").write_text("1\n")
+    cache = scarab_stats.StatCache(str(tmp_path / "cache"))
+    cache.put(str(tmp_path / "sim"), ["memory.stat.0.csv"], pd.Series([1.0], index=["A"]))
+    for _ in range(3):
+        cache.put(str(tmp_path / "sim"), ["memory.stat.0.csv"], pd.Series([2.0, 3.0], index=["A", "B"]))
+    assert cache.total_bytes == cache.size()
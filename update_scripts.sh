@@ -10,7 +10,14 @@ docker cp ./run_scarab_mode_4_allbench.sh $CONTAINERID:/usr/local/bin
 docker cp ./run_simpoint_trace.sh $CONTAINERID:/usr/local/bin
 docker cp ./run_trace_post_processing.sh $CONTAINERID:/usr/local/bin
 docker cp ./gather_cluster_results.py $CONTAINERID:/usr/local/bin
+docker cp ./stat_groups.json $CONTAINERID:/usr/local/bin
 docker cp ./gather_fp_pieces.py $CONTAINERID:/usr/local/bin
+docker cp ./bbv_format.py $CONTAINERID:/usr/local/bin
+docker cp ./simpoint_cluster.py $CONTAINERID:/usr/local/bin
+docker cp ./job_scheduler.py $CONTAINERID:/usr/local/bin
+docker cp ./runtime_history.py $CONTAINERID:/usr/local/bin
+docker cp ./experiment_manifest.py $CONTAINERID:/usr/local/bin
+docker cp ./result_cache.py $CONTAINERID:/usr/local/bin
 docker cp ./common/common_entrypoint.sh $CONTAINERID:/usr/local/bin
 docker cp ./run_exp_using_descriptor.py $CONTAINERID:/usr/local/bin
 docker cp ./gather_cluster_results_using_descriptor.py $CONTAINERID:/usr/local/bin
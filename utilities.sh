@@ -36,20 +36,17 @@ report_time () {
   echo "$procedure Runtime: $hours:$minutes:$seconds (hh:mm:ss)"
 }
 
-wait_for_non_child () {
-  # ref: https://askubuntu.com/questions/674333/how-to-pass-an-array-as-function-argument
-  # 1: procedure name
-  # 2: task list
+wait_for_group () {
+  # 1: procedure name, the orchestrator.py group its processes were launched in
+  # returns the status of orchestrator.py wait, 1 if any process of the group failed
   local procedure="$1"
-  shift
-  local taskPids=("$@")
-  echo "${taskPids[@]}"
   echo "wait for all $procedure to finish..."
-  # ref: https://stackoverflow.com/a/29535256
-  for taskPid in ${taskPids[@]}; do
-    echo "wait for $taskPid $procedure process"
-    while [ -d "/proc/$taskPid" ]; do
-      sleep 10 & wait $!
-    done
-  done
-}
\ No newline at end of file
+  python3 orchestrator.py wait "$procedure"
+  local status=$?
+  if [ $status -eq 0 ]; then
+    echo "$procedure success"
+  else
+    echo "$procedure fail"
+  fi
+  return $status
+}